@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+"""Benchmark the batch API against one call per statement.
+
+Compares parse/split/format with parse_many/split_many/format_many on
+short statements (as found in query logs).
+
+Usage: python extras/benchmarks/bench_batch.py [number]
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+import sqlparse
+
+QUERIES = [
+    u'SELECT "auth_user"."id" FROM "auth_user" WHERE "auth_user"."id" = %s',
+    u'UPDATE "app_item" SET "count" = %s WHERE "app_item"."id" = %s',
+    u'SELECT 1',
+    u'COMMIT',
+]
+
+
+def main(number=2000):
+    queries = QUERIES * number
+    format_options = {'keyword_case': 'upper', 'strip_comments': True}
+    cases = [
+        ('parse', lambda: [sqlparse.parse(q) for q in queries],
+         lambda: list(sqlparse.parse_many(queries))),
+        ('split', lambda: [sqlparse.split(q) for q in queries],
+         lambda: list(sqlparse.split_many(queries))),
+        ('format', lambda: [sqlparse.format(q, **format_options)
+                            for q in queries],
+         lambda: list(sqlparse.format_many(queries, **format_options))),
+    ]
+    for name, single, batch in cases:
+        results = []
+        for func in (single, batch):
+            best = min(timeit.repeat(func, number=1, repeat=3))
+            results.append(best / len(queries) * 1e6)
+        print '%-7s %6.1f us/query  %s_many %6.1f us/query' % (
+            name, results[0], name, results[1])
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+"""Benchmark reading the rows of a data dump.
+
+Compares lexing a generated dump with reading its rows with
+sqlparse.extract.insert_rows() and with parsing it with
+sqlparse.parse() and walking the tree. The dump has INSERT statements
+with many rows like the ones written by mysqldump.
+
+Usage: python extras/benchmarks/bench_extract.py [statements] [rows]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+import sqlparse
+from sqlparse import extract
+from sqlparse import lexer
+from sqlparse import sql
+
+
+def make_dump(statements, rows):
+    return u''.join(
+        u'INSERT INTO `users` VALUES %s;\n' % u','.join(
+            u"(%d,'user %d','u%d@example.com',NULL,1.5,'2015-01-01')"
+            % (i, i, i) for i in range(rows))
+        for _ in range(statements))
+
+
+def lex(dump):
+    return sum(1 for _ in lexer.tokenize(dump))
+
+
+def extract_rows(dump):
+    return sum(1 for _ in extract.insert_rows(dump, dialect='mysql'))
+
+
+def parse_rows(dump):
+    count = 0
+    for statement in sqlparse.parse(dump):
+        for token in statement.tokens:
+            if isinstance(token, sql.Parenthesis):
+                count += 1
+    return count
+
+
+def main(statements=10, rows=2000):
+    dump = make_dump(statements, rows)
+    print '%d kB, %d rows' % (len(dump) // 1024, statements * rows)
+    for name, func in (('lex', lex), ('insert_rows', extract_rows),
+                       ('parse', parse_rows)):
+        start = time.time()
+        func(dump)
+        elapsed = time.time() - start
+        print '%-12s %7.2f s %8.1f kB/s' % (name, elapsed,
+                                            len(dump) / 1024.0 / elapsed)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
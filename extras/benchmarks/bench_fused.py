@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+"""Benchmark the fused grouping engine against the sequential one.
+
+Groups the same statements with grouping.group(), which applies the
+grouping functions one after another, and with grouping.group(...,
+fused=True) (what FilterStack(fused_grouping=True) uses), which applies
+them in a single traversal of each statement. For comparison the last
+column is grouping.group_flat(), the default of FilterStack, which skips
+the functions that have nothing to group. The statements are lexed and
+split before the timer starts.
+
+Usage: python extras/benchmarks/bench_fused.py [repeat]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from sqlparse import lexer
+from sqlparse.engine import FilterStack, grouping
+from sqlparse.engine.filter import StatementFilter
+
+FILES_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'tests',
+                         'files')
+
+WORKLOADS = (
+    ('oltp', lambda: [
+        sql % i for i in range(300) for sql in (
+            u"INSERT INTO public.users (id, name, email) VALUES "
+            u"(%d, 'user', 'u@example.com');",
+            u"SELECT u.id, count(o.id) AS orders FROM users u LEFT JOIN "
+            u"orders o ON o.user_id = u.id WHERE u.id > %d GROUP BY u.id;",
+            u"UPDATE accounts SET balance = balance - 10 WHERE id = %d;")]),
+    ('test files', lambda: [
+        open(os.path.join(FILES_DIR, name), 'rb').read().decode(
+            'utf-8', 'replace') for name in sorted(os.listdir(FILES_DIR))]),
+    ('wide select', lambda: [
+        u'SELECT %s FROM t WHERE %s' % (
+            u', '.join(u'f(a%d)::int AS b%d' % (i, i) for i in range(2000)),
+            u' AND '.join(u'c%d = %d' % (i, i) for i in range(2000)))]),
+    ('nested', lambda: [reduce(
+        lambda sql, i: (u'SELECT a, b FROM (%s) AS t%d WHERE a > %d '
+                        u'AND b IN (1, 2)' % (sql, i, i)),
+        range(100), u'SELECT a FROM t')]),
+)
+
+
+def group_time(sqls, engine):
+    statements = []
+    for sql in sqls:
+        statements.extend(StatementFilter().process(None,
+                                                    lexer.tokenize(sql)))
+    funcs = FilterStack.default_grouping_funcs
+    start = time.time()
+    for statement in statements:
+        if engine == 'flat':
+            grouping.group_flat(statement, funcs)
+        else:
+            grouping.group(statement, funcs, fused=engine == 'fused')
+    return time.time() - start
+
+
+def main(repeat=3):
+    print '%-12s %10s %10s %8s %10s' % ('workload', 'sequential', 'fused',
+                                        'speedup', 'flat')
+    for name, make_sqls in WORKLOADS:
+        sqls = make_sqls()
+        sequential = min(group_time(sqls, 'sequential')
+                         for _ in range(repeat))
+        fused = min(group_time(sqls, 'fused') for _ in range(repeat))
+        flat = min(group_time(sqls, 'flat') for _ in range(repeat))
+        print '%-12s %8.3f s %8.3f s %7.2fx %8.3f s' % (
+            name, sequential, fused, sequential / fused, flat)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+"""Benchmark how grouping scales with the length of a statement.
+
+Groups statements with long lists (IN lists, multi-row VALUES, select
+lists and WHERE clauses) of increasing length. The statements are lexed
+and split before the timer starts. If grouping is linear the time per
+item stays the same, the last column is the time per item relative to
+the shortest list (marked if it's more than 1.5 times as long).
+
+Usage: python extras/benchmarks/bench_grouping.py [items] [steps]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from sqlparse import lexer
+from sqlparse.engine import FilterStack
+from sqlparse.engine.filter import StatementFilter
+
+STATEMENTS = (
+    ('in list', lambda n: u'SELECT * FROM t WHERE id IN (%s)' % u', '.join(
+        u'%d' % i for i in range(n))),
+    ('values', lambda n: u'INSERT INTO t (a, b, c) VALUES %s' % u', '.join(
+        u"(%d, 'x', NULL)" % i for i in range(n))),
+    ('select list', lambda n: u'SELECT %s FROM t' % u', '.join(
+        u'a%d AS b%d' % (i, i) for i in range(n))),
+    ('where', lambda n: u'SELECT * FROM t WHERE %s' % u' AND '.join(
+        u'c%d = %d' % (i, i) for i in range(n))),
+)
+
+
+def group_time(sql):
+    stack = FilterStack()
+    stack.enable_grouping()
+    statement, = StatementFilter().process(None, lexer.tokenize(sql))
+    start = time.time()
+    stack.run(statement)
+    return time.time() - start
+
+
+def main(items=1000, steps=4):
+    for name, make_sql in STATEMENTS:
+        base = None
+        for step in range(steps):
+            n = items * 2 ** step
+            elapsed = min(group_time(make_sql(n)) for _ in range(3))
+            per_item = elapsed / n
+            if base is None:
+                base = per_item
+            print '%-12s %7d items %8.3f s %8.2f us/item %6.2fx%s' % (
+                name, n, elapsed, per_item * 1e6, per_item / base,
+                ' (superlinear)' if per_item > 1.5 * base else '')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+"""Benchmark the cold start of sqlparse.
+
+Each measurement runs in a fresh interpreter: the time for
+"import sqlparse" and for the first call of parse() (which processes
+the lexer rules), with and without the table cache.
+
+Usage: python extras/benchmarks/bench_import.py [runs]
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+SCRIPT = '''
+import sys, time
+sys.path.insert(0, %r)
+start = time.time()
+import sqlparse
+imported = time.time()
+sqlparse.parse('SELECT a, b FROM t WHERE c = 1')
+print (imported - start) * 1e3, (time.time() - imported) * 1e3
+''' % ROOT
+
+
+def measure(runs, env):
+    results = []
+    for _ in range(runs):
+        output = subprocess.check_output([sys.executable, '-c', SCRIPT],
+                                         env=env)
+        results.append([float(value) for value in output.split()])
+    results.sort(key=sum)
+    return results[len(results) // 2]
+
+
+def main(runs=15):
+    cache_dir = tempfile.mkdtemp()
+    try:
+        env = dict(os.environ)
+        env.pop('SQLPARSE_CACHE_DIR', None)
+        print '%-12s %8s %12s' % ('', 'import', 'first parse')
+        print '%-12s %6.2f ms %9.2f ms' % (('no cache',) + tuple(
+            measure(runs, env)))
+        env['SQLPARSE_CACHE_DIR'] = cache_dir
+        measure(1, env)  # writes the cache
+        print '%-12s %6.2f ms %9.2f ms' % (('table cache',) + tuple(
+            measure(runs, env)))
+    finally:
+        shutil.rmtree(cache_dir)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+"""Benchmark the lexer on tests/files/huge_select.sql.
+
+Compares the first-character dispatch tables with trying every rule
+of a state at each position.
+
+Usage: python extras/benchmarks/bench_lexer.py [number]
+"""
+
+import codecs
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from sqlparse import lexer
+
+FILES_DIR = os.path.join(os.path.dirname(__file__), '..', '..',
+                         'tests', 'files')
+
+
+def main(number=20):
+    f = codecs.open(os.path.join(FILES_DIR, 'huge_select.sql'), 'r',
+                    'utf-8')
+    sql = f.read()
+    f.close()
+
+    def run():
+        return list(lexer.tokenize(sql))
+
+    lexer.Lexer()  # process the token definitions
+    dispatch = lexer.Lexer._dispatch
+    expected = run()
+    best = min(timeit.repeat(run, number=number, repeat=3))
+    lexer.Lexer._dispatch = dict((state, {}) for state in dispatch)
+    try:
+        assert run() == expected
+        best_full = min(timeit.repeat(run, number=number, repeat=3))
+    finally:
+        lexer.Lexer._dispatch = dispatch
+
+    print 'tokens per run:  %d' % len(expected)
+    print 'full rule scan:  %.2f ms/run' % (best_full / number * 1000)
+    print 'dispatch tables: %.2f ms/run' % (best / number * 1000)
+    print 'speedup:         %.1fx' % (best_full / best)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
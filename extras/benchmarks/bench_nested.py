@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+"""Benchmark parsing deeply nested subqueries.
+
+Every level of nesting adds a Parenthesis and an Identifier around the
+inner query, so building the value of each group at creation time costs
+O(n * depth). Each measurement runs in a fresh interpreter and reports
+the parse time and the growth of the maximum resident set size.
+
+Usage: python extras/benchmarks/bench_nested.py [max depth]
+"""
+
+import os
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+SCRIPT = '''
+import resource, sys, time
+sys.path.insert(0, %r)
+import sqlparse
+depth = int(sys.argv[1])
+sql = u'SELECT a, b, c FROM t WHERE a = 1'
+for i in range(depth):
+    sql = (u'SELECT a, b, c FROM (%%s) AS t%%d WHERE a > %%d AND b IN (1, 2)'
+           %% (sql, i, i))
+sqlparse.parse(u'SELECT 1')
+before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+start = time.time()
+stmts = sqlparse.parse(sql)
+elapsed = time.time() - start
+after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print len(sql), elapsed * 1e3, (after - before) / 1024.0
+''' % ROOT
+
+
+def main(max_depth=160):
+    print '%6s %8s %10s %10s' % ('depth', 'chars', 'parse', 'memory')
+    depth = 10
+    while depth <= max_depth:
+        output = subprocess.check_output(
+            [sys.executable, '-c', SCRIPT, str(depth)])
+        chars, elapsed, memory = output.split()
+        print '%6d %8s %7.1f ms %7.1f MB' % (depth, chars, float(elapsed),
+                                             float(memory))
+        depth *= 2
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
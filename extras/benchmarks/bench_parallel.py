@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+"""Benchmark parsing a large SQL file with worker processes.
+
+Compares sqlparse.parsefile with sqlparse.parallel.parsestream for an
+increasing number of workers on a generated file with a mix of
+statements. The speedup is bounded by the number of CPUs.
+
+Usage: python extras/benchmarks/bench_parallel.py [statements]
+"""
+
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+import sqlparse
+from sqlparse import parallel
+
+STATEMENTS = (
+    u"INSERT INTO public.users (id, name, email) VALUES "
+    u"(%d, 'user', 'u@example.com');\n",
+    u"SELECT u.id, count(o.id) AS orders FROM users u LEFT JOIN orders o "
+    u"ON o.user_id = u.id WHERE u.id > %d GROUP BY u.id;\n",
+    u"UPDATE accounts SET balance = balance - 10 WHERE id = %d;\n",
+)
+
+
+def consume(statements):
+    count = 0
+    for _ in statements:
+        count += 1
+    return count
+
+
+def main(statements=30000):
+    fd, path = tempfile.mkstemp(suffix='.sql')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for i in range(statements):
+                f.write((STATEMENTS[i % len(STATEMENTS)] % i).encode('utf-8'))
+        start = time.time()
+        consume(sqlparse.parsefile(path))
+        serial = time.time() - start
+        print 'parsefile        %6.2f s' % serial
+        workers = 1
+        while workers <= max(2, multiprocessing.cpu_count()):
+            start = time.time()
+            consume(parallel.parsestream(path, workers=workers))
+            elapsed = time.time() - start
+            print 'workers=%-2d       %6.2f s  (%.2fx)' % (
+                workers, elapsed, serial / elapsed)
+            workers *= 2
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+"""Benchmark grouping short statements like in OLTP query logs.
+
+Groups each kind of statement with grouping.group(), which applies all
+grouping functions, and with grouping.group_flat(), which FilterStack
+uses to skip the functions that have nothing to group. The statements
+are lexed and split before the timer starts. The last line is the time
+to parse all of them with sqlparse.parse_many().
+
+Usage: python extras/benchmarks/bench_short.py [statements]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+import sqlparse
+from sqlparse import lexer
+from sqlparse.engine import FilterStack, grouping
+from sqlparse.engine.filter import StatementFilter
+
+STATEMENTS = (
+    u'BEGIN',
+    u'SELECT 1',
+    u'SET autocommit=1',
+    u'SELECT id, name, email FROM users WHERE id = 42',
+    u'UPDATE sessions SET seen = now() WHERE id = 42',
+    u'INSERT INTO events (id, kind) VALUES (42, 1)',
+    u'COMMIT',
+)
+
+
+def group_time(sql, n, group):
+    statements = []
+    for _ in range(n):
+        statements.extend(StatementFilter().process(None,
+                                                    lexer.tokenize(sql)))
+    funcs = FilterStack.default_grouping_funcs
+    start = time.time()
+    for statement in statements:
+        group(statement, funcs)
+    return time.time() - start
+
+
+def main(n=2000):
+    total = [0, 0]
+    for sql in STATEMENTS:
+        times = [min(group_time(sql, n, group) for _ in range(3))
+                 for group in (grouping.group, grouping.group_flat)]
+        total = [a + b for a, b in zip(total, times)]
+        print '%-48s %7.1f us %7.1f us  %5.2fx' % (
+            sql, times[0] / n * 1e6, times[1] / n * 1e6, times[0] / times[1])
+    print '%-48s %7.1f us %7.1f us  %5.2fx' % (
+        'all', total[0] / n * 1e6, total[1] / n * 1e6, total[0] / total[1])
+    start = time.time()
+    for _ in sqlparse.parse_many(STATEMENTS * n):
+        pass
+    print 'parse_many: %.1f us per statement' % (
+        (time.time() - start) / (n * len(STATEMENTS)) * 1e6)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+"""Benchmark splitting large SQL files.
+
+Compares splitting with the StatementFilter (lexing into tokens and
+building statements) with the StatementSplitter that sqlparse.split
+uses, on a generated migration and a file with PL/pgSQL functions.
+
+Usage: python extras/benchmarks/bench_split.py [statements]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from sqlparse import lexer
+from sqlparse.engine.filter import StatementFilter
+from sqlparse.engine.splitter import StatementSplitter
+
+FILES_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'tests',
+                         'files')
+
+
+def split_tokens(sql):
+    stream = StatementFilter().process(None, lexer.tokenize(sql))
+    return [unicode(stmt).strip() for stmt in stream]
+
+
+def main(statements=20000):
+    migration = u''.join(
+        u"INSERT INTO public.users (id, name, email, created) VALUES "
+        u"(%d, 'user %d', 'u%d@example.com', '2014-01-01 00:00:00');\n"
+        % (i, i, i) for i in range(statements))
+    with open(os.path.join(FILES_DIR, 'function_psql.sql')) as f:
+        functions = f.read().decode('utf-8') * (statements // 100)
+    for name, sql in (('migration', migration), ('functions', functions)):
+        timings = []
+        for func in (split_tokens, StatementSplitter().split):
+            start = time.time()
+            result = func(sql)
+            timings.append(time.time() - start)
+        print '%-10s %7d statements  tokens %6.2f s  splitter %6.2f s' \
+            '  (%.1fx)' % (name, len(result), timings[0], timings[1],
+                           timings[0] / timings[1])
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
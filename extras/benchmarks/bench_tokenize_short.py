@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+"""Benchmark the per-call overhead of tokenizing short queries.
+
+Compares lexing unicode strings in place with byte strings (decoded
+once) and file-like objects (read and decoded in chunks, the way all
+input was handled before).
+
+Usage: python extras/benchmarks/bench_tokenize_short.py [number]
+"""
+
+import os
+import sys
+import timeit
+from cStringIO import StringIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from sqlparse import lexer
+
+QUERIES = [
+    u'SELECT "auth_user"."id", "auth_user"."username" FROM "auth_user" '
+    u'WHERE "auth_user"."id" = %s',
+    u'UPDATE "app_item" SET "count" = %s WHERE "app_item"."id" = %s',
+    u'SELECT 1',
+    u'COMMIT',
+]
+
+
+def main(number=20000):
+    encoded = [q.encode('utf-8') for q in QUERIES]
+
+    def run_unicode():
+        for q in QUERIES:
+            list(lexer.tokenize(q))
+
+    def run_bytes():
+        for q in encoded:
+            list(lexer.tokenize(q))
+
+    def run_stream():
+        for q in encoded:
+            list(lexer.tokenize(StringIO(q)))
+
+    for name, func in (('file-like', run_stream), ('bytes', run_bytes),
+                       ('unicode', run_unicode)):
+        best = min(timeit.repeat(func, number=number, repeat=3))
+        print '%-10s %.1f us/query' % (
+            name, best / number / len(QUERIES) * 1e6)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+"""Benchmark parsing data dumps with compact VALUES rows.
+
+Parses an INSERT statement with many rows like the ones written by
+mysqldump, once with all rows grouped and once with compact_values=True,
+where the rows are kept as a sql.Values node. Each measurement runs in a
+fresh interpreter and reports the parse time, the time to turn the
+statement back into a string and the growth of the maximum resident set
+size.
+
+Usage: python extras/benchmarks/bench_values.py [rows]
+"""
+
+import os
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+SCRIPT = '''
+import resource, sys, time
+sys.path.insert(0, %r)
+import sqlparse
+rows = int(sys.argv[1])
+compact = sys.argv[2] == '1'
+sql = u'INSERT INTO `users` VALUES %%s;' %% u','.join(
+    u"(%%d,'user %%d','u%%d@example.com',NULL,1.5,'2015-01-01 00:00:00')"
+    %% (i, i, i) for i in range(rows))
+sqlparse.parse(u'SELECT 1')
+before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+start = time.time()
+stmt, = sqlparse.parse(sql, compact_values=compact)
+elapsed = time.time() - start
+start = time.time()
+assert unicode(stmt) == sql
+to_string = time.time() - start
+after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print elapsed * 1e3, to_string * 1e3, (after - before) / 1024.0
+''' % ROOT
+
+
+def main(rows=10000):
+    print '%-8s %10s %10s %10s' % ('', 'parse', 'str', 'memory')
+    for name, compact in (('grouped', '0'), ('compact', '1')):
+        output = subprocess.check_output(
+            [sys.executable, '-c', SCRIPT, str(rows), compact])
+        elapsed, to_string, memory = output.split()
+        print '%-8s %7.1f ms %7.1f ms %7.1f MB' % (
+            name, float(elapsed), float(to_string), float(memory))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
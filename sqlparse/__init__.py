@@ -9,30 +9,70 @@
 __version__ = '0.1.14'
 
 
-# Setup namespace
-from sqlparse import engine
-from sqlparse import filters
-from sqlparse import formatter
-from sqlparse import lexer
-from sqlparse import tokens as T
-from sqlparse.engine import grouping
-from sqlparse.parsers import SQLParser
+import sys
+import types
 
 # Deprecated in 0.1.5. Will be removed in 0.2.0
 from sqlparse.exceptions import SQLParseError
 
 
+# Setup namespace. The submodules are imported on first access to keep
+# "import sqlparse" cheap, see _LazyModule at the end of this module.
+_lazy_attributes = {
+    'engine': ('sqlparse.engine', None),
+    'extract': ('sqlparse.extract', None),
+    'filters': ('sqlparse.filters', None),
+    'formatter': ('sqlparse.formatter', None),
+    'functions': ('sqlparse.functions', None),
+    'keywords': ('sqlparse.keywords', None),
+    'lexer': ('sqlparse.lexer', None),
+    'parallel': ('sqlparse.parallel', None),
+    'parsers': ('sqlparse.parsers', None),
+    'pipeline': ('sqlparse.pipeline', None),
+    'sql': ('sqlparse.sql', None),
+    'tokens': ('sqlparse.tokens', None),
+    'utils': ('sqlparse.utils', None),
+    'T': ('sqlparse.tokens', None),
+    'grouping': ('sqlparse.engine.grouping', None),
+    'SQLParser': ('sqlparse.parsers', 'SQLParser'),
+    'StatementFilter': ('sqlparse.engine.filter', 'StatementFilter'),
+}
+
+
 def build_parsers():
+    from sqlparse.parsers import SQLParser
     parsers = dict()
     for cls in SQLParser.__subclasses__():
         parsers[cls.dialect] = cls()
     return parsers
 
 
-_parsers = build_parsers()
+# Filled by _get_parser() when a parser is needed for the first time.
+_parsers = {}
+
+
+def warmup(cache_dir=None):
+    """Prepares everything needed by the first call of :func:`parse`.
+
+    The submodules are imported, the rules of the lexer are processed
+    and the parsers are built. Otherwise that's done on first use.
+
+    :param cache_dir: Directory where the processed rule tables are
+    cached to speed up the start of other processes, see
+    :data:`sqlparse.lexer.cache_dir`. If it's not given, the current
+    setting is used (optional).
+    """
+    from sqlparse import lexer
+    if cache_dir is not None:
+        lexer.cache_dir = cache_dir
+    if '_tokens' in lexer.Lexer.__dict__:
+        lexer.Lexer.save_tables()
+    lexer.Lexer.prepare()
+    _get_parser(None)
 
 
-def parse(sql, encoding=None, dialect=None):
+def parse(sql, encoding=None, dialect=None, grouping=None, lazy=False,
+          max_tokens=None, timeout=None, cancel=None, compact_values=False):
     """Parse sql and return a list of statements.
 
     :param sql: A string containting one or more SQL statements.
@@ -40,27 +80,128 @@ def parse(sql, encoding=None, dialect=None):
     :param dialect: The sql engine dialect of the input sql statements.
     It only supports "mysql" right now. If dialect is not specified,
     The input sql will be parsed using the generic sql syntax. (optional)
+    :param grouping: The structure to build, either the name of a preset
+    ("none", "brackets", "identifiers" or "full") or a list of grouping
+    functions. The grouping functions they rely on are added, see
+    :meth:`sqlparse.engine.FilterStack.resolve_grouping`. By default
+    everything is grouped. (optional)
+    :param lazy: If ``True``, each statement is grouped on first access
+    to its tokens, see :class:`~sqlparse.sql.LazyStatement`. Its string
+    value doesn't need the grouping, and
+    :meth:`~sqlparse.sql.Statement.get_type` rarely does. (optional)
+    :param max_tokens: Statements with more tokens are left ungrouped.
+    (optional)
+    :param timeout: Statements whose grouping takes longer than this
+    number of seconds are left ungrouped. (optional)
+    :param cancel: A function that's called regularly while lexing and
+    before each statement is grouped. If it returns ``True``,
+    :exc:`~sqlparse.exceptions.SQLParseCancelled` is raised. (optional)
+    :param compact_values: If ``True``, the rows of ``INSERT ... VALUES``
+    statements are kept as a :class:`~sqlparse.sql.Values` node that
+    groups them on access, which saves most of the time and memory for
+    data dumps. (optional)
     :returns: A tuple of :class:`~sqlparse.sql.Statement` instances.
     """
-    stream = parsestream(sql, encoding, dialect)
+    stream = parsestream(sql, encoding, dialect, grouping, lazy,
+                         max_tokens, timeout, cancel, compact_values)
 
     return tuple(stream)
 
 
-def parsestream(stream, encoding=None, dialect=None):
+def parsestream(stream, encoding=None, dialect=None, grouping=None,
+                lazy=False, max_tokens=None, timeout=None, cancel=None,
+                compact_values=False):
     """Parses sql statements from file-like object.
 
     :param stream: A file-like object.
     :param encoding: The encoding of the stream contents (optional).
     :param dialect: The sql engine dialect of the input sql statements.
     It only supports "mysql" right now. (optional)
+    :param grouping: The structure to build, see :func:`parse`.
+    (optional)
+    :param lazy: Group the statements on first access, see :func:`parse`.
+    (optional)
+    :param max_tokens: See :func:`parse`. (optional)
+    :param timeout: See :func:`parse`. (optional)
+    :param cancel: See :func:`parse`. (optional)
+    :param compact_values: See :func:`parse`. (optional)
     :returns: A generator of :class:`~sqlparse.sql.Statement` instances.
     """
+    return _get_parser(dialect).parse(stream, encoding, grouping, lazy,
+                                      max_tokens, timeout, cancel,
+                                      compact_values)
+
+
+def parse_many(sqls, encoding=None, dialect=None, grouping=None,
+               lazy=False, max_tokens=None, timeout=None, cancel=None,
+               compact_values=False):
+    """Parse each of *sqls*.
+
+    Like :func:`parse`, but the lexer and the parser are shared by all
+    strings, which saves the setup for each call.
+
+    :param sqls: An iterable of strings.
+    :param encoding: The encoding of the strings (optional).
+    :param dialect: The sql engine dialect of the input sql statements.
+    It only supports "mysql" right now. (optional)
+    :param grouping: The structure to build, see :func:`parse`.
+    (optional)
+    :param lazy: Group the statements on first access, see :func:`parse`.
+    (optional)
+    :param max_tokens: See :func:`parse`. (optional)
+    :param timeout: See :func:`parse`. (optional)
+    :param cancel: See :func:`parse`. (optional)
+    :param compact_values: See :func:`parse`. (optional)
+    :returns: A generator yielding a tuple of
+    :class:`~sqlparse.sql.Statement` instances for each string.
+    """
+    parser = _get_parser(dialect)
+    lexer = _make_lexer(encoding)
+    lexer.cancel = cancel
+    for sql in sqls:
+        yield tuple(parser.parse_tokens(lexer.get_tokens(sql), grouping,
+                                        lazy, max_tokens, timeout, cancel,
+                                        compact_values))
+
+
+def parsefile(path, encoding=None, dialect=None, grouping=None,
+              lazy=False, max_tokens=None, timeout=None, cancel=None,
+              compact_values=False):
+    """Parses sql statements from the file at *path*.
+
+    The file is memory-mapped instead of being read into memory, see
+    :func:`sqlparse.lexer.tokenize_file`.
+
+    :param path: Path of the file.
+    :param encoding: The encoding of the file contents, it must be ASCII
+    compatible (optional).
+    :param dialect: The sql engine dialect of the input sql statements.
+    It only supports "mysql" right now. (optional)
+    :param grouping: The structure to build, see :func:`parse`.
+    (optional)
+    :param lazy: Group the statements on first access, see :func:`parse`.
+    (optional)
+    :param max_tokens: See :func:`parse`. (optional)
+    :param timeout: See :func:`parse`. (optional)
+    :param cancel: See :func:`parse`. (optional)
+    :param compact_values: See :func:`parse`. (optional)
+    :returns: A generator of :class:`~sqlparse.sql.Statement` instances.
+    """
+    from sqlparse import lexer
+    stream = lexer.tokenize_file(path, encoding, cancel)
+    return _get_parser(dialect).parse_tokens(stream, grouping, lazy,
+                                             max_tokens, timeout, cancel,
+                                             compact_values)
+
+
+def _get_parser(dialect):
+    if not _parsers:
+        _parsers.update(build_parsers())
     parser = _parsers.get(dialect)
     if parser is None:
         raise Exception("Unable to find parser to parse dialect ({0})."
                         .format(dialect))
-    return parser.parse(stream, encoding)
+    return parser
 
 
 def format(sql, **options):
@@ -73,18 +214,54 @@ def format(sql, **options):
 
     :returns: The formatted SQL statement as string.
     """
+    from sqlparse import formatter, lexer
     options = formatter.validate_options(options)
     encoding = options.pop('encoding', None)
-    stream = lexer.tokenize(sql, encoding)
+    stream = lexer.tokenize(sql, encoding, options.get('cancel'))
     stream = _format_pre_process(stream, options)
-    stack = engine.FilterStack()
-    stack = formatter.build_filter_stack(stack, options)
-    stack.postprocess.append(filters.SerializerUnicode())
+    stack = _format_stack(options)
     statements = split2(stream)
     return ''.join(stack.run(statement) for statement in statements)
 
 
+def format_many(sqls, **options):
+    """Format each of *sqls* according to *options*.
+
+    Like :func:`format`, but the options are validated only once and
+    the lexer and filters are shared by all strings.
+
+    :param sqls: An iterable of strings.
+    :returns: A generator of formatted strings.
+    """
+    from sqlparse import formatter
+    options = formatter.validate_options(options)
+    lexer = _make_lexer(options.pop('encoding', None))
+    lexer.cancel = options.get('cancel')
+    # These filters carry state from one statement to the next, so they
+    # can't be shared by the strings.
+    fresh_stack = bool(options.get('reindent') or options.get('right_margin')
+                       or options.get('output_format'))
+    stack = _format_stack(options)
+    for sql in sqls:
+        if fresh_stack:
+            stack = _format_stack(options)
+        stream = _format_pre_process(lexer.get_tokens(sql), options)
+        statements = split2(stream)
+        yield ''.join(stack.run(statement) for statement in statements)
+
+
+def _format_stack(options):
+    from sqlparse import engine, filters, formatter
+    stack = engine.FilterStack(max_tokens=options.get('max_tokens'),
+                               timeout=options.get('timeout'),
+                               cancel=options.get('cancel'))
+    stack = formatter.build_filter_stack(stack, options)
+    stack.postprocess.append(filters.SerializerUnicode())
+    return stack
+
+
 def _format_pre_process(stream, options):
+    from sqlparse import filters
     pre_processes = []
     if options.get('keyword_case', None):
         pre_processes.append(
@@ -114,15 +291,82 @@ def split(sql, encoding=None):
     :param encoding: The encoding of the statement (optional).
     :returns: A list of strings.
     """
-    stream = lexer.tokenize(sql, encoding)
-    splitter = StatementFilter()
-    stream = splitter.process(None, stream)
-    return [unicode(stmt).strip() for stmt in stream]
+    from sqlparse.engine.splitter import StatementSplitter
+    return StatementSplitter(encoding).split(sql)
+
+
+def split_offsets(sql, encoding=None):
+    """Returns the positions of the statements in *sql*.
+
+    For each statement a ``(start, end, line)`` tuple is returned.
+    *start* and *end* are offsets into the decoded string without the
+    whitespace around the statement, *line* is the number of the line
+    where it starts. For byte offsets into large files see
+    :func:`sqlparse.engine.splitter.write_index`.
+
+    :param sql: A string containting one or more SQL statements.
+    :param encoding: The encoding of the statement (optional).
+    :returns: A list of tuples.
+    """
+    from sqlparse.engine.splitter import StatementSplitter
+    splitter = StatementSplitter(encoding)
+    return list(splitter.offsets(splitter.text(sql)))
 
 
-from sqlparse.engine.filter import StatementFilter
+def split_many(sqls, encoding=None):
+    """Split each of *sqls* into single statements.
+
+    Like :func:`split`, but the splitter is shared by all strings.
+
+    :param sqls: An iterable of strings.
+    :param encoding: The encoding of the strings (optional).
+    :returns: A generator yielding a list of strings for each string.
+    """
+    from sqlparse.engine.splitter import StatementSplitter
+    splitter = StatementSplitter(encoding)
+    for sql in sqls:
+        yield splitter.split(sql)
+
+
+def _make_lexer(encoding):
+    from sqlparse.lexer import Lexer
+    lexer = Lexer()
+    if encoding is not None:
+        lexer.encoding = encoding
+    return lexer
 
 
 def split2(stream):
+    from sqlparse.engine.filter import StatementFilter
     splitter = StatementFilter()
-    return list(splitter.process(None, stream))
+    return splitter.process(None, stream)
+
+
+class _LazyModule(types.ModuleType):
+    """The sqlparse module, importing submodules on attribute access."""
+
+    def __getattr__(self, name):
+        try:
+            modname, attr = _lazy_attributes[name]
+        except KeyError:
+            raise AttributeError("'module' object has no attribute %r"
+                                 % name)
+        __import__(modname)
+        value = sys.modules[modname]
+        if attr is not None:
+            value = getattr(value, attr)
+        setattr(self, name, value)
+        return value
+
+
+def _install_lazy_module():
+    module = sys.modules[__name__]
+    lazy = _LazyModule(__name__, __doc__)
+    lazy.__dict__.update(module.__dict__)
+    # The functions above use the globals of the original module, which
+    # are cleared when it's garbage collected. Keep it alive.
+    lazy._module = module
+    sys.modules[__name__] = lazy
+
+
+_install_lazy_module()
@@ -5,14 +5,24 @@
 
 """filter"""
 
+import copy
+import time
+
 from sqlparse import lexer
+from sqlparse import sql
+from sqlparse import tokens as T
 from sqlparse.engine import grouping
 from sqlparse.engine.filter import StatementFilter
+from sqlparse.exceptions import SQLParseCancelled, SQLParseError
 
 # XXX remove this when cleanup is complete
 Filter = object
 
 
+class _OverBudget(Exception):
+    """Stops the grouping of a statement that takes too long."""
+
+
 class FilterStack(object):
 
     default_grouping_funcs = [
@@ -36,16 +46,109 @@ class FilterStack(object):
         grouping.group_begin
     ]
 
+    # Grouping functions that rely on the groups built by other ones.
+    grouping_requires = {
+        grouping.group_functions: [grouping.group_brackets],
+        grouping.group_where: [grouping.group_brackets],
+        grouping.group_identifier: [grouping.group_brackets,
+                                    grouping.group_functions],
+        grouping.group_order: [grouping.group_identifier],
+        grouping.group_typecasts: [grouping.group_identifier],
+        grouping.group_as: [grouping.group_identifier],
+        grouping.group_aliased: [grouping.group_identifier],
+        grouping.group_comparison: [grouping.group_identifier],
+        grouping.align_comments: [grouping.group_comments],
+        grouping.group_identifier_list: [grouping.group_identifier],
+    }
+
+    # Named sets of grouping functions, see resolve_grouping().
+    grouping_presets = {
+        'none': [],
+        'brackets': [grouping.group_brackets],
+        'identifiers': [grouping.group_typecasts, grouping.group_as,
+                        grouping.group_aliased, grouping.group_order,
+                        grouping.group_identifier_list],
+        'full': default_grouping_funcs,
+    }
+
+    @classmethod
+    def resolve_grouping(cls, grouping):
+        """Returns the grouping functions to apply for *grouping*.
+
+        *grouping* is the name of a preset in :attr:`grouping_presets` or
+        a list of grouping functions. The functions they require (see
+        :attr:`grouping_requires`) are added and all of them are brought
+        into the order of :attr:`default_grouping_funcs`, other functions
+        are applied last in the given order.
+        """
+        if isinstance(grouping, basestring):
+            try:
+                grouping = cls.grouping_presets[grouping]
+            except KeyError:
+                raise SQLParseError('Invalid grouping preset: %r'
+                                    % grouping)
+        funcs = []
+        todo = list(reversed(grouping))
+        while todo:
+            func = todo.pop()
+            if func in funcs:
+                continue
+            funcs.append(func)
+            todo.extend(cls.grouping_requires.get(func, ()))
+        order = cls.default_grouping_funcs
+        known = [func for func in order if func in funcs]
+        return known + [func for func in funcs if func not in order]
+
     def __init__(
         self,
         stmtprocess=None,
         postprocess=None,
-        grouping_funcs=None
+        grouping_funcs=None,
+        fused_grouping=False,
+        lazy_grouping=False,
+        max_tokens=None,
+        timeout=None,
+        cancel=None,
+        compact_values=False
     ):
         self.stmtprocess = stmtprocess or []
         self.postprocess = postprocess or []
         self.grouping_funcs = grouping_funcs or self.default_grouping_funcs
+        # Apply the grouping functions in as few traversals as possible,
+        # see grouping.group().
+        self.fused_grouping = fused_grouping
+        # Group the statements only when their tokens are accessed, see
+        # sql.LazyStatement. If there are statement filters, they are
+        # grouped right away.
+        self.lazy_grouping = lazy_grouping
+        # Statements with more than max_tokens tokens or whose grouping
+        # takes more than timeout seconds are left ungrouped and the
+        # statement filters are skipped for them.
+        self.max_tokens = max_tokens
+        self.timeout = timeout
+        # Called regularly, parsing stops with SQLParseCancelled when it
+        # returns True.
+        self.cancel = cancel
+        # The splitter keeps the rows of INSERT ... VALUES statements as
+        # a sql.Values node, they are grouped on access.
+        self.compact_values = compact_values
         self._grouping = False
+        # True while an over-budget statement is post-processed.
+        self.passing_through = False
+
+    def limited(self, max_tokens=None, timeout=None, cancel=None):
+        """Returns a copy of this stack with the given limits.
+
+        The stack itself is returned if no limit is given. The filters
+        are shared with the copy.
+        """
+        if max_tokens is None and timeout is None and cancel is None:
+            return self
+        stack = copy.copy(self)
+        stack.max_tokens = max_tokens
+        stack.timeout = timeout
+        stack.cancel = cancel
+        return stack
 
     def _flatten(self, stream):
         for token in stream:
@@ -59,16 +162,100 @@ class FilterStack(object):
         self._grouping = True
 
     def run(self, statement):
-        statement = self._group_token(statement)
-        statement = self._process_statement(statement)
-        statement = self._post_process_statement(statement)
-        return statement
+        self._check_cancel()
+        if self._group_token(statement):
+            statement = self._process_statement(statement)
+            return self._post_process_statement(statement)
+        # The statement is over budget and passed through unformatted.
+        # Statement filters that keep state between statements are told
+        # about it.
+        for filter_ in self.stmtprocess:
+            if hasattr(filter_, 'pass_through'):
+                filter_.pass_through(self, statement)
+        self.passing_through = True
+        try:
+            return self._post_process_statement(statement)
+        finally:
+            self.passing_through = False
 
+    def _check_cancel(self):
+        if self.cancel is not None and self.cancel():
+            raise SQLParseCancelled('Parsing was cancelled')
 
     def _group_token(self, statement):
-        if self._grouping:
-            grouping.group(statement, self.grouping_funcs)
-        return statement
+        """Groups *statement*, returns ``False`` if it's over budget."""
+        if not self._grouping:
+            return True
+        if (self.max_tokens is not None
+                and len(statement.tokens) > self.max_tokens):
+            return False
+        if self.lazy_grouping and not self.stmtprocess:
+            # Nothing else looks at the tokens, the budget is checked
+            # when they are first accessed.
+            statement.defer_grouping(self._apply_grouping)
+            return True
+        # Statement filters need the grouped tokens right away anyway and
+        # are skipped if the grouping goes over budget.
+        return self._apply_grouping(statement)
+
+    def _apply_grouping(self, statement):
+        check = None
+        if self.timeout is not None or self.cancel is not None:
+            check = self._check_cancel
+            if self.timeout is not None:
+                deadline = time.time() + self.timeout
+
+                def check():
+                    self._check_cancel()
+                    if time.time() > deadline:
+                        raise _OverBudget()
+        values = self._find_values(statement.tokens)
+        if values is not None:
+            # Only the tokens before the rows are grouped now.
+            rest = statement.tokens[values:]
+            statement.tokens = statement.tokens[:values]
+        try:
+            self._group_list(statement, check)
+        except _OverBudget:
+            # Undo the partial grouping.
+            statement.tokens = list(self._flatten(statement.tokens))
+            if values is not None:
+                statement.tokens.extend(rest)
+            for token in statement.tokens:
+                token.parent = statement
+            statement.brackets = None
+            return False
+        if values is not None:
+            rows = rest[0]
+            rows._grouper = self._group_list
+            rows.parent = statement
+            if statement.brackets is not None:
+                # The tokens before the rows weren't grouped yet.
+                statement.brackets.update(
+                    (start + values, end + values)
+                    for start, end in rows._brackets.iteritems())
+            rows._brackets = None
+            statement.tokens.extend(rest)
+        return True
+
+    def _find_values(self, tokens):
+        """Returns the position of the sql.Values node in *tokens*."""
+        idx = len(tokens) - 1
+        while idx > 0 and (tokens[idx].is_whitespace()
+                           or tokens[idx].match(T.Punctuation, ';')):
+            idx -= 1
+        if idx > 0 and isinstance(tokens[idx], sql.Values):
+            return idx
+        return None
+
+    def _group_list(self, tlist, check=None):
+        if self.fused_grouping:
+            grouping.group(tlist, self.grouping_funcs, fused=True,
+                           check=check)
+        else:
+            # Skips the functions that have nothing to group, which is
+            # most of them for short statements.
+            grouping.group_flat(tlist, self.grouping_funcs, check=check)
 
     def _process_statement(self, statement):
         if self.stmtprocess:
@@ -1,13 +1,180 @@
 # -*- coding: utf-8 -*-
 
-from sqlparse.sql import Statement, Token
+import array
+
+from sqlparse import lexer
+from sqlparse.sql import Statement, Token, Values
 from sqlparse import tokens as T
 
+# Tokens after the semicolon that still belong to the statement. The
+# data of COPY ... FROM stdin follows right after it.
+_TRAILING = (T.Whitespace, T.Comment.Single, T.CopyData)
+
+# States of _CompactValues.
+_START, _HEAD, _ROWS, _TAIL, _OFF = range(5)
+
+_HEAD_TYPES = frozenset((T.Keyword, T.Name, T.String.Symbol, T.Whitespace,
+                         T.Newline, T.Punctuation))
+
+
+class _CompactValues(object):
+    """Collects the tokens of an ``INSERT ... VALUES`` statement.
+
+    The statement must start with INSERT or REPLACE and consist of simple
+    names and keywords up to VALUES, followed by the rows and at most a
+    semicolon. Instead of tokens only the text of the rows is kept, it
+    becomes a :class:`~sqlparse.sql.Values` node. The rows are grouped
+    the same on their own as with the rest of the statement, as long as
+    they have no square brackets. Otherwise the text is lexed again.
+    """
+
+    def __init__(self):
+        self.tokens = []
+        self._state = _START
+        self._depth = 0
+        # The text of the rows in chunks of joined parts.
+        self._chunks = []
+        self._parts = []
+        self._pos = 0
+        # Number of tokens in the rows.
+        self._count = 0
+        self._offsets = array.array('l')
+        self._brackets = {}
+        self._open = []
+        # Position of the Values node in tokens.
+        self._values = None
+
+    def add(self, ttype, value):
+        state = self._state
+        if state == _ROWS:
+            if self._add_row(ttype, value):
+                return
+            state = self._state
+        if state == _OFF:
+            pass
+        elif state == _TAIL:
+            if not (ttype in T.Whitespace
+                    or (ttype is T.Punctuation and value == ';')):
+                self._fall_back()
+        elif state == _HEAD:
+            self._add_head(ttype, value)
+        elif (ttype is T.Keyword.DML
+              and value.upper() in ('INSERT', 'REPLACE')):
+            self._state = _HEAD
+        elif ttype not in T.Whitespace:
+            self._state = _OFF
+        self.tokens.append(Token(ttype, value))
+
+    def _add_head(self, ttype, value):
+        if ttype not in _HEAD_TYPES:
+            self._state = _OFF
+        elif ttype is T.Punctuation:
+            if value == '(':
+                self._depth += 1
+            elif value == ')':
+                self._depth -= 1
+                if self._depth < 0:
+                    self._state = _OFF
+            elif value not in ('.', ','):
+                self._state = _OFF
+        elif ttype is T.Keyword:
+            unified = value.upper()
+            if unified == 'WHERE':
+                self._state = _OFF
+            elif unified == 'VALUES':
+                if self._depth:
+                    self._state = _OFF
+                else:
+                    self._state = _ROWS
+
+    def _add_row(self, ttype, value):
+        """Adds a token of the rows, returns False if they ended."""
+        open_ = self._open
+        if ttype is T.Punctuation:
+            if value == '(':
+                if not open_:
+                    if self._count and not self._offsets:
+                        # Only whitespace before the first row.
+                        self._flush_whitespace()
+                    self._offsets.append(self._pos)
+                open_.append(self._count)
+            elif value == ')' and open_:
+                self._brackets[open_.pop()] = self._count
+                if not open_:
+                    self._offsets.append(self._pos + 1)
+            elif value in ('[', ']'):
+                self._fall_back()
+                return False
+            elif not open_ and value != ',':
+                self._end_rows()
+                return False
+        elif not open_ and ttype not in T.Whitespace:
+            self._end_rows()
+            return False
+        parts = self._parts
+        parts.append(value)
+        if len(parts) >= 1024:
+            self._chunks.append(u''.join(parts))
+            del parts[:]
+        self._pos += len(value)
+        self._count += 1
+        return True
+
+    def _text(self):
+        self._chunks.append(u''.join(self._parts))
+        text = u''.join(self._chunks)
+        self._chunks = []
+        self._parts = []
+        return text
+
+    def _flush_whitespace(self):
+        # The whitespace after VALUES stays a token.
+        self.tokens.extend(self._lex(self._text()))
+        self._pos = self._count = 0
+
+    def _lex(self, text):
+        return [Token(ttype, value) for ttype, value in lexer.tokenize(text)]
+
+    def _end_rows(self):
+        """Turns the text of the rows into a Values node."""
+        text = self._text()
+        if self._open or not self._offsets:
+            self._state = _OFF
+            self.tokens.extend(self._lex(text))
+            return
+        end = self._offsets[-1]
+        if text[end:].strip():
+            # A comma after the last row.
+            self._state = _OFF
+            self.tokens.extend(self._lex(text))
+            return
+        self._state = _TAIL
+        self._values = len(self.tokens)
+        self.tokens.append(Values(text[:end], self._offsets,
+                                  self._brackets))
+        self.tokens.extend(self._lex(text[end:]))
+
+    def _fall_back(self):
+        if self._state == _ROWS:
+            self.tokens.extend(self._lex(self._text()))
+        else:
+            idx = self._values
+            self.tokens[idx:idx + 1] = self._lex(self.tokens[idx].source)
+        self._state = _OFF
+
+    def finish(self):
+        """Returns the tokens of the statement."""
+        if self._state == _ROWS:
+            self._end_rows()
+        return self.tokens
+
 
 class StatementFilter:
     "Filter that split stream at individual statements"
 
-    def __init__(self):
+    def __init__(self, compact_values=False):
+        # Keep the rows of INSERT ... VALUES statements as sql.Values.
+        self.compact_values = compact_values
         self._in_declare = False
         self._in_dbldollar = False
         self._is_create = False
@@ -74,11 +241,14 @@ class StatementFilter:
         splitlevel = 0
         stmt = None
         stmt_tokens = []
+        compact = None
 
         # Run over all stream tokens
         for ttype, value in stream:
             # Yield token if we finished a statement and there's no whitespaces
-            if consume_ws and ttype not in (T.Whitespace, T.Comment.Single):
+            if consume_ws and ttype not in _TRAILING:
+                if compact is not None:
+                    stmt_tokens = compact.finish()
                 stmt.tokens = stmt_tokens
                 yield stmt
 
@@ -91,13 +261,18 @@ class StatementFilter:
             # Create a new statement if we are not currently in one of them
             if stmt is None:
                 stmt = Statement()
+                if self.compact_values:
+                    compact = _CompactValues()
                 stmt_tokens = []
 
             # Change current split level (increase, decrease or remain equal)
             splitlevel += self._change_splitlevel(ttype, value)
 
             # Append the token to the current statement
-            stmt_tokens.append(Token(ttype, value))
+            if compact is None:
+                stmt_tokens.append(Token(ttype, value))
+            else:
+                compact.add(ttype, value)
 
             # Check if we get the end of a statement
             if splitlevel <= 0 and ttype is T.Punctuation and value == ';':
@@ -105,5 +280,7 @@ class StatementFilter:
 
         # Yield pending statement (if any)
         if stmt is not None:
+            if compact is not None:
+                stmt_tokens = compact.finish()
             stmt.tokens = stmt_tokens
             yield stmt
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 
+import functools
 import itertools
 
 from sqlparse import sql
@@ -14,41 +15,74 @@ except NameError:  # Python < 2.6
 def _group_left_right(tlist, ttype, value, cls,
                       check_right=lambda t: True,
                       check_left=lambda t: True,
-                      include_semicolon=False):
-    [_group_left_right(sgroup, ttype, value, cls, check_right, check_left,
-                       include_semicolon) for sgroup in tlist.get_sublists()
-     if not isinstance(sgroup, cls)]
-    idx = 0
-    token = tlist.token_next_match(idx, ttype, value)
-    while token:
-        right = tlist.token_next(tlist.token_index(token))
-        left = tlist.token_prev(tlist.token_index(token))
-        if right is None or not check_right(right):
-            token = tlist.token_next_match(tlist.token_index(token) + 1,
-                                           ttype, value)
-        elif left is None or not check_left(left):
-            token = tlist.token_next_match(tlist.token_index(token) + 1,
-                                           ttype, value)
-        else:
-            if include_semicolon:
-                sright = tlist.token_next_match(tlist.token_index(right),
-                                                T.Punctuation, ';')
-                if sright is not None:
-                    # only overwrite "right" if a semicolon is actually
-                    # present.
-                    right = sright
-            tokens = tlist.tokens_between(left, right)[1:]
-            if not isinstance(left, cls):
-                new = cls([left])
-                new_idx = tlist.token_index(left)
-                tlist.tokens.remove(left)
-                tlist.tokens.insert(new_idx, new)
-                left = new
-            left.tokens.extend(tokens)
-            for t in tokens:
-                tlist.tokens.remove(t)
-            token = tlist.token_next_match(tlist.token_index(left) + 1,
-                                           ttype, value)
+                      include_semicolon=False, recurse=True):
+    if recurse:
+        [_group_left_right(sgroup, ttype, value, cls, check_right,
+                           check_left, include_semicolon)
+         for sgroup in tlist.get_sublists() if not isinstance(sgroup, cls)]
+    # The new list of children is built in a single pass: "left" is the
+    # last non-whitespace token in it, "right" the next non-whitespace
+    # token in the old list.
+    tokens = tlist.tokens
+    result = []
+    semicolon = -1  # position of the next ";" for include_semicolon
+    changed = False
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if not token.match(ttype, value):
+            result.append(token)
+            i += 1
+            continue
+        r = _next_non_ws(tokens, i + 1)
+        l = _prev_non_ws(result, len(result))
+        if (r is None or not check_right(tokens[r])
+                or l is None or not check_left(result[l])):
+            result.append(token)
+            i += 1
+            continue
+        if include_semicolon:
+            if semicolon < r:
+                semicolon = r
+                while (semicolon < len(tokens)
+                       and not tokens[semicolon].match(T.Punctuation, ';')):
+                    semicolon += 1
+            if semicolon < len(tokens):
+                # only overwrite "right" if a semicolon is actually
+                # present.
+                r = semicolon
+        left = result[l]
+        if not isinstance(left, cls):
+            group = result[l] = cls([left])
+            left.parent = group
+            group.parent = tlist
+            left = group
+        moved = result[l + 1:] + tokens[i:r + 1]
+        for t in moved:
+            t.parent = left
+        left.tokens.extend(moved)
+        left._invalidate_value()
+        del result[l + 1:]
+        changed = True
+        i = r + 1
+    if changed:
+        tlist.tokens = result
+
+
+def _next_non_ws(tokens, idx):
+    """Returns the position of the next non-whitespace token."""
+    while idx < len(tokens):
+        if not tokens[idx].is_whitespace():
+            return idx
+        idx += 1
+
+
+def _prev_non_ws(tokens, idx):
+    """Returns the position of the previous non-whitespace token."""
+    while idx:
+        idx -= 1
+        if not tokens[idx].is_whitespace():
+            return idx
 
 
 def _find_matching(idx, tlist, start_ttype, start_value, end_ttype, end_value):
@@ -66,9 +100,10 @@ def _find_matching(idx, tlist, start_ttype, start_value, end_ttype, end_value):
 def _group_matching(tlist, start_ttype, start_value, end_ttype, end_value,
                     cls, include_semicolon=False, recurse=False):
 
-    [_group_matching(sgroup, start_ttype, start_value, end_ttype, end_value,
-                     cls, include_semicolon) for sgroup in tlist.get_sublists()
-     if recurse]
+    if recurse:
+        [_group_matching(sgroup, start_ttype, start_value, end_ttype,
+                         end_value, cls, include_semicolon)
+         for sgroup in tlist.get_sublists()]
     if isinstance(tlist, cls):
         idx = 1
     else:
@@ -111,7 +146,7 @@ def group_begin(tlist):
                     sql.Begin, True)
 
 
-def group_as(tlist):
+def group_as(tlist, recurse=True):
 
     def _right_valid(token):
         # Currently limited to DML/DDL. Maybe additional more non SQL reserved
@@ -125,15 +160,15 @@ def group_as(tlist):
 
     _group_left_right(tlist, T.Keyword, 'AS', sql.Identifier,
                       check_right=_right_valid,
-                      check_left=_left_valid)
+                      check_left=_left_valid, recurse=recurse)
 
 
-def group_assignment(tlist):
+def group_assignment(tlist, recurse=True):
     _group_left_right(tlist, T.Assignment, ':=', sql.Assignment,
-                      include_semicolon=True)
+                      include_semicolon=True, recurse=recurse)
 
 
-def group_comparison(tlist):
+def group_comparison(tlist, recurse=True):
 
     def _parts_valid(token):
         return (token.ttype in (T.String.Symbol, T.String.Single,
@@ -144,15 +179,16 @@ def group_comparison(tlist):
                 or (token.ttype is T.Keyword
                     and token.value.upper() in ['NULL', ]))
     _group_left_right(tlist, T.Operator.Comparison, None, sql.Comparison,
-                      check_left=_parts_valid, check_right=_parts_valid)
+                      check_left=_parts_valid, check_right=_parts_valid,
+                      recurse=recurse)
 
 
-def group_case(tlist):
+def group_case(tlist, recurse=True):
     _group_matching(tlist, T.Keyword, 'CASE', T.Keyword, 'END', sql.Case,
-                    include_semicolon=True, recurse=True)
+                    include_semicolon=True, recurse=recurse)
 
 
-def group_identifier(tlist):
+def group_identifier(tlist, recurse=True):
     def _consume_cycle(tl, i):
         # TODO: Usage of Wildcard token is ambivalent here.
         x = itertools.cycle((
@@ -170,7 +206,7 @@ def group_identifier(tlist):
                        or isinstance(y, (sql.Parenthesis,
                                          sql.SquareBrackets,
                                          sql.Function)))))
-        for t in tl.tokens[i:]:
+        for t in tl._tokens_from(i):
             # Don't take whitespaces into account.
             if t.ttype is T.Whitespace:
                 yield t
@@ -183,27 +219,18 @@ def group_identifier(tlist):
                 raise StopIteration
 
     def _next_token(tl, i):
-        # chooses the next token. if two tokens are found then the
-        # first is returned.
-        t1 = tl.token_next_by_type(
-            i, (T.String.Symbol, T.Name, T.Literal.Number.Integer,
-                T.Literal.Number.Float))
-        t2 = tl.token_next_by_instance(i, (sql.Function, sql.Parenthesis))
-        if t1 and t2:
-            i1 = tl.token_index(t1)
-            i2 = tl.token_index(t2)
-            if i1 > i2:
-                return t2
-            else:
-                return t1
-        elif t1:
-            return t1
-        else:
-            return t2
+        # chooses the next token that is either a name or number or a
+        # function or parenthesis, in a single pass over the tokens.
+        return tl.token_matching(i, (
+            lambda t: t.ttype in (T.String.Symbol, T.Name,
+                                  T.Literal.Number.Integer,
+                                  T.Literal.Number.Float),
+            lambda t: isinstance(t, (sql.Function, sql.Parenthesis))))
 
     # bottom up approach: group subgroups first
-    [group_identifier(sgroup) for sgroup in tlist.get_sublists()
-     if not isinstance(sgroup, sql.Identifier)]
+    if recurse:
+        [group_identifier(sgroup) for sgroup in tlist.get_sublists()
+         if not isinstance(sgroup, sql.Identifier)]
 
     # real processing
     idx = 0
@@ -222,67 +249,108 @@ def group_identifier(tlist):
             group = tlist.group_tokens(sql.Identifier, identifier_tokens)
             idx = tlist.token_index(group) + 1
         else:
-            idx += 1
+            idx = tlist.token_index(token) + 1
         token = _next_token(tlist, idx)
 
 
-def group_identifier_list(tlist):
-    [group_identifier_list(sgroup) for sgroup in tlist.get_sublists()
-     if not isinstance(sgroup, sql.IdentifierList)]
-    idx = 0
-    # Allowed list items
-    fend1_funcs = [lambda t: isinstance(t, (sql.Identifier, sql.Function,
-                                            sql.Case)),
-                   lambda t: t.is_whitespace(),
-                   lambda t: t.ttype == T.Name,
-                   lambda t: t.ttype == T.Wildcard,
-                   lambda t: t.match(T.Keyword, 'null'),
-                   lambda t: t.match(T.Keyword, 'role'),
-                   lambda t: t.ttype == T.Number.Integer,
-                   lambda t: t.ttype == T.String.Single,
-                   lambda t: t.ttype == T.Name.Placeholder,
-                   lambda t: t.ttype == T.Keyword,
-                   lambda t: isinstance(t, sql.Comparison),
-                   lambda t: isinstance(t, sql.Comment),
-                   lambda t: t.ttype == T.Comment.Multiline,
-                   ]
-    tcomma = tlist.token_next_match(idx, T.Punctuation, ',')
-    start = None
-    while tcomma is not None:
-        before = tlist.token_prev(tcomma)
-        after = tlist.token_next(tcomma)
-        # Check if the tokens around tcomma belong to a list
-        bpassed = apassed = False
-        for func in fend1_funcs:
-            if before is not None and func(before):
-                bpassed = True
-            if after is not None and func(after):
-                apassed = True
-        if not bpassed or not apassed:
+# Allowed list items
+_LIST_ITEM_CLASSES = (sql.Identifier, sql.Function, sql.Case, sql.Comparison,
+                      sql.Comment)
+_LIST_ITEM_TYPES = frozenset((T.Name, T.Wildcard, T.Keyword,
+                              T.Number.Integer, T.String.Single,
+                              T.Name.Placeholder, T.Comment.Multiline))
+
+
+def _is_list_item(token):
+    return (token.ttype in _LIST_ITEM_TYPES
+            or isinstance(token, _LIST_ITEM_CLASSES))
+
+
+def group_identifier_list(tlist, recurse=True):
+    if recurse:
+        [group_identifier_list(sgroup) for sgroup in tlist.get_sublists()
+         if not isinstance(sgroup, sql.IdentifierList)]
+    # Single pass over the children: "before" is the last non-whitespace
+    # token in the new list, "after" the next one in the old list. A list
+    # is grouped when the token after its last item isn't a comma.
+    tokens = tlist.tokens
+    result = []
+    start = None  # position of the first item of the current list
+    changed = False
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if not token.match(T.Punctuation, ','):
+            result.append(token)
+            i += 1
+            continue
+        before = _prev_non_ws(result, len(result))
+        after = _next_non_ws(tokens, i + 1)
+        if (before is None or after is None
+                or not _is_list_item(result[before])
+                or not _is_list_item(tokens[after])):
             # Something's wrong here, skip ahead to next ","
             start = None
-            tcomma = tlist.token_next_match(tlist.token_index(tcomma) + 1,
-                                            T.Punctuation, ',')
+            result.append(token)
+            i += 1
+            continue
+        if start is None:
+            start = before
+        next_ = _next_non_ws(tokens, after + 1)
+        if next_ is None or not tokens[next_].match(T.Punctuation, ','):
+            # Reached the end of the list
+            group = sql.IdentifierList(result[start:] + tokens[i:after + 1])
+            for t in group.tokens:
+                t.parent = group
+            group.parent = tlist
+            del result[start:]
+            result.append(group)
+            changed = True
+            start = None
+            i = after + 1
         else:
-            if start is None:
-                start = before
-            next_ = tlist.token_next(after)
-            if next_ is None or not next_.match(T.Punctuation, ','):
-                # Reached the end of the list
-                tokens = tlist.tokens_between(start, after)
-                group = tlist.group_tokens(sql.IdentifierList, tokens)
-                start = None
-                tcomma = tlist.token_next_match(tlist.token_index(group) + 1,
-                                                T.Punctuation, ',')
-            else:
-                tcomma = next_
+            result.extend(tokens[i:next_])
+            i = next_
+    if changed:
+        tlist.tokens = result
+
+
+_BRACKETS = {'(': (')', sql.Parenthesis), '[': (']', sql.SquareBrackets)}
+
+
+def _match_brackets(tokens, start):
+    """Returns a list with the position of the matching closing bracket for
+    each opening bracket in *tokens*, and ``None`` otherwise.
+
+    Parentheses and square brackets are matched independently: an opening
+    bracket is closed by the first closing bracket of the same kind that
+    isn't needed by another one in between.
+    """
+    matches = [None] * len(tokens)
+    stacks = {'(': [], '[': []}
+    closing = {')': stacks['('], ']': stacks['[']}
+    for idx in xrange(start, len(tokens)):
+        token = tokens[idx]
+        if token.ttype is not T.Punctuation:
+            continue
+        if token.value in stacks:
+            stacks[token.value].append(idx)
+        elif token.value in closing and closing[token.value]:
+            matches[closing[token.value].pop()] = idx
+    return matches
 
 
 def group_brackets(tlist):
     """Group parentheses () or square brackets []
 
         This is just like _group_matching, but complicated by the fact that
-        round brackets can contain square bracket groups and vice versa
+        round brackets can contain square bracket groups and vice versa.
+
+        The brackets are matched in advance (see _match_brackets), then
+        the groups are built in one pass with a stack of the open groups.
+        A bracket is only grouped if its match is within the enclosing
+        group. For statements the matches are recorded as
+        ``Statement.brackets``.
     """
 
     if isinstance(tlist, (sql.Parenthesis, sql.SquareBrackets)):
@@ -290,41 +358,50 @@ def group_brackets(tlist):
     else:
         idx = 0
 
-    # Find the first opening bracket
-    token = tlist.token_next_match(idx, T.Punctuation, ['(', '['])
-
-    while token:
-        start_val = token.value  # either '(' or '['
-        if start_val == '(':
-            end_val = ')'
-            group_class = sql.Parenthesis
+    tokens = tlist.tokens
+    matches = _match_brackets(tokens, idx)
+    brackets = {}
+    # Each open group is a tuple (class, children, position after the
+    # closing bracket, position of the opening bracket in flatten()).
+    stack = [(None, tokens[:idx], len(tokens), None)]
+    flat_idx = 0
+    for pos in xrange(len(tokens)):
+        while stack[-1][2] == pos:
+            _close_bracket_group(stack, tlist, brackets, flat_idx)
+        token = tokens[pos]
+        end = matches[pos]
+        if end is not None and end < stack[-1][2]:
+            cls = _BRACKETS[token.value][1]
+            stack.append((cls, [token], end + 1, flat_idx))
+        elif pos >= idx:
+            stack[-1][1].append(token)
+        if token.is_group():
+            flat_idx += sum(1 for _ in token.flatten())
         else:
-            end_val = ']'
-            group_class = sql.SquareBrackets
-
-        tidx = tlist.token_index(token)
-
-        # Find the corresponding closing bracket
-        end = _find_matching(tidx, tlist, T.Punctuation, start_val,
-                             T.Punctuation, end_val)
-
-        if end is None:
-            idx = tidx + 1
-        else:
-            group = tlist.group_tokens(group_class,
-                                       tlist.tokens_between(token, end))
-
-            # Check for nested bracket groups within this group
-            group_brackets(group)
-            idx = tlist.token_index(group) + 1
-
-        # Find the next opening bracket
-        token = tlist.token_next_match(idx, T.Punctuation, ['(', '['])
-
-
-def group_comments(tlist):
-    [group_comments(sgroup) for sgroup in tlist.get_sublists()
-     if not isinstance(sgroup, sql.Comment)]
+            flat_idx += 1
+    while len(stack) > 1:
+        _close_bracket_group(stack, tlist, brackets, flat_idx)
+    if brackets:
+        tlist.tokens = stack[0][1]
+    if isinstance(tlist, sql.Statement):
+        tlist.brackets = brackets
+
+
+def _close_bracket_group(stack, tlist, brackets, flat_idx):
+    cls, tokens, _, flat_start = stack.pop()
+    group = cls(tokens)
+    for token in tokens:
+        token.parent = group
+    # Nested groups get their parent when the enclosing group is closed.
+    group.parent = tlist
+    brackets[flat_start] = flat_idx - 1
+    stack[-1][1].append(group)
+
+
+def group_comments(tlist, recurse=True):
+    if recurse:
+        [group_comments(sgroup) for sgroup in tlist.get_sublists()
+         if not isinstance(sgroup, sql.Comment)]
     idx = 0
     token = tlist.token_next_by_type(idx, T.Comment)
     while token:
@@ -343,9 +420,10 @@ def group_comments(tlist):
         token = tlist.token_next_by_type(idx, T.Comment)
 
 
-def group_where(tlist):
-    [group_where(sgroup) for sgroup in tlist.get_sublists()
-     if not isinstance(sgroup, sql.Where)]
+def group_where(tlist, recurse=True):
+    if recurse:
+        [group_where(sgroup) for sgroup in tlist.get_sublists()
+         if not isinstance(sgroup, sql.Where)]
     idx = 0
     token = tlist.token_next_match(idx, T.Keyword, 'WHERE')
     stopwords = ('ORDER', 'GROUP', 'LIMIT', 'UNION', 'EXCEPT', 'HAVING')
@@ -363,10 +441,14 @@ def group_where(tlist):
         token = tlist.token_next_match(idx, T.Keyword, 'WHERE')
 
 
-def group_aliased(tlist):
-    clss = (sql.Identifier, sql.Function, sql.Case)
-    [group_aliased(sgroup) for sgroup in tlist.get_sublists()
-     if not isinstance(sgroup, clss)]
+_ALIASED_CLASSES = (sql.Identifier, sql.Function, sql.Case)
+
+
+def group_aliased(tlist, recurse=True):
+    clss = _ALIASED_CLASSES
+    if recurse:
+        [group_aliased(sgroup) for sgroup in tlist.get_sublists()
+         if not isinstance(sgroup, clss)]
     idx = 0
     token = tlist.token_next_by_instance(idx, clss)
     while token:
@@ -375,19 +457,23 @@ def group_aliased(tlist):
             if not next_.value.upper().startswith('VARCHAR'):
                 grp = tlist.tokens_between(token, next_)[1:]
                 token.tokens.extend(grp)
+                token._invalidate_value()
                 for t in grp:
+                    t.parent = token
                     tlist.tokens.remove(t)
         idx = tlist.token_index(token) + 1
         token = tlist.token_next_by_instance(idx, clss)
 
 
-def group_typecasts(tlist):
-    _group_left_right(tlist, T.Punctuation, '::', sql.Identifier)
+def group_typecasts(tlist, recurse=True):
+    _group_left_right(tlist, T.Punctuation, '::', sql.Identifier,
+                      recurse=recurse)
 
 
-def group_functions(tlist):
-    [group_functions(sgroup) for sgroup in tlist.get_sublists()
-     if not isinstance(sgroup, sql.Function)]
+def group_functions(tlist, recurse=True):
+    if recurse:
+        [group_functions(sgroup) for sgroup in tlist.get_sublists()
+         if not isinstance(sgroup, sql.Function)]
     idx = 0
     token = tlist.token_next_by_type(idx, T.Name)
     while token:
@@ -415,8 +501,9 @@ def group_order(tlist):
         token = tlist.token_next_by_type(idx, T.Keyword.Order)
 
 
-def align_comments(tlist):
-    [align_comments(sgroup) for sgroup in tlist.get_sublists()]
+def align_comments(tlist, recurse=True):
+    if recurse:
+        [align_comments(sgroup) for sgroup in tlist.get_sublists()]
     idx = 0
     token = tlist.token_next_by_instance(idx, sql.Comment)
     while token:
@@ -424,7 +511,9 @@ def align_comments(tlist):
         if isinstance(before, sql.TokenList):
             grp = tlist.tokens_between(before, token)[1:]
             before.tokens.extend(grp)
+            before._invalidate_value()
             for t in grp:
+                t.parent = before
                 tlist.tokens.remove(t)
             idx = tlist.token_index(before) + 1
         else:
@@ -432,6 +521,319 @@ def align_comments(tlist):
         token = tlist.token_next_by_instance(idx, sql.Comment)
 
 
-def group(tlist, grouping_funcs):
+# How the grouping functions work, for _group_fused(): the classes of
+# the sublists they skip, how deep they go (None for the whole tree, 0 for
+# the given list only and 1 for its sublists too) and the children a list
+# needs for the function to change it, by token type (or a subtype),
+# normalized value or class. None if it can't be told in advance. The
+# functions with a depth other than 0 take recurse=False to group a
+# single list.
+_FUSABLE = {
+    group_comments: (sql.Comment, None, (T.Comment,)),
+    # Statement.brackets is set even if there are none.
+    group_brackets: (None, 0, None),
+    group_functions: (sql.Function, None, (T.Name,)),
+    group_where: (sql.Where, None, ('WHERE',)),
+    group_case: (None, 1, ('CASE',)),
+    group_identifier: (sql.Identifier, None, (
+        T.String.Symbol, T.Name, T.Literal.Number.Integer,
+        T.Literal.Number.Float, '(', sql.TokenList)),
+    group_order: (None, 0, (T.Keyword.Order,)),
+    group_typecasts: (sql.Identifier, None, ('::',)),
+    group_as: (sql.Identifier, None, ('AS',)),
+    group_aliased: (_ALIASED_CLASSES, None, None),
+    group_assignment: (sql.Assignment, None, (':=',)),
+    group_comparison: (sql.Comparison, None, (T.Operator.Comparison,)),
+    align_comments: (None, None, (T.Comment, sql.TokenList)),
+    group_identifier_list: (sql.IdentifierList, None, (',',)),
+    group_if: (None, 0, ('IF',)),
+    group_for: (None, 0, ('FOR',)),
+    group_foreach: (None, 0, ('FOREACH',)),
+    group_begin: (None, 0, ('BEGIN',)),
+}
+
+# Plans of _group_fused() by tuple of grouping functions.
+_fused_plans = {}
+
+
+def group(tlist, grouping_funcs, fused=False, check=None):
+    """Applies *grouping_funcs* to *tlist* one after another.
+
+    If *fused* is ``True`` consecutive functions known to this module
+    are applied together in a single traversal of the tree (see
+    :func:`_group_fused`), the result is the same.
+
+    *check* is called without arguments before each function and before
+    each list of a fused traversal. It can raise an exception to stop
+    the grouping, which leaves *tlist* partly grouped.
+    """
+    if not fused:
+        for func in grouping_funcs:
+            if check is not None:
+                check()
+            func(tlist)
+        return
+    funcs = []
     for func in grouping_funcs:
+        if func in _FUSABLE:
+            funcs.append(func)
+            continue
+        if funcs:
+            _group_fused(tlist, tuple(funcs), check)
+            funcs = []
+        if check is not None:
+            check()
+        func(tlist)
+    if funcs:
+        _group_fused(tlist, tuple(funcs), check)
+
+
+def group_flat(tlist, grouping_funcs, check=None):
+    """Applies *grouping_funcs* to the ungrouped *tlist* like :func:`group`.
+
+    The functions known to this module that need tokens *tlist* doesn't
+    have (see ``_FUSABLE``) are skipped, the result is the same. Most of
+    them are skipped for short statements like "BEGIN" or "SELECT 1".
+    """
+    funcs = tuple(func for func in grouping_funcs if func in _FUSABLE)
+    plan = _fused_plans.get(funcs)
+    if plan is None:
+        plan = _fused_plans[funcs] = _FusedPlan(funcs)
+    types = plan.types
+    values = plan.values
+    needed = plan.always
+    brackets = False
+    for token in tlist.tokens:
+        ttype = token.ttype
+        if ttype is None:
+            # Already grouped.
+            return group(tlist, grouping_funcs, check=check)
+        if ttype in types:
+            needed |= types[ttype]
+        else:
+            needed |= plan.type_mask(ttype)
+        value = token.normalized
+        if value in values:
+            needed |= values[value]
+        if value in _BRACKETS:
+            brackets = True
+    idx = 0
+    for func in grouping_funcs:
+        if func in _FUSABLE:
+            bit = 1 << idx
+            idx += 1
+            if func is group_brackets and not brackets:
+                if isinstance(tlist, sql.Statement):
+                    tlist.brackets = {}
+                continue
+            if func is group_aliased:
+                # It only extends groups, which the functions before
+                # have built if there are any.
+                if not any(token.is_group() for token in tlist.tokens):
+                    continue
+            elif not needed & bit:
+                # The groups a function needs are made of tokens that
+                # it needs too (e.g. "(" for a Parenthesis).
+                continue
+        if check is not None:
+            check()
         func(tlist)
+
+
+class _FusedPlan(object):
+    """What :func:`_group_fused` needs to know about *funcs*.
+
+    The functions are numbered by their position, sets of them are bit
+    masks.
+    """
+
+    def __init__(self, funcs):
+        self.funcs = funcs
+        self.local_funcs = []
+        self.always = 0  # functions without a check
+        self.values = {}  # normalized value -> functions needing it
+        self.types = {}  # token type -> functions needing it
+        self.group = 0  # functions needing a group
+        for idx, func in enumerate(funcs):
+            _, depth, needs = _FUSABLE[func]
+            if depth == 0:
+                self.local_funcs.append(func)
+            else:
+                self.local_funcs.append(
+                    functools.partial(func, recurse=False))
+            if needs is None:
+                self.always |= 1 << idx
+                continue
+            for need in needs:
+                if need is sql.TokenList:
+                    self.group |= 1 << idx
+                elif isinstance(need, basestring):
+                    self.values[need] = self.values.get(need, 0) | 1 << idx
+        self._child_masks = {}
+
+    def type_mask(self, ttype):
+        """Functions that a child of type *ttype* might trigger."""
+        mask = self.types.get(ttype)
+        if mask is None:
+            mask = 0
+            for idx, func in enumerate(self.funcs):
+                needs = _FUSABLE[func][2] or ()
+                if ttype is None:
+                    if sql.TokenList in needs:
+                        mask |= 1 << idx
+                elif any(isinstance(need, T._TokenType) and ttype in need
+                         for need in needs):
+                    mask |= 1 << idx
+            self.types[ttype] = mask
+        return mask
+
+    def child_mask(self, cls, in_root):
+        """Functions that recurse into a *cls* sublist."""
+        mask = self._child_masks.get((cls, in_root))
+        if mask is None:
+            mask = 0
+            for idx, func in enumerate(self.funcs):
+                excluded, depth, _ = _FUSABLE[func]
+                if depth == 0 or (depth == 1 and not in_root):
+                    continue
+                if excluded is not None and issubclass(cls, excluded):
+                    continue
+                mask |= 1 << idx
+            self._child_masks[(cls, in_root)] = mask
+        return mask
+
+
+def _group_fused(root, funcs, check=None):
+    """Applies *funcs* to *root* like :func:`group`, visiting each list once.
+
+    The lists are processed top-down, each one with all functions that
+    reach it. That gives the same result because the functions only look
+    at the class and value of the children of the list they group, which
+    doesn't depend on the grouping within the children. What does depend
+    on the order is which functions reach a list and what it contains at
+    that time: a function doesn't recurse into the groups that the
+    functions before it created or extended around a sublist, and a group
+    created or extended by a function only has the new tokens for the
+    functions after it. So when a function moves tokens into a group, the
+    pass and the new parent of each moved group are recorded (``history``)
+    as well as where the new tokens start in the group (``chunks``).
+    When a group is processed the recorded tokens are added to it at the
+    right time and only the functions that reach it are applied.
+
+    A function is skipped for a list if none of the children it needs
+    (see ``_FUSABLE``) is there, groups only get children of the list
+    they're created in.
+    """
+    plan = _fused_plans.get(funcs)
+    if plan is None:
+        plan = _fused_plans[funcs] = _FusedPlan(funcs)
+    local_funcs = plan.local_funcs
+    types = plan.types
+    values = plan.values
+    # Group -> [(first pass, parent), ...] for the groups that moved.
+    history = {}
+    # Group -> [(pass, end), ...], tokens[:end] exist after that pass.
+    chunks = {}
+    reach = {root: (1 << len(funcs)) - 1}
+
+    def move(token, tlist, group, idx):
+        moves = history.get(token)
+        if moves is None:
+            history[token] = [(0, tlist), (idx + 1, group)]
+        else:
+            moves.append((idx + 1, group))
+
+    def record(tlist, before, idx):
+        old = set(before)
+        kept = []
+        new = []
+        for token in tlist.tokens:
+            if token in old:
+                kept.append(token)
+            else:
+                new.append((token, tlist))
+        moved = len(before) - len(kept)
+        while new:
+            group, parent = new.pop()
+            chunks[group] = [(idx, len(group.tokens))]
+            history[group] = [(idx + 1, parent)]
+            for token in group.tokens:
+                if token in old:
+                    moved -= 1
+                    if token.is_group():
+                        move(token, tlist, group, idx)
+                elif token.is_group():
+                    new.append((token, group))
+        if not moved:
+            return
+        # The other tokens were added to groups in this list, a group
+        # doesn't have tokens of this list otherwise.
+        for group in kept:
+            if not group.is_group():
+                continue
+            end = len(group.tokens)
+            start = end
+            while start and group.tokens[start - 1] in old:
+                start -= 1
+                if group.tokens[start].is_group():
+                    move(group.tokens[start], tlist, group, idx)
+            if start < end:
+                chunks.setdefault(group, [(-1, start)]).append((idx, end))
+
+    todo = [root]
+    while todo:
+        if check is not None:
+            check()
+        tlist = todo.pop()
+        mask = reach[tlist]
+        pending = chunks.pop(tlist, None)
+        if pending is not None:
+            full = tlist.tokens
+            tlist.tokens = []
+            done = 0
+        if mask:
+            needed = plan.always
+            for token in full if pending is not None else tlist.tokens:
+                ttype = token.ttype
+                if ttype in types:
+                    needed |= types[ttype]
+                else:
+                    needed |= plan.type_mask(ttype)
+                if ttype is not None:
+                    needed |= values.get(token.normalized, 0)
+            mask &= needed
+        for idx in xrange(len(funcs)):
+            if not mask >> idx & 1:
+                continue
+            if pending:
+                while pending and pending[0][0] < idx:
+                    end = pending.pop(0)[1]
+                    tlist.tokens.extend(full[done:end])
+                    done = end
+            before = list(tlist.tokens)
+            local_funcs[idx](tlist)
+            if tlist.tokens != before:
+                record(tlist, before, idx)
+        if pending is not None:
+            tlist.tokens.extend(full[done:])
+        mask = reach[tlist]
+        for token in tlist.tokens:
+            if not token.is_group():
+                continue
+            moves = history.pop(token, None)
+            if moves is None:
+                reach[token] = mask & plan.child_mask(type(token),
+                                                      tlist is root)
+            else:
+                token_mask = 0
+                for i, (first, parent) in enumerate(moves):
+                    if i + 1 < len(moves):
+                        stop = moves[i + 1][0]
+                    else:
+                        stop = len(funcs)
+                    passes = (1 << stop) - (1 << first)
+                    token_mask |= (reach[parent] & passes
+                                   & plan.child_mask(type(token),
+                                                     parent is root))
+                reach[token] = token_mask
+            todo.append(token)
@@ -0,0 +1,424 @@
+# -*- coding: utf-8 -*-
+
+"""Splitting of SQL strings into statements without building tokens."""
+
+import codecs
+import os
+import re
+import struct
+
+from sqlparse import lexer
+from sqlparse import tokens as T
+from sqlparse.engine.filter import _TRAILING, StatementFilter
+
+# Prefixes of the keywords StatementFilter._change_splitlevel looks at.
+_LEVEL_WORDS = ('DECLARE', 'BEGIN', 'END', 'IF', 'FOR', 'CREATE')
+
+
+def _comment_body(rules):
+    """Returns a regex for the rest of a comment, given the state's rules.
+
+    The rules are tried in order until the one that pops the state
+    matches (or the input ends). Comments don't nest, the lexer doesn't
+    push the state again from within a comment.
+    """
+    body = []
+    end = None
+    for tdef in rules:
+        pattern = tdef[0]
+        if len(tdef) > 2 and tdef[2] == '#pop':
+            end = pattern
+        elif end is not None:
+            body.append('(?!%s)(?:%s)' % (end, pattern))
+        else:
+            body.append('(?:%s)' % pattern)
+    return '(?:%s)*(?:%s)?' % ('|'.join(body), end)
+
+
+def _uncapture(pattern):
+    """Turns the capturing groups of *pattern* into non-capturing ones."""
+    buf = []
+    i = 0
+    in_class = False
+    while i < len(pattern):
+        item = pattern[i]
+        if item == '\\':
+            item = pattern[i:i + 2]
+        elif in_class:
+            in_class = item != ']'
+        elif item == '[':
+            # "]" right after "[" or "[^" is part of the class
+            item = re.match(r'\[\^?\]?', pattern[i:]).group()
+            in_class = True
+        elif item == '(' and pattern[i + 1:i + 2] != '?':
+            buf.append('(?:')
+            i += 1
+            continue
+        buf.append(item)
+        i += len(item)
+    return ''.join(buf)
+
+
+def _compile_rules(rules, flags):
+    """Returns a matcher for the alternation of *rules* and its types.
+
+    Like the lexer the alternation picks the first rule that matches.
+    The types are indexed by ``match.lastindex``, they are ``None`` for
+    words that are looked up in the keyword tables.
+    """
+    regex = re.compile('|'.join('(?P<r%d>%s)' % (i, pattern)
+                                for i, (pattern, _) in enumerate(rules))
+                       or '(?!)', flags)
+    ttypes = [None] * (regex.groups + 1)
+    for name, index in regex.groupindex.iteritems():
+        ttypes[index] = rules[int(name[1:])][1]
+    return regex.match, ttypes
+
+
+class _Scanner(object):
+    """Matchers for the rules of the root state of a lexer.
+
+    :attr:`dispatch` maps a character to the matcher for the rules that
+    may match there (see :meth:`~sqlparse.lexer.LexerMeta.
+    build_dispatch`), :attr:`default` is the matcher for all rules.
+
+    :attr:`skip` matches a run of tokens that can't change the split
+    level or end a statement. The tokens are the ones the lexer would
+    find, the rules are tried in the same order. :attr:`skip_dollar`
+    does the same within dollar quotes.
+
+    :attr:`copy_start` matches (without consuming text) where a COPY
+    statement starts, :attr:`copy_end` matches its semicolon and the
+    data lines if it reads from stdin.
+    """
+
+    def __init__(self, lexer_cls):
+        flags = lexer_cls.flags
+        tokendefs = lexer_cls.tokens
+        rules = []
+        firsts = []
+        for tdef in tokendefs['root']:
+            pattern, action = tdef[:2]
+            firsts.append(lexer.first_chars(pattern, flags))
+            if len(tdef) > 2 and tdef[2] == 'multiline-comments':
+                pattern += _comment_body(tokendefs['multiline-comments'])
+            elif len(tdef) > 2:
+                # The semicolon, COPY statements are tracked separately.
+                assert tdef[2] == 'start', tdef
+            if action is lexer.is_keyword:
+                action = None
+            rules.append((pattern, action))
+
+        matchers = {}
+        self.dispatch = {}
+        for char in lexer._DISPATCH_CHARS:
+            candidates = tuple(rule for rule, first in zip(rules, firsts)
+                               if first is None or char in first)
+            if candidates not in matchers:
+                matchers[candidates] = _compile_rules(candidates, flags)
+            key = char
+            if not flags & re.UNICODE:
+                key = char.encode('latin1')
+            self.dispatch[key] = matchers[candidates]
+        self.default = _compile_rules(rules, flags)
+
+        # One branch per set of candidate rules, starting with a check
+        # of the current character. The branches are case insensitive,
+        # so that both cases of a letter use the rules of either.
+        branches = {}
+        for char in lexer._DISPATCH_CHARS:
+            if char in u';$':
+                continue
+            candidates = tuple(
+                i for i, first in enumerate(firsts)
+                if first is None or char in first
+                or char.swapcase() in first)
+            if candidates:
+                branches.setdefault(candidates, []).append(char)
+        level_chars = set(''.join(_LEVEL_WORDS).lower())
+        skip = []
+        skip_dollar = []
+        for candidates, chars in sorted(branches.iteritems(),
+                                        key=lambda item: -len(item[1])):
+            check = '(?=[%s])' % ''.join(re.escape(str(char))
+                                         for char in chars)
+            alternation = '(?:%s)' % '|'.join(_uncapture(rules[i][0])
+                                              for i in candidates)
+            skip_dollar.append(check + alternation)
+            if level_chars.intersection(chars):
+                check += '(?!%s)' % '|'.join(_LEVEL_WORDS)
+            skip.append(check + alternation)
+        # Non-ASCII characters first, so that they don't reach the
+        # (case insensitive) branches for ASCII characters.
+        rest = '(?![\\x00-\\x7f])(?:%s)' % '|'.join(
+            _uncapture(pattern) for pattern, _ in rules)
+        self.skip = re.compile(
+            '(?:%s)*' % '|'.join([rest] + skip), flags).match
+        self.skip_dollar = re.compile(
+            '(?:%s)*' % '|'.join([rest] + skip_dollar), flags).match
+
+        self.copy_start = re.compile(tokendefs['start'][0][0], flags).match
+        self.copy_end = re.compile(
+            tokendefs['copy'][0][0] + tokendefs['copy-data'][0][0],
+            flags).match
+
+
+class StatementSplitter(object):
+    """Splits SQL into statements like :class:`StatementFilter`.
+
+    The text is scanned with the rules of the :class:`~sqlparse.lexer.
+    Lexer`, but no tokens or statements are created. Only keywords and
+    dollar quotes are passed on to the filter to track the split level.
+
+    With *lexer_cls* :class:`~sqlparse.lexer.BytesLexer` the offsets
+    are computed on byte strings (or memory-mapped files) instead of
+    unicode strings.
+    """
+
+    # Scanners by lexer class, they're built on first use.
+    _scanners = {}
+
+    def __init__(self, encoding=None, lexer_cls=lexer.Lexer):
+        self.lexer = lexer.Lexer()
+        if encoding is not None:
+            self.lexer.encoding = encoding
+        self.filter = StatementFilter()
+        if lexer_cls not in self._scanners:
+            self._scanners[lexer_cls] = _Scanner(lexer_cls)
+        self._scanner = self._scanners[lexer_cls]
+
+    def spans(self, sql, pos=0):
+        """Yields ``(start, end)`` offsets of the statements in *sql*.
+
+        *sql* must be a unicode string (or a buffer in bytes mode), it's
+        scanned from *pos* on. Whitespace and single line comments after
+        a semicolon belong to the statement before.
+        """
+        scanner = self._scanner
+        dispatch = scanner.dispatch
+        default = scanner.default
+        splitter = self.filter
+        change_splitlevel = splitter._change_splitlevel
+        reset = splitter._reset
+        lookup = lexer.keyword_cache.lookup
+        keywords = T.Keyword
+        trailing = _TRAILING
+        copy_start = scanner.copy_start
+        copy_end = scanner.copy_end
+
+        reset()
+        consume_ws = False
+        splitlevel = 0
+        start = pos
+        end = len(sql)
+        in_copy = copy_start(sql, pos) is not None
+        while pos < end:
+            if not consume_ws:
+                if splitter._in_dbldollar:
+                    pos = scanner.skip_dollar(sql, pos).end()
+                else:
+                    pos = scanner.skip(sql, pos).end()
+                if pos == end:
+                    break
+
+            match, ttypes = dispatch.get(sql[pos], default)
+            m = match(sql, pos)
+            if m is None:
+                # see Lexer.get_tokens_unprocessed
+                ttype = T.Error
+                next_pos = pos + 1
+            else:
+                ttype = ttypes[m.lastindex]
+                next_pos = m.end()
+
+            if consume_ws and ttype not in trailing:
+                yield start, pos
+                reset()
+                consume_ws = False
+                splitlevel = 0
+                start = pos
+                continue
+
+            if ttype is None:
+                value = m.group()
+                ttype = lookup(value)
+                if ttype in keywords:
+                    splitlevel += change_splitlevel(ttype, value)
+            elif ttype in keywords or ttype is T.Name.Builtin:
+                splitlevel += change_splitlevel(ttype, m.group())
+            elif (ttype is T.Punctuation and sql[pos] == ';'
+                  and next_pos == pos + 1):
+                # Like the lexer, skip the data lines of COPY ... FROM
+                # stdin and check for a COPY after every semicolon.
+                if in_copy:
+                    m = copy_end(sql, pos)
+                    if m is not None:
+                        next_pos = m.end()
+                in_copy = copy_start(sql, next_pos) is not None
+                consume_ws = splitlevel <= 0
+            pos = next_pos
+
+        if pos > start:
+            yield start, pos
+
+    def offsets(self, sql, pos=0):
+        """Yields ``(start, end, line)`` for the statements in *sql*.
+
+        Unlike :meth:`spans` the offsets don't include the whitespace
+        around a statement, ``sql[start:end]`` is what :meth:`split`
+        returns for it. *line* is the number of the line where the
+        statement starts, counting from 1.
+        """
+        line = 1
+        for start, end in self.spans(sql, pos):
+            value = sql[start:end]
+            stripped = value.lstrip()
+            lead = len(value) - len(stripped)
+            yield (start + lead, start + lead + len(stripped.rstrip()),
+                   line + value.count('\n', 0, lead))
+            line += value.count('\n')
+
+    def split(self, sql):
+        """Returns the statements in *sql* as stripped strings.
+
+        *sql* is a string or a file-like object. The result is the same
+        as that of :func:`sqlparse.split`.
+        """
+        text = self.text(sql)
+        return [text[start:end].strip() for start, end in self.spans(text)]
+
+    def text(self, sql):
+        """Returns the decoded text of *sql*, the way it's scanned."""
+        if not isinstance(sql, basestring):
+            sql = sql.read()
+        return self.lexer._prepare(sql)
+
+
+#: Suffix of the index files written by :func:`write_index`.
+INDEX_SUFFIX = '.sqlidx'
+
+_INDEX_MAGIC = b'SQLPIDX1'
+# magic, size and mtime of the SQL file, number of entries, encoding
+_INDEX_HEADER = struct.Struct('<8sQdQ16s')
+# start, end, line
+_INDEX_ENTRY = struct.Struct('<QQQ')
+
+
+def write_index(path, index_path=None, encoding=None):
+    """Writes an index of the statements in the SQL file at *path*.
+
+    The file is memory-mapped and split in bytes mode, so the encoding
+    must be ASCII compatible (see :class:`~sqlparse.lexer.MappedFile`).
+    The index is written to *index_path*, which defaults to *path*
+    with :data:`INDEX_SUFFIX` appended.
+
+    :returns: The :class:`StatementIndex`.
+    """
+    index_path = index_path or path + INDEX_SUFFIX
+    stat = os.stat(path)
+    mapped = lexer.MappedFile(path, encoding)
+    tmppath = '%s.%d' % (index_path, os.getpid())
+    try:
+        pos = 0
+        if (mapped.encoding == 'guess'
+                and mapped.buffer[:3] == codecs.BOM_UTF8):
+            pos = 3
+        splitter = StatementSplitter(lexer_cls=lexer.BytesLexer)
+        count = 0
+        with open(tmppath, 'wb') as fp:
+            fp.seek(_INDEX_HEADER.size)
+            for entry in splitter.offsets(mapped.buffer, pos):
+                fp.write(_INDEX_ENTRY.pack(*entry))
+                count += 1
+            fp.seek(0)
+            fp.write(_INDEX_HEADER.pack(
+                _INDEX_MAGIC, stat.st_size, stat.st_mtime, count,
+                mapped.encoding))
+        os.rename(tmppath, index_path)
+    finally:
+        mapped.close()
+        if os.path.exists(tmppath):
+            os.remove(tmppath)
+    return StatementIndex(path, index_path)
+
+
+class StatementIndex(object):
+    """The statement index of a SQL file, see :func:`write_index`.
+
+    The items are ``(start, end, line)`` tuples with the byte offsets
+    and the first line of the statements in the file (see
+    :meth:`StatementSplitter.offsets`). They are read from the index
+    file on access, it isn't loaded as a whole.
+
+    A :exc:`ValueError` is raised if the SQL file changed since the
+    index was written.
+    """
+
+    def __init__(self, path, index_path=None):
+        self.path = path
+        self.index_path = index_path or path + INDEX_SUFFIX
+        self._file = open(self.index_path, 'rb')
+        try:
+            header = self._file.read(_INDEX_HEADER.size)
+            if (len(header) != _INDEX_HEADER.size
+                    or not header.startswith(_INDEX_MAGIC)):
+                raise ValueError('%r is not a statement index'
+                                 % self.index_path)
+            _, size, mtime, self._count, encoding = _INDEX_HEADER.unpack(
+                header)
+            stat = os.stat(path)
+            if (stat.st_size, stat.st_mtime) != (size, mtime):
+                raise ValueError('statement index %r is out of date'
+                                 % self.index_path)
+        except:
+            self._file.close()
+            raise
+        self.encoding = encoding.rstrip(b'\0')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError('statement index out of range')
+        self._file.seek(_INDEX_HEADER.size + index * _INDEX_ENTRY.size)
+        return _INDEX_ENTRY.unpack(self._file.read(_INDEX_ENTRY.size))
+
+    def __iter__(self):
+        for index in xrange(self._count):
+            yield self[index]
+
+    def close(self):
+        """Closes the index file."""
+        self._file.close()
+
+    def find(self, offset):
+        """Returns the index of the first statement at or after *offset*.
+
+        Use it to split the file in byte ranges: statement ``i`` with
+        ``find(a) <= i < find(b)`` starts within ``[a, b)``.
+        """
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self[middle][0] < offset:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def statement(self, index):
+        """Returns the decoded text of the statement at *index*."""
+        start, end, _ = self[index]
+        with open(self.path, 'rb') as fp:
+            fp.seek(start)
+            data = fp.read(end - start)
+        return lexer.decode_value(data, self.encoding)
@@ -8,3 +8,7 @@
 
 class SQLParseError(Exception):
     """Base class for exceptions in this module."""
+
+
+class SQLParseCancelled(SQLParseError):
+    """Raised when the ``cancel`` callback asked to stop parsing."""
@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+
+"""Extraction of the rows of INSERT statements, e.g. from SQL dumps.
+
+:func:`insert_rows` works on the token stream of the lexer. Nothing is
+grouped and only the row at hand is kept in memory, so that files of any
+size can be converted as fast as they are lexed.
+"""
+
+import binascii
+import decimal
+import re
+
+from sqlparse import lexer
+from sqlparse import tokens as T
+from sqlparse.engine.filter import StatementFilter
+from sqlparse.exceptions import SQLParseError
+
+# Keywords between INSERT and the table name.
+_MODIFIERS = frozenset(('INTO', 'IGNORE', 'LOW_PRIORITY', 'DELAYED',
+                        'HIGH_PRIORITY'))
+_VALUES = frozenset(('VALUES', 'VALUE'))
+_KEYWORD_VALUES = {'NULL': None, 'TRUE': True, 'FALSE': False}
+_SKIPPED = frozenset((T.Whitespace, T.Newline, T.Comment.Single,
+                      T.Comment.Multiline))
+_NAME_TYPES = frozenset((T.Name, T.String.Symbol, T.Keyword))
+
+_MYSQL_ESCAPES = {'0': u'\0', 'b': u'\b', 'n': u'\n', 'r': u'\r',
+                  't': u'\t', 'Z': u'\x1a', '%': u'\\%', '_': u'\\_'}
+_MYSQL_STRING = re.compile(r"\\(.)|''", re.DOTALL)
+_C_ESCAPES = {'b': u'\b', 'f': u'\f', 'n': u'\n', 'r': u'\r', 't': u'\t'}
+_C_STRING = re.compile(r"\\([0-7]{1,3}|x[0-9a-fA-F]{1,2}|u[0-9a-fA-F]{4}"
+                       r"|U[0-9a-fA-F]{8}|.)|''", re.DOTALL)
+
+
+class Expression(unicode):
+    """The SQL text of a value that isn't a literal, like ``now()``."""
+
+    __slots__ = ()
+
+    def __repr__(self):
+        return 'Expression(%s)' % unicode.__repr__(self)
+
+
+def _unquote_name(value):
+    if value[0] == '`' and value[-1] == '`':
+        return value[1:-1].replace('``', '`')
+    if value[0] == '"' and value[-1] == '"':
+        return value[1:-1].replace('""', '"')
+    return value
+
+
+def _mysql_escape(match):
+    char = match.group(1)
+    if char is None:
+        return u"'"
+    return _MYSQL_ESCAPES.get(char, char)
+
+
+def _c_escape(match):
+    escape = match.group(1)
+    if escape is None:
+        return u"'"
+    if escape[0] in 'xuU' and len(escape) > 1:
+        return unichr(int(escape[1:], 16))
+    if escape[0] in '01234567':
+        return unichr(int(escape, 8))
+    return _C_ESCAPES.get(escape, escape)
+
+
+def _ansi_string(value):
+    return value[1:-1].replace(u"''", u"'")
+
+
+def _mysql_string(value):
+    value = value[1:-1]
+    if u'\\' not in value and u"''" not in value:
+        return value
+    return _MYSQL_STRING.sub(_mysql_escape, value)
+
+
+def _c_string(value):
+    return _C_STRING.sub(_c_escape, value[1:-1])
+
+
+class _RowExtractor(object):
+    """Reads the INSERT statements of a token stream, see insert_rows()."""
+
+    def __init__(self, stream, dialect):
+        self._tokens = iter(stream)
+        self._filter = StatementFilter()
+        self._splitlevel = 0
+        # False after the last token or the semicolon of a statement.
+        self._in_statement = True
+        self._done = False
+        self._mysql = dialect == 'mysql'
+        if self._mysql:
+            self._string = _mysql_string
+        else:
+            self._string = _ansi_string
+
+    def _next(self):
+        """Returns the next token of the statement or None at its end.
+
+        Whitespace and comments are skipped.
+        """
+        if not self._in_statement:
+            return None
+        for ttype, value in self._tokens:
+            if ttype in T.Keyword or ttype is T.Name.Builtin:
+                self._splitlevel += self._filter._change_splitlevel(
+                    ttype, value)
+            elif (ttype is T.Punctuation and value == ';'
+                    and self._splitlevel <= 0):
+                self._in_statement = False
+                return None
+            if ttype in _SKIPPED:
+                continue
+            return ttype, value
+        self._in_statement = False
+        self._done = True
+        return None
+
+    def rows(self):
+        while not self._done:
+            self._filter._reset()
+            self._splitlevel = 0
+            self._in_statement = True
+            token = self._next()
+            if (token is not None and token[0] is T.Keyword.DML
+                    and token[1].upper() in ('INSERT', 'REPLACE')):
+                for row in self._insert():
+                    yield row
+            while self._next() is not None:
+                pass
+
+    def _insert(self):
+        token = self._next()
+        while (token is not None and token[0] in T.Keyword
+               and token[1].upper() in _MODIFIERS):
+            token = self._next()
+        if token is None or token[0] not in _NAME_TYPES:
+            return
+        table = [_unquote_name(token[1])]
+        token = self._next()
+        while token is not None and token == (T.Punctuation, u'.'):
+            token = self._next()
+            if token is None or token[0] not in _NAME_TYPES:
+                return
+            table.append(_unquote_name(token[1]))
+            token = self._next()
+        table = u'.'.join(table)
+        columns = None
+        if token is not None and token == (T.Punctuation, u'('):
+            columns = []
+            token = self._next()
+            while token is not None and token[0] in _NAME_TYPES:
+                columns.append(_unquote_name(token[1]))
+                token = self._next()
+                if token is not None and token == (T.Punctuation, u','):
+                    token = self._next()
+            if token is None or token != (T.Punctuation, u')'):
+                return
+            columns = tuple(columns)
+            token = self._next()
+        if (token is None or token[0] not in (T.Keyword, T.Name)
+                or token[1].upper() not in _VALUES):
+            return
+        token = self._next()
+        while token is not None and token == (T.Punctuation, u'('):
+            row = self._row()
+            if row is None:
+                return
+            yield table, columns, row
+            token = self._next()
+            if token is None or token != (T.Punctuation, u','):
+                return
+            token = self._next()
+
+    def _row(self):
+        """Reads a row after its "(", returns None if it isn't closed."""
+        # Like _next(), inlined for speed.
+        row = []
+        item = []
+        depth = 0
+        for ttype, value in self._tokens:
+            if ttype is T.Punctuation:
+                if value == u',':
+                    if not depth:
+                        row.append(self._value(item))
+                        item = []
+                        continue
+                elif value == u')':
+                    if not depth:
+                        if item or row:
+                            row.append(self._value(item))
+                        return tuple(row)
+                    depth -= 1
+                elif value == u'(':
+                    depth += 1
+                elif value == u';' and self._splitlevel <= 0:
+                    self._in_statement = False
+                    return None
+            elif ttype in T.Keyword or ttype is T.Name.Builtin:
+                self._splitlevel += self._filter._change_splitlevel(
+                    ttype, value)
+            item.append((ttype, value))
+        self._in_statement = False
+        self._done = True
+        return None
+
+    def _value(self, item):
+        """Decodes the tokens of a value."""
+        if len(item) == 1:
+            tokens = item
+        else:
+            tokens = [token for token in item if token[0] not in _SKIPPED]
+        if len(tokens) == 1:
+            ttype, value = tokens[0]
+            if ttype is T.String.Single:
+                return self._string(value)
+            elif ttype is T.Number.Integer:
+                return int(value)
+            elif ttype is T.Number.Float:
+                return decimal.Decimal(value)
+            elif ttype is T.Number.Hexadecimal:
+                if self._mysql and value[0] != '-':
+                    # A binary string, like the ones of --hex-blob.
+                    return _unhexlify(value[2:])
+                return int(value, 16)
+            elif ttype is T.Keyword and value.upper() in _KEYWORD_VALUES:
+                return _KEYWORD_VALUES[value.upper()]
+        elif len(tokens) == 2:
+            (prefix_type, prefix), (ttype, value) = tokens
+            if (prefix_type is T.Operator and prefix in (u'-', u'+')
+                    and ttype in (T.Number.Integer, T.Number.Float)):
+                # The literal may be signed itself, e.g. "- -1".
+                number = self._value([(ttype, value)])
+                if prefix == u'-':
+                    number = -number
+                return number
+            elif prefix_type is T.Name and ttype is T.String.Single:
+                prefix = prefix.upper()
+                if prefix == 'X':
+                    return _unhexlify(value[1:-1])
+                elif prefix == 'E' and not self._mysql:
+                    return _c_string(value)
+                elif prefix == 'N' or prefix[0] == '_' and self._mysql:
+                    # National strings and character set introducers.
+                    return self._string(value)
+        return Expression(u''.join(value for _, value in item).strip())
+
+
+def _unhexlify(digits):
+    if len(digits) % 2:
+        digits = u'0' + digits
+    return binascii.unhexlify(digits)
+
+
+def insert_rows(stream, encoding=None, dialect=None):
+    """Yields the rows of the INSERT statements in *stream*.
+
+    For each row of each ``INSERT`` (or ``REPLACE``) ``... VALUES``
+    statement a tuple ``(table, columns, row)`` is yielded. *table* is
+    the name of the table without quotes, its parts joined by dots.
+    *columns* is a tuple of the column names or ``None`` if the statement
+    doesn't list them. *row* is a tuple of the values of the row.
+
+    Literals are decoded: strings to unicode, integers to int (or long),
+    other numbers to :class:`decimal.Decimal`, NULL, TRUE and FALSE to
+    ``None``, ``True`` and ``False``. Hexadecimal literals are byte
+    strings in MySQL (like the ones written by ``mysqldump --hex-blob``)
+    and integers otherwise, ``X'...'`` literals are byte strings. Other
+    values are returned as their SQL text as an :class:`Expression`.
+
+    Other statements are skipped, as well as the rest of an INSERT
+    statement that doesn't continue like expected. The tokens are not
+    grouped and only the current row is kept in memory.
+
+    :param stream: A string or a file-like object, which is lexed in
+    chunks. It can also be a stream of ``(token type, value)`` items,
+    e.g. from :func:`sqlparse.lexer.tokenize_file`.
+    :param encoding: The encoding of the stream contents (optional).
+    :param dialect: The sql engine dialect. With "mysql" strings have
+    backslash escapes, otherwise only quotes are doubled (like in
+    PostgreSQL, where ``E'...'`` strings have backslash escapes).
+    (optional)
+    :returns: A generator of ``(table, columns, row)`` tuples.
+    """
+    if dialect not in (None, 'mysql'):
+        raise SQLParseError('Invalid dialect: %r' % dialect)
+    if isinstance(stream, basestring) or hasattr(stream, 'read'):
+        stream = lexer.tokenize(stream, encoding)
+    return _RowExtractor(stream, dialect).rows()
@@ -456,20 +456,27 @@ class ReindentFilter:
             self._split_kwds(tlist)
         [self._process(sgroup) for sgroup in tlist.get_sublists()]
 
+    def _separate(self, stmt):
+        if self._last_stmt is not None:
+            if unicode(self._last_stmt).endswith('\n'):
+                nl = '\n'
+            else:
+                nl = '\n\n'
+            stmt.tokens.insert(
+                0, sql.Token(T.Whitespace, nl))
+        if self._last_stmt != stmt:
+            self._last_stmt = stmt
+
     def process(self, stack, stmt):
         if isinstance(stmt, sql.Statement):
             self._curr_stmt = stmt
         self._process(stmt)
         if isinstance(stmt, sql.Statement):
-            if self._last_stmt is not None:
-                if unicode(self._last_stmt).endswith('\n'):
-                    nl = '\n'
-                else:
-                    nl = '\n\n'
-                stmt.tokens.insert(
-                    0, sql.Token(T.Whitespace, nl))
-            if self._last_stmt != stmt:
-                self._last_stmt = stmt
+            self._separate(stmt)
+
+    def pass_through(self, stack, stmt):
+        """Separates *stmt*, which isn't formatted, from the others."""
+        self._separate(stmt)
 
 
 # FIXME: Doesn't work ;)
@@ -843,6 +850,9 @@ class SerializerUnicode:
 
     def process(self, stack, stmt):
         raw = unicode(stmt)
+        if stack.passing_through:
+            # Keep the original text.
+            return raw
         lines = split_unquoted_newlines(raw)
         res = '\n'.join(line.rstrip() for line in lines)
         return res
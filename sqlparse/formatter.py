@@ -78,6 +78,30 @@ def validate_options(options):
             raise SQLParseError('right_margin requires an integer > 10')
     options['right_margin'] = right_margin
 
+    max_tokens = options.get('max_tokens', None)
+    if max_tokens is not None:
+        try:
+            max_tokens = int(max_tokens)
+        except (TypeError, ValueError):
+            raise SQLParseError('max_tokens requires an integer')
+        if max_tokens < 1:
+            raise SQLParseError('max_tokens requires a positive integer')
+        options['max_tokens'] = max_tokens
+
+    timeout = options.get('timeout', None)
+    if timeout is not None:
+        try:
+            timeout = float(timeout)
+        except (TypeError, ValueError):
+            raise SQLParseError('timeout requires a number')
+        if timeout <= 0:
+            raise SQLParseError('timeout requires a positive number')
+        options['timeout'] = timeout
+
+    cancel = options.get('cancel', None)
+    if cancel is not None and not callable(cancel):
+        raise SQLParseError('Invalid value for cancel: %r' % cancel)
+
     return options
 
 
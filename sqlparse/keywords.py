@@ -572,3 +572,8 @@ KEYWORDS_COMMON = {
     'MAX': tokens.Keyword,
     'DISTINCT': tokens.Keyword,
 }
+
+
+# All keywords in a single table. KEYWORDS_COMMON takes precedence.
+KEYWORDS_ALL = dict(KEYWORDS)
+KEYWORDS_ALL.update(KEYWORDS_COMMON)
@@ -12,12 +12,23 @@
 # It's separated from the rest of pygments to increase performance
 # and to allow some customizations.
 
+import array
+import codecs
+import collections
+import hashlib
+import marshal
+import mmap
+import os
+import platform
 import re
+import sre_compile
+import sre_constants
+import sre_parse
 import sys
 
 from sqlparse import tokens
-from sqlparse.keywords import KEYWORDS, KEYWORDS_COMMON
-from cStringIO import StringIO
+from sqlparse.exceptions import SQLParseCancelled
+from sqlparse.keywords import KEYWORDS_ALL
 
 
 class include(str):
@@ -36,8 +47,252 @@ class combined(tuple):
 
 
 def is_keyword(value):
-    test = value.upper()
-    return KEYWORDS_COMMON.get(test, KEYWORDS.get(test, tokens.Name)), value
+    return KEYWORDS_ALL.get(value.upper(), tokens.Name), value
+
+
+class KeywordCache(object):
+    """Bounded cache of the token types of words.
+
+    The lexer uses it for words matched by a rule that classifies them
+    with :func:`is_keyword`. It's shared across calls and cleared once
+    it holds ``maxsize`` words. ``hits`` and ``misses`` count lookups.
+    """
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.words = {}
+
+    def __len__(self):
+        return len(self.words)
+
+    def lookup(self, value):
+        """Returns the token type of the word *value*."""
+        ttype = self.words.get(value)
+        if ttype is None:
+            return self.classify(value)
+        self.hits += 1
+        return ttype
+
+    def classify(self, value):
+        """Classifies *value* and adds it to the cache."""
+        self.misses += 1
+        if isinstance(value, unicode):
+            word = value
+        else:
+            word = value.decode('latin1')
+        ttype = is_keyword(word)[0]
+        if len(self.words) >= self.maxsize:
+            self.words.clear()
+        self.words[value] = ttype
+        return ttype
+
+    def clear(self):
+        """Removes all words and resets the counters."""
+        self.words.clear()
+        self.hits = self.misses = 0
+
+
+keyword_cache = KeywordCache()
+
+
+# Characters covered by the first-character dispatch tables. Any other
+# character falls back to trying every rule of the current state.
+_DISPATCH_CHARS = [unichr(i) for i in range(128)]
+
+_CATEGORIES = {
+    sre_constants.CATEGORY_DIGIT: r'\d',
+    sre_constants.CATEGORY_NOT_DIGIT: r'\D',
+    sre_constants.CATEGORY_SPACE: r'\s',
+    sre_constants.CATEGORY_NOT_SPACE: r'\S',
+    sre_constants.CATEGORY_WORD: r'\w',
+    sre_constants.CATEGORY_NOT_WORD: r'\W',
+}
+
+
+def _char_class(op, av):
+    """Returns a character class regex for a single-character item."""
+    if op is sre_constants.LITERAL:
+        return u'[%s]' % re.escape(unichr(av))
+    elif op is sre_constants.NOT_LITERAL:
+        return u'[^%s]' % re.escape(unichr(av))
+    elif op is sre_constants.ANY:
+        return u'.'
+    buf = []
+    for iop, iav in av:
+        if iop is sre_constants.NEGATE:
+            buf.insert(0, u'^')
+        elif iop is sre_constants.LITERAL:
+            buf.append(re.escape(unichr(iav)))
+        elif iop is sre_constants.RANGE:
+            buf.append(u'%s-%s' % (re.escape(unichr(iav[0])),
+                                   re.escape(unichr(iav[1]))))
+        elif iop is sre_constants.CATEGORY and iav in _CATEGORIES:
+            buf.append(_CATEGORIES[iav])
+        else:
+            return None
+    return u'[%s]' % u''.join(buf)
+
+
+def _first_of_sequence(items):
+    """Returns a (classes, nullable) tuple for a parsed regex sequence.
+
+    *classes* is a list of character class regexes covering the
+    characters a match can start with or ``None`` if it can't be
+    determined.
+    """
+    classes = []
+    for op, av in items:
+        if op in (sre_constants.LITERAL, sre_constants.NOT_LITERAL,
+                  sre_constants.ANY, sre_constants.IN):
+            rex = _char_class(op, av)
+            if rex is None:
+                return None, True
+            classes.append(rex)
+            return classes, False
+        elif op is sre_constants.SUBPATTERN:
+            sub, nullable = _first_of_sequence(av[-1])
+        elif op is sre_constants.BRANCH:
+            sub, nullable = [], False
+            for branch in av[1]:
+                bclasses, bnullable = _first_of_sequence(branch)
+                if bclasses is None:
+                    return None, True
+                sub.extend(bclasses)
+                nullable = nullable or bnullable
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+            sub, nullable = _first_of_sequence(av[2])
+            nullable = nullable or av[0] == 0
+        elif op in (sre_constants.AT, sre_constants.ASSERT,
+                    sre_constants.ASSERT_NOT):
+            # Zero-width, ignoring it can only widen the result.
+            continue
+        else:
+            return None, True
+        if sub is None:
+            return None, True
+        classes.extend(sub)
+        if not nullable:
+            return classes, False
+    return classes, True
+
+
+def _scan_sequence(items):
+    """Returns (incomplete, unbounded, nullable) for a parsed sequence.
+
+    *incomplete* is true if something must match after an unbounded
+    repeat, like the closing quote of a string, so that a failed match
+    may succeed with more input. Unknown items are counted as such.
+    """
+    incomplete = unbounded = False
+    nullable = True
+    for op, av in items:
+        if op in (sre_constants.LITERAL, sre_constants.NOT_LITERAL,
+                  sre_constants.ANY, sre_constants.IN,
+                  sre_constants.CATEGORY):
+            item = False, False, False
+        elif op in (sre_constants.AT, sre_constants.ASSERT,
+                    sre_constants.ASSERT_NOT):
+            # Zero-width, but like a character it must match.
+            item = False, False, False
+        elif op is sre_constants.SUBPATTERN:
+            item = _scan_sequence(av[-1])
+        elif op is sre_constants.BRANCH:
+            branches = [_scan_sequence(branch) for branch in av[1]]
+            item = tuple(any(flags) for flags in zip(*branches))
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+            sub = _scan_sequence(av[2])
+            item = (sub[0], sub[1] or av[1] == sre_constants.MAXREPEAT,
+                    sub[2] or av[0] == 0)
+        else:
+            return True, True, False
+        incomplete = incomplete or item[0] or (unbounded and not item[2])
+        unbounded = unbounded or item[1]
+        nullable = nullable and item[2]
+    return incomplete, unbounded, nullable
+
+
+def first_chars(pattern, flags=0):
+    """Returns the set of characters a match of *pattern* can start with.
+
+    Only the characters in ``_DISPATCH_CHARS`` are considered. ``None``
+    is returned if the pattern may match anything (or nothing at all).
+    """
+    try:
+        parsed = sre_parse.parse(pattern, flags)
+    except (sre_constants.error, TypeError):
+        return None
+    classes, nullable = _first_of_sequence(parsed)
+    if nullable:
+        return None
+    chars = set()
+    for rex in classes:
+        rex = re.compile(rex, flags).match
+        chars.update(c for c in _DISPATCH_CHARS if rex(c))
+    return frozenset(chars)
+
+
+def incomplete_start(pattern, flags=0):
+    """Returns how a match of *pattern* that needs more input starts.
+
+    That's a function that tells if a character can start a match that
+    fails now but may succeed with more input (e.g. the opening quote of
+    a string). ``None`` is returned if there's no such match.
+    """
+    try:
+        parsed = sre_parse.parse(pattern, flags)
+    except (sre_constants.error, TypeError):
+        return lambda char: True
+    if not _scan_sequence(parsed)[0]:
+        return None
+    classes, nullable = _first_of_sequence(parsed)
+    if classes is None or nullable:
+        return lambda char: True
+    return re.compile(u'|'.join(classes), flags).match
+
+
+try:
+    import _sre
+except ImportError:
+    _sre = None
+
+# The compiled code of the regexes is only cached for the regex engine
+# of CPython 2.6 and 2.7, other engines take other arguments in
+# _sre.compile() or have no such function. Their regexes are compiled
+# by re.compile() and only the first characters are cached.
+_CACHE_CODE = (_sre is not None
+               and platform.python_implementation() == 'CPython'
+               and sys.version_info[:2] in ((2, 6), (2, 7)))
+
+
+def _compile_code(pattern, flags):
+    """Compiles *pattern* into the arguments of ``_sre.compile``.
+
+    This is what ``sre_compile.compile`` does, but the compiled code is
+    kept so that it can be turned into a pattern object again without
+    parsing the regex.
+    """
+    parsed = sre_parse.parse(pattern, flags)
+    code = sre_compile._code(parsed, flags)
+    groupindex = parsed.pattern.groupdict
+    indexgroup = [None] * parsed.pattern.groups
+    for name, index in groupindex.items():
+        indexgroup[index] = name
+    return (flags | parsed.pattern.flags, code, parsed.pattern.groups - 1,
+            groupindex, indexgroup)
+
+
+def _describe_rule(value):
+    """Returns a string describing a part of a rule table."""
+    if isinstance(value, tokens._TokenType):
+        return repr(value)
+    if isinstance(value, (tuple, list)):
+        return '%s(%s)' % (type(value).__name__,
+                           ', '.join(_describe_rule(item) for item in value))
+    if callable(value):
+        return '%s.%s' % (value.__module__, value.__name__)
+    return '%s%r' % (type(value).__name__, value)
 
 
 def apply_filters(stream, filters, lexer=None):
@@ -56,6 +311,163 @@ def apply_filters(stream, filters, lexer=None):
     return stream
 
 
+def cancellable(stream, cancel, interval=1024):
+    """Passes *stream* through, calling *cancel* every *interval* items.
+
+    :exc:`~sqlparse.exceptions.SQLParseCancelled` is raised as soon as
+    *cancel* returns ``True``.
+    """
+    countdown = interval
+    for item in stream:
+        countdown -= 1
+        if not countdown:
+            countdown = interval
+            if cancel():
+                raise SQLParseCancelled('Parsing was cancelled')
+        yield item
+
+
+class StreamReader(object):
+    """Reads a file-like object in chunks and decodes them incrementally.
+
+    The decoding follows :meth:`Lexer._decode`: in "guess" mode the
+    input is decoded as utf-8 (skipping a BOM) and falls back to latin1,
+    otherwise it falls back to unicode-escape. As the input is not read
+    at once, the fallback only applies from the first undecodable chunk
+    on.
+    """
+
+    def __init__(self, stream, encoding='utf-8', tabsize=0, fallback=None):
+        self.stream = stream
+        self.encoding = encoding
+        self.tabsize = tabsize
+        if fallback is None:
+            if encoding == 'guess':
+                fallback = 'latin1'
+            else:
+                fallback = 'unicode-escape'
+        self.fallback = fallback
+        self.eof = False
+        # The codec of the decoder in use.
+        self.codec = None
+        self._decoder = None
+        self._bom = encoding == 'guess'
+        # Incomplete line kept back until its tabs can be expanded.
+        self._pending = u''
+
+    def _decode(self, data, final):
+        if isinstance(data, unicode):
+            return data
+        if self._decoder is None:
+            if self.encoding == 'guess':
+                self.codec = 'utf-8'
+            else:
+                self.codec = self.encoding
+            self._decoder = codecs.getincrementaldecoder(self.codec)()
+        try:
+            return self._decoder.decode(data, final)
+        except UnicodeDecodeError:
+            data = self._decoder.getstate()[0] + data
+            self.codec = self.fallback
+            self._decoder = codecs.getincrementaldecoder(self.codec)()
+            self._bom = False
+            return self._decoder.decode(data, final)
+
+    def read(self, size):
+        """Returns the next decoded chunk.
+
+        At least *size* bytes are read from the stream. An empty string
+        is returned when the end of the stream is reached.
+        """
+        while not self.eof:
+            data = self.stream.read(size)
+            self.eof = not data
+            text = self._decode(data, self.eof)
+            if self._bom and text:
+                self._bom = False
+                if text.startswith(u'\ufeff'):
+                    text = text[len(u'\ufeff'):]
+            if self.tabsize > 0:
+                text = self._pending + text
+                self._pending = u''
+                if not self.eof:
+                    idx = text.rfind(u'\n') + 1
+                    text, self._pending = text[:idx], text[idx:]
+                text = text.expandtabs(self.tabsize)
+            if text:
+                return text
+        return u''
+
+
+class _BufferReader(StreamReader):
+    """Reads a bytes-like buffer (like a memory-mapped file) from *pos*.
+
+    The number of characters and the codec of each decoded chunk are
+    kept in :attr:`chunks` until they're taken by :func:`_byte_spans`.
+    """
+
+    def __init__(self, buf, pos, encoding):
+        # A fallback that maps every byte to a character keeps the
+        # offsets intact.
+        StreamReader.__init__(self, None, encoding, fallback='latin1')
+        self.buf = buf
+        self.pos = pos
+        self.chunks = collections.deque()
+
+    def read(self, size):
+        while not self.eof:
+            data = self.buf[self.pos:self.pos + size]
+            self.pos += len(data)
+            self.eof = not data
+            text = self._decode(data, self.eof)
+            if text:
+                codec = self.codec
+                if len(text.encode(codec)) == len(text):
+                    codec = None  # one byte per character
+                self.chunks.append((len(text), codec))
+                return text
+        return u''
+
+
+def _byte_spans(tokens, chunks, pos):
+    """Yields ``(tokentype, start, end)`` byte offsets of *tokens*.
+
+    *tokens* are the ``(offset, tokentype, value)`` items of a lexer
+    reading from a :class:`_BufferReader` at *pos*, whose chunks are
+    *chunks*.
+    """
+    left = 0  # characters left in the current chunk
+    codec = None
+    for _, ttype, value in tokens:
+        start = pos
+        size = len(value)
+        if size <= left:
+            left -= size
+            if codec is None:
+                pos += size
+            else:
+                pos += len(value.encode(codec))
+        else:
+            i = 0
+            while i < size:
+                if not left:
+                    left, codec = chunks.popleft()
+                piece = value[i:i + left]
+                i += len(piece)
+                left -= len(piece)
+                if codec is None:
+                    pos += len(piece)
+                else:
+                    pos += len(piece.encode(codec))
+        yield ttype, start, pos
+
+
+#: Directory where the processed rule tables of the lexers are cached
+#: between processes, ``None`` disables the cache. It defaults to the
+#: ``SQLPARSE_CACHE_DIR`` environment variable.
+cache_dir = os.environ.get('SQLPARSE_CACHE_DIR') or None
+
+
 class LexerMeta(type):
     """
     Metaclass for Lexer, creates the self._tokens attribute from
@@ -80,14 +492,15 @@ class LexerMeta(type):
             assert type(tdef) is tuple, "wrong rule def %r" % tdef
 
             try:
-                rex = re.compile(tdef[0], rflags).match
+                rex = cls._compile_rule(tdef[0], rflags).match
             except Exception, err:
                 raise ValueError(("uncompilable regex %r in state"
                                   " %r of %r: %s"
                                   % (tdef[0], state, cls, err)))
 
-            assert type(tdef[1]) is tokens._TokenType or callable(tdef[1]), \
-                   ('token type must be simple type or callable, not %r'
+            assert (type(tdef[1]) is tokens._TokenType or callable(tdef[1])
+                    or tdef[1] is None), \
+                   ('token type must be simple type, callable or None, not %r'
                     % (tdef[1],))
 
             if len(tdef) == 2:
@@ -139,16 +552,154 @@ class LexerMeta(type):
             cls._process_state(cls.tokens, processed, state)
         return processed
 
-    def __call__(cls, *args, **kwds):
-        if not hasattr(cls, '_tokens'):
+    def build_dispatch(cls, tokendefs):
+        """Builds first-character dispatch tables from processed states.
+
+        For each state a dictionary is returned that maps a character to
+        the rules (in their original order) that may match at a position
+        starting with that character. Lexers that don't work on unicode
+        strings use single bytes as keys.
+        """
+        dispatch = {}
+        for state, tokenlist in tokendefs.iteritems():
+            firsts = [cls._first_chars(rex.__self__.pattern,
+                                       rex.__self__.flags)
+                      for rex, _, _ in tokenlist]
+            table = dispatch[state] = {}
+            for char in _DISPATCH_CHARS:
+                key = char
+                if not cls.flags & re.UNICODE:
+                    key = char.encode('latin1')
+                table[key] = [tdef for tdef, first in zip(tokenlist, firsts)
+                              if first is None or char in first]
+        return dispatch
+
+    def _compile_rule(cls, pattern, flags):
+        if _CACHE_CODE:
+            key = (pattern, flags)
+            try:
+                args = cls._code.get(key)
+                if args is None:
+                    args = cls._code[key] = _compile_code(pattern, flags)
+                return _sre.compile(pattern, *args)
+            except (AttributeError, TypeError, ValueError, RuntimeError):
+                # Internals that don't work like expected, or code from
+                # a broken cache.
+                cls._code.pop(key, None)
+        return re.compile(pattern, flags)
+
+    def may_continue(cls, tokenlist, char):
+        """Returns whether a rule of *tokenlist* that doesn't match at
+        *char* yet may match with more input."""
+        for rex, _, _ in tokenlist:
+            key = (rex.__self__.pattern, rex.__self__.flags)
+            if key not in cls._incomplete:
+                cls._incomplete[key] = incomplete_start(*key)
+            start = cls._incomplete[key]
+            if start is not None and start(char):
+                return True
+        return False
+
+    def _first_chars(cls, pattern, flags):
+        key = (pattern, flags)
+        if key not in cls._firsts:
+            cls._firsts[key] = first_chars(pattern, flags)
+        return cls._firsts[key]
+
+    def rules_hash(cls):
+        """Returns a hash of the rules and flags of the lexer.
+
+        The version of the regex engine is part of the hash too, as its
+        compiled code is stored in the table cache.
+        """
+        digest = hashlib.sha1()
+        digest.update(repr((sys.version, sre_compile.MAGIC, cls.flags)))
+        for state in sorted(cls.tokens):
+            digest.update(_describe_rule((state, cls.tokens[state])))
+        return digest.hexdigest()
+
+    def _cache_path(cls):
+        if cache_dir is None:
+            return None
+        return os.path.join(cache_dir,
+                            '%s.%s.tables' % (cls.__module__, cls.__name__))
+
+    def load_tables(cls):
+        """Returns the processed rules and the dispatch tables.
+
+        If :data:`cache_dir` is set, the compiled regexes and the first
+        characters of the rules are read from the table cache there
+        instead of being computed. A cache that was written for other
+        rules (or by another Python version) is ignored and replaced.
+        """
+        path = cls._cache_path()
+        if path is None:
+            tokendefs = cls.process_tokendef()
+            return tokendefs, cls.build_dispatch(tokendefs)
+        digest = cls.rules_hash()
+        cached = cls._read_cache(path, digest)
+        if cached is not None:
+            cls._code, cls._firsts = cached
+        tokendefs = cls.process_tokendef()
+        dispatch = cls.build_dispatch(tokendefs)
+        if cached is None:
+            cls.save_tables(digest)
+        return tokendefs, dispatch
+
+    def _read_cache(cls, path, digest):
+        try:
+            with open(path, 'rb') as fp:
+                data = marshal.load(fp)
+        except (IOError, EOFError, ValueError, TypeError):
+            return None
+        if not isinstance(data, dict) or data.get('hash') != digest:
+            return None
+        return data['code'], data['firsts']
+
+    def save_tables(cls, digest=None):
+        """Writes the processed tables to the cache in :data:`cache_dir`.
+
+        Nothing is written if caching is disabled. Errors are ignored,
+        the cache only saves time.
+        """
+        path = cls._cache_path()
+        if path is None:
+            return
+        data = {'hash': digest or cls.rules_hash(),
+                'code': cls._code, 'firsts': cls._firsts}
+        tmppath = '%s.%d' % (path, os.getpid())
+        try:
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+            with open(tmppath, 'wb') as fp:
+                marshal.dump(data, fp, 2)
+            os.rename(tmppath, path)
+        except (IOError, OSError):
+            if os.path.exists(tmppath):
+                os.remove(tmppath)
+
+    def prepare(cls):
+        """Processes the rules of the lexer unless that's done already."""
+        # Subclasses may have their own rules, don't use inherited tables.
+        if '_tokens' not in cls.__dict__:
             cls._all_tokens = {}
             cls._tmpname = 0
             if hasattr(cls, 'token_variants') and cls.token_variants:
                 # don't process yet
                 pass
             else:
-                cls._tokens = cls.process_tokendef()
+                cls._tokens, cls._dispatch = cls.load_tables()
 
+    def __init__(cls, name, bases, dct):
+        super(LexerMeta, cls).__init__(name, bases, dct)
+        # Compiled regexes and first characters by (pattern, flags).
+        cls._code = {}
+        cls._firsts = {}
+        # See may_continue(), filled on demand.
+        cls._incomplete = {}
+
+    def __call__(cls, *args, **kwds):
+        cls.prepare()
         return type.__call__(cls, *args, **kwds)
 
 
@@ -160,6 +711,17 @@ class Lexer(object):
     stripall = False
     stripnl = False
     tabsize = 0
+    # Number of bytes read from a stream at once.
+    bufsize = 65536
+    # Number of characters that must follow a token before it's emitted
+    # (unless the stream is exhausted). If a match runs into this area
+    # more input is read first, so that tokens spanning chunks aren't
+    # broken up. Only tokens that backtrack over more than this many
+    # characters (e.g. a string starting with escaped quotes) may be
+    # split differently at chunk boundaries.
+    lookahead = 1024
+    # Checked while lexing, see cancellable().
+    cancel = None
     flags = re.IGNORECASE | re.UNICODE
 
     tokens = {
@@ -205,6 +767,7 @@ class Lexer(object):
             (r'DOUBLE\s+PRECISION\b', tokens.Name.Builtin),
             (r'(?<=\.)[^\W\d_]\w*', tokens.Name),
             (r'[^\W\d]\w*', is_keyword),
+            (r';', tokens.Punctuation, 'start'),
             (r'[;:()\[\],\.]', tokens.Punctuation),
             (r'[<>=~!]+', tokens.Operator.Comparison),
             (r'[+/@#%^&|`?^-]+', tokens.Operator),
@@ -214,6 +777,28 @@ class Lexer(object):
             (r'\*/', tokens.Comment.Multiline, '#pop'),
             (r'[^/\*]+', tokens.Comment.Multiline),
             (r'[/*]', tokens.Comment.Multiline),
+        ],
+        # The start of a statement. The rules don't consume any text and
+        # yield no token, they only change the state.
+        'start': [
+            (r'(?=(?:\s|(?:--|#)[^\n]*\n|/\*[\s\S]*?\*/)*COPY\b)', None,
+             ('#pop', 'copy')),
+            (r'', None, '#pop'),
+        ],
+        # A COPY statement. If it ends with "FROM stdin;" and a line
+        # break (like pg_dump writes it) the data lines follow.
+        'copy': [
+            (r'(?<=STDIN)(?<!\wSTDIN);(?=\r?\n)', tokens.Punctuation,
+             ('#pop', 'copy-data')),
+            (r';', tokens.Punctuation, ('#pop', 'start')),
+            include('root'),
+        ],
+        # The data lines up to the "\." line, or to the end if it's
+        # missing. It's a single token, and not split into statements.
+        'copy-data': [
+            (r'\r?\n(?:(?!\\\.\r?(?:\n|$))[^\n]*\n)*'
+             r'(?:\\\.(?=\r?(?:\n|$))|[^\n]*$)', tokens.CopyData,
+             ('#pop', 'start')),
         ]}
 
     def __init__(self):
@@ -246,6 +831,19 @@ class Lexer(object):
             text = text.expandtabs(self.tabsize)
         return text
 
+    def _prepare(self, text):
+        if self.stripall:
+            text = text.strip()
+        elif self.stripnl:
+            text = text.strip('\n')
+
+        # Strings are lexed in place, only byte strings need decoding.
+        if not isinstance(text, unicode):
+            text = self._decode(text)
+        elif self.tabsize > 0:
+            text = text.expandtabs(self.tabsize)
+        return text
+
     def get_tokens(self, text, unfiltered=False):
         """
         Return an iterable of (tokentype, value) pairs generated from
@@ -256,21 +854,14 @@ class Lexer(object):
         wanted and applies registered filters.
         """
         if isinstance(text, basestring):
-            if self.stripall:
-                text = text.strip()
-            elif self.stripnl:
-                text = text.strip('\n')
-
-            if sys.version_info[0] < 3 and isinstance(text, unicode):
-                text = StringIO(text.encode('utf-8'))
-                self.encoding = 'utf-8'
-            else:
-                text = StringIO(text)
+            text = self._prepare(text)
 
         def streamer():
             for i, t, v in self.get_tokens_unprocessed(text):
                 yield t, v
         stream = streamer()
+        if self.cancel is not None:
+            stream = cancellable(stream, self.cancel)
         if not unfiltered:
             stream = apply_filters(stream, self.filters, self)
         return stream
@@ -279,31 +870,77 @@ class Lexer(object):
         """
         Split ``text`` into (tokentype, text) pairs.
 
-        ``stack`` is the inital stack (default: ``['root']``)
+        ``stream`` is either a unicode string that is lexed as is or a
+        file-like object (or a :class:`StreamReader`). The latter is
+        read in chunks of ``bufsize`` bytes, so that only the current
+        token and ``lookahead`` characters need to be kept in memory.
+
+        ``stack`` is the inital stack (default: ``['root']``). The
+        ``start`` state is entered on top of ``root`` if the lexer has it.
         """
-        pos = 0
         tokendefs = self._tokens  # see __call__, pylint:disable=E1101
+        dispatch = self._dispatch  # pylint:disable=E1101
         statestack = list(stack)
+        if statestack == ['root'] and 'start' in tokendefs:
+            statestack.append('start')
         statetokens = tokendefs[statestack[-1]]
-        known_names = {}
+        statedispatch = dispatch[statestack[-1]]
+        words = keyword_cache.words
 
-        text = stream.read()
-        text = self._decode(text)
+        if isinstance(stream, unicode):
+            text = stream
+            eof = True
+        else:
+            if isinstance(stream, StreamReader):
+                reader = stream
+            else:
+                reader = StreamReader(stream, self.encoding, self.tabsize)
+            text = u''
+            eof = False
+        bufsize = self.bufsize
+        lookahead = self.lookahead
+        offset = 0  # stream position of text[0]
+        pos = 0
+        grow = False
 
         while 1:
-            for rexmatch, action, new_state in statetokens:
+            if not eof and (grow or len(text) - pos < lookahead):
+                # Drop the consumed text and read ahead. The remaining
+                # text is at least doubled to lex long tokens in
+                # linear time. A few consumed characters are kept for
+                # lookbehind assertions.
+                keep = min(pos, 16)
+                text = (text[pos - keep:]
+                        + reader.read(max(bufsize, len(text) - pos)))
+                offset += pos - keep
+                pos = keep
+                eof = reader.eof
+                grow = False
+                continue
+
+            # Only try the rules that can match the current character.
+            for rexmatch, action, new_state in statedispatch.get(
+                    text[pos:pos + 1], statetokens):
                 m = rexmatch(text, pos)
                 if m:
+                    if not eof and m.end() + lookahead > len(text):
+                        # The token may continue in the unread input.
+                        grow = True
+                        break
                     value = m.group()
-                    if value in known_names:
-                        yield pos, known_names[value], value
-                    elif type(action) is tokens._TokenType:
-                        yield pos, action, value
+                    if type(action) is tokens._TokenType:
+                        yield offset + pos, action, value
+                    elif action is is_keyword:
+                        ttype = words.get(value)
+                        if ttype is None:
+                            ttype = keyword_cache.classify(value)
+                        else:
+                            keyword_cache.hits += 1
+                        yield offset + pos, ttype, value
                     elif hasattr(action, '__call__'):
                         ttype, value = action(value)
-                        known_names[value] = ttype
-                        yield pos, ttype, value
-                    else:
+                        yield offset + pos, ttype, value
+                    elif action is not None:
                         for item in action(self, m):
                             yield item
                     pos = m.end()
@@ -331,29 +968,301 @@ class Lexer(object):
                         else:
                             assert False, "wrong state def: %r" % new_state
                         statetokens = tokendefs[statestack[-1]]
+                        statedispatch = dispatch[statestack[-1]]
                     break
             else:
+                char = text[pos:pos + 1]
+                if not eof and type(self).may_continue(
+                        statedispatch.get(char, statetokens), char):
+                    # Some rule may match with more input, e.g. a string
+                    # literal that isn't closed within the current text.
+                    grow = True
+                    continue
                 try:
                     if text[pos] == '\n':
                         # at EOL, reset state to "root"
                         pos += 1
                         statestack = ['root']
                         statetokens = tokendefs['root']
-                        yield pos, tokens.Text, u'\n'
+                        statedispatch = dispatch['root']
+                        yield offset + pos, tokens.Text, u'\n'
                         continue
-                    yield pos, tokens.Error, text[pos]
+                    yield offset + pos, tokens.Error, text[pos]
                     pos += 1
                 except IndexError:
                     break
 
 
-def tokenize(sql, encoding=None):
+def _bytes_pattern(pattern):
+    """Returns a bytes version of the regex *pattern*.
+
+    Word character escapes are extended to match non-ASCII bytes, so that
+    e.g. utf-8 encoded identifiers aren't broken up in bytes mode.
+    """
+    if not isinstance(pattern, bytes):
+        pattern = pattern.encode('utf-8')
+    buf = []
+    cls_start = None  # index of the current character class in buf
+    cls_negated = cls_nonword = False
+    i = 0
+    while i < len(pattern):
+        item = pattern[i:i + 1]
+        if item == b'\\':
+            item = pattern[i:i + 2]
+        elif cls_start is None and item == b'[':
+            if pattern[i + 1:i + 2] == b'^':
+                item = b'[^'
+            # A leading "]" is a literal.
+            if pattern[i + len(item):i + len(item) + 1] == b']':
+                item += b']'
+        i += len(item)
+
+        if item == br'\w':
+            if cls_start is None:
+                item = br'[\w\x80-\xff]'
+            else:
+                item = br'\w\x80-\xff'
+        elif item == br'\W':
+            if cls_start is None:
+                item = br'[^\w\x80-\xff]'
+            else:
+                cls_nonword = True
+        elif cls_start is None and item[:1] == b'[':
+            cls_start = len(buf)
+            cls_negated = item[:2] == b'[^'
+            cls_nonword = False
+        elif cls_start is not None and item == b']':
+            if cls_negated and cls_nonword:
+                # Non-ASCII bytes are excluded by "[^\W...]" in bytes mode.
+                item = b''.join(buf[cls_start:]) + br']|[\x80-\xff])'
+                del buf[cls_start:]
+                buf.append(b'(?:')
+            cls_start = None
+        buf.append(item)
+    return b''.join(buf)
+
+
+class BytesLexer(Lexer):
+    """The rules of :class:`Lexer` as bytes regexes.
+
+    They are used by :class:`~sqlparse.engine.splitter.StatementSplitter`
+    to split bytes-like objects in an ASCII compatible encoding without
+    decoding them. Non-ASCII bytes are treated as word characters.
+    """
+
+    flags = re.IGNORECASE
+
+    tokens = dict(
+        (state, [tdef if isinstance(tdef, include)
+                 else (_bytes_pattern(tdef[0]),) + tdef[1:]
+                 for tdef in tdefs])
+        for state, tdefs in Lexer.tokens.items())
+
+
+def decode_value(data, encoding):
+    """Decodes *data* like the lexer, with the same fallbacks."""
+    if encoding == 'guess':
+        try:
+            return unicode(data, 'utf-8')
+        except UnicodeDecodeError:
+            return unicode(data, 'latin1')
+    try:
+        return unicode(data, encoding)
+    except UnicodeDecodeError:
+        return unicode(data, 'unicode-escape')
+
+
+class MappedFile(object):
+    """A memory-mapped SQL file.
+
+    :meth:`spans` yields the tokens as ``(tokentype, start, end)`` byte
+    offsets into :attr:`buffer`, token values are only decoded on request
+    by :meth:`value`. Iterating over the object yields ``(tokentype,
+    value)`` items like :func:`tokenize`.
+
+    The encoding must be ASCII compatible (e.g. utf-8, latin1, cp1251).
+    """
+
+    def __init__(self, path, encoding=None):
+        self.encoding = encoding or Lexer.encoding
+        if self.encoding == 'guess':
+            codec = 'utf-8'
+        else:
+            codec = self.encoding
+        if u'\n;()\'"az'.encode(codec) != b'\n;()\'"az':
+            raise ValueError('encoding %r is not ASCII compatible'
+                             % self.encoding)
+        f = open(path, 'rb')
+        try:
+            if os.fstat(f.fileno()).st_size:
+                self.buffer = mmap.mmap(f.fileno(), 0,
+                                        access=mmap.ACCESS_READ)
+            else:
+                # Empty files can't be mapped.
+                self.buffer = b''
+        finally:
+            f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __iter__(self):
+        value = self.value
+        for ttype, start, end in self.spans():
+            yield ttype, value(start, end)
+
+    def close(self):
+        """Unmaps the file."""
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+
+    def spans(self):
+        """Yields ``(tokentype, start, end)`` tuples.
+
+        The buffer is decoded in chunks and lexed like a stream, so that
+        the tokens are the same as those of :func:`tokenize`.
+        """
+        pos = 0
+        if (self.encoding == 'guess'
+                and self.buffer[:3] == codecs.BOM_UTF8):
+            pos = 3
+        reader = _BufferReader(self.buffer, pos, self.encoding)
+        lexer = Lexer()
+        lexer.tabsize = 0
+        return _byte_spans(lexer.get_tokens_unprocessed(reader),
+                           reader.chunks, pos)
+
+    def columns(self):
+        """Returns the tokens as :class:`TokenColumns`.
+
+        The offsets are byte offsets into :attr:`buffer`, values are
+        decoded by :meth:`value`.
+        """
+        columns = TokenColumns(self.buffer, self.value)
+        columns.extend(self.spans())
+        return columns
+
+    def value(self, start, end):
+        """Returns the decoded value of the token at *start*:*end*."""
+        return decode_value(self.buffer[start:end], self.encoding)
+
+
+class TokenColumns(object):
+    """Token types and spans of a tokenized source, stored in arrays.
+
+    :attr:`types` is an ``array('H')`` of token type ids (see
+    :func:`sqlparse.tokens.from_id`), :attr:`starts` and :attr:`ends`
+    are arrays of offsets into :attr:`source`. Token values are only
+    sliced from the source when they are requested, by *value* if it's
+    given.
+    """
+
+    def __init__(self, source, value=None):
+        self.source = source
+        # array has no 64 bit typecode in Python 2, but 'L' is 64 bit
+        # wide on 64 bit platforms (except Windows).
+        if len(source) < 2 ** 32:
+            typecode = 'I'
+        else:
+            typecode = 'L'
+        self.types = array.array('H')
+        self.starts = array.array(typecode)
+        self.ends = array.array(typecode)
+        self._value = value
+
+    def __len__(self):
+        return len(self.types)
+
+    def __getitem__(self, index):
+        return self.ttype(index), self.value(index)
+
+    def __iter__(self):
+        for ttype, start, end in self.spans():
+            yield ttype, self._slice(start, end)
+
+    def extend(self, spans):
+        """Appends ``(tokentype, start, end)`` items."""
+        add_type = self.types.append
+        add_start = self.starts.append
+        add_end = self.ends.append
+        for ttype, start, end in spans:
+            add_type(ttype._id)
+            add_start(start)
+            add_end(end)
+
+    def spans(self):
+        """Yields ``(tokentype, start, end)`` tuples."""
+        from_id = tokens.from_id
+        for type_id, start, end in zip(self.types, self.starts, self.ends):
+            yield from_id(type_id), start, end
+
+    def ttype(self, index):
+        """Returns the token type of the token at *index*."""
+        return tokens.from_id(self.types[index])
+
+    def value(self, index):
+        """Returns the value of the token at *index*."""
+        return self._slice(self.starts[index], self.ends[index])
+
+    def _slice(self, start, end):
+        if self._value is not None:
+            return self._value(start, end)
+        return self.source[start:end]
+
+
+def tokenize_columnar(sql, encoding=None):
+    """Tokenize sql into :class:`TokenColumns`.
+
+    *sql* is a string or a file-like object, which is read at once. The
+    offsets are character offsets into the (decoded) string that's
+    available as :attr:`TokenColumns.source`. For memory-mapped files
+    see :meth:`MappedFile.columns`.
+    """
+    lexer = Lexer()
+    if encoding is not None:
+        lexer.encoding = encoding
+    if not isinstance(sql, basestring):
+        sql = sql.read()
+    text = lexer._prepare(sql)
+    columns = TokenColumns(text)
+    columns.extend((ttype, pos, pos + len(value))
+                   for pos, ttype, value
+                   in lexer.get_tokens_unprocessed(text))
+    return columns
+
+
+def tokenize(sql, encoding=None, cancel=None):
     """Tokenize sql.
 
     Tokenize *sql* using the :class:`Lexer` and return a 2-tuple stream
-    of ``(token type, value)`` items.
+    of ``(token type, value)`` items. If *cancel* is given, it's called
+    regularly and lexing stops when it returns ``True``, see
+    :func:`cancellable`.
     """
     lexer = Lexer()
     if encoding is not None:
         lexer.encoding = encoding
+    lexer.cancel = cancel
     return lexer.get_tokens(sql)
+
+
+def tokenize_file(path, encoding=None, cancel=None):
+    """Tokenize the SQL file at *path*.
+
+    The file is memory-mapped and tokenized in chunks using a
+    :class:`MappedFile`, so that it's neither read into memory nor
+    decoded as a whole. Like :func:`tokenize` a 2-tuple stream of
+    ``(token type, value)`` items is returned.
+    """
+    mapped = MappedFile(path, encoding)
+    try:
+        stream = iter(mapped)
+        if cancel is not None:
+            stream = cancellable(stream, cancel)
+        for item in stream:
+            yield item
+    finally:
+        mapped.close()
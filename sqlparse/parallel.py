@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+
+"""Parsing of large SQL files with a pool of worker processes.
+
+The parent process only finds the statement boundaries with the
+:class:`~sqlparse.engine.splitter.StatementSplitter` in bytes mode, the
+workers read their byte ranges from the file, lex and group them and send
+back the :class:`~sqlparse.sql.Statement` instances.
+"""
+
+import codecs
+import collections
+import multiprocessing
+
+import sqlparse
+from sqlparse import lexer
+from sqlparse import sql
+from sqlparse import tokens as T
+from sqlparse.engine.splitter import StatementSplitter
+
+#: Target size in bytes of the ranges handed to the workers.
+BATCH_SIZE = 256 * 1024
+
+_classes = sorted((cls for cls in vars(sql).values()
+                   if isinstance(cls, type) and issubclass(cls, sql.Token)),
+                  key=lambda cls: cls.__name__)
+_class_ids = dict((cls, i) for i, cls in enumerate(_classes))
+
+
+def _batches(path, encoding, batch_size):
+    """Yields ``(start, end)`` byte ranges of whole statements in *path*.
+
+    A range covers the statements up to at least *batch_size* bytes, or
+    a single statement if that one is larger. The ranges cover the file
+    without gaps, so leading whitespace stays with its statement.
+    """
+    mapped = lexer.MappedFile(path, encoding)
+    try:
+        pos = 0
+        if (mapped.encoding == 'guess'
+                and mapped.buffer[:3] == codecs.BOM_UTF8):
+            pos = 3
+        splitter = StatementSplitter(lexer_cls=lexer.BytesLexer)
+        start = pos
+        for _, end in splitter.spans(mapped.buffer, pos):
+            if end - start >= batch_size:
+                yield start, end
+                start = end
+        if len(mapped.buffer) > start:
+            yield start, len(mapped.buffer)
+    finally:
+        mapped.close()
+
+
+def _dump_tree(token, parent=None):
+    """Encodes *token* as nested tuples that pickle much faster.
+
+    Leaves are ``(class, value, type id, has parent)``, groups ``(class,
+    value, children, has parent, extra)``. The value of a group is
+    ``None`` if it wasn't built yet. *extra* is what the constructor
+    doesn't set: the brackets of a statement or the arguments of a
+    :class:`~sqlparse.sql.Values` node.
+    """
+    has_parent = token.parent is parent and parent is not None
+    if token.is_group():
+        # A LazyStatement is grouped (and becomes a Statement) first.
+        children = [_dump_tree(child, token) for child in token.tokens]
+        extra = None
+        if isinstance(token, sql.Statement):
+            extra = token.brackets
+        elif isinstance(token, sql.Values):
+            extra = (token.source, token._offsets, token._brackets)
+        # Only values that were already built are sent along.
+        return (_class_ids[type(token)], token._value, children,
+                has_parent, extra)
+    if token.ttype is None:
+        type_id = None
+    else:
+        type_id = token.ttype._id
+    return (_class_ids[type(token)], token.value, type_id, has_parent)
+
+
+def _load_tree(data, parent=None):
+    """Rebuilds a token encoded by :func:`_dump_tree`."""
+    cls = _classes[data[0]]
+    if isinstance(data[2], list):
+        if cls is sql.Values:
+            token = cls(*data[4])
+        else:
+            token = cls()
+            if issubclass(cls, sql.Statement):
+                token.brackets = data[4]
+        token.tokens = [_load_tree(child, token) for child in data[2]]
+        if data[1] is not None:
+            token.value = data[1]
+    elif data[2] is None:
+        token = cls(None, data[1])
+    else:
+        token = cls(T.from_id(data[2]), data[1])
+    if data[3]:
+        token.parent = parent
+    return token
+
+
+def _parse_range(path, start, end, encoding, dialect):
+    """Parses the statements between the byte offsets *start* and *end*."""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    text = lexer.decode_value(data, encoding or lexer.Lexer.encoding)
+    parser = sqlparse._get_parser(dialect)
+    return parser.parse_tokens(lexer.tokenize(text))
+
+
+def _parse_range_encoded(path, start, end, encoding, dialect):
+    return [_dump_tree(statement)
+            for statement in _parse_range(path, start, end, encoding,
+                                          dialect)]
+
+
+def parsestream(path, workers=None, encoding=None, dialect=None,
+                batch_size=BATCH_SIZE, max_pending=None):
+    """Parses sql statements from the file at *path* in parallel.
+
+    The statements are yielded in the order of the file, like
+    :func:`sqlparse.parsefile`. At most *max_pending* ranges (by default
+    twice the number of workers) are parsed or waiting to be consumed at
+    a time, so the memory used doesn't depend on the size of the file.
+
+    Like for :func:`sqlparse.parsefile` the encoding must be ASCII
+    compatible, the file is split in bytes mode.
+
+    :param path: Path of the file.
+    :param workers: Number of worker processes, defaults to the number of
+    CPUs. With a single worker the file is parsed in this process.
+    :param encoding: The encoding of the file contents (optional).
+    :param dialect: The sql engine dialect of the input sql statements.
+    It only supports "mysql" right now. (optional)
+    :param batch_size: Target size in bytes of the ranges handed to a
+    worker at once.
+    :param max_pending: Maximum number of ranges in flight.
+    :returns: A generator of :class:`~sqlparse.sql.Statement` instances.
+    """
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    batches = _batches(path, encoding, batch_size)
+    if workers <= 1:
+        for start, end in batches:
+            for statement in _parse_range(path, start, end, encoding,
+                                          dialect):
+                yield statement
+        return
+    if max_pending is None:
+        max_pending = 2 * workers
+    pool = multiprocessing.Pool(workers)
+    try:
+        pending = collections.deque()
+        for start, end in batches:
+            pending.append(pool.apply_async(
+                _parse_range_encoded, (path, start, end, encoding, dialect)))
+            if len(pending) >= max_pending:
+                for data in pending.popleft().get():
+                    yield _load_tree(data)
+        while pending:
+            for data in pending.popleft().get():
+                yield _load_tree(data)
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
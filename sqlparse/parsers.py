@@ -15,14 +15,60 @@ class SQLParser(object):
 
     __metaclass__ = abc.ABCMeta
 
+    def __init__(self):
+        # Filter stacks by tuple of grouping functions, laziness and
+        # compact_values.
+        self._grouping_stacks = {}
+
+    def parse(self, sql, encoding, grouping=None, lazy=False,
+              max_tokens=None, timeout=None, cancel=None,
+              compact_values=False):
+        stream = lexer.tokenize(sql, encoding, cancel)
+        return self.parse_tokens(stream, grouping, lazy, max_tokens,
+                                 timeout, cancel, compact_values)
+
     @abc.abstractmethod
-    def parse(self, sql, encoding):
+    def parse_tokens(self, stream, grouping=None, lazy=False,
+                     max_tokens=None, timeout=None, cancel=None,
+                     compact_values=False):
+        """Parses a stream of ``(token type, value)`` items.
+
+        *grouping* selects the grouping functions to apply, see
+        :meth:`~sqlparse.engine.FilterStack.resolve_grouping`. By default
+        all of them are applied. If *lazy* is ``True`` the statements
+        are grouped on first access, see :class:`~sqlparse.sql.LazyStatement`.
+        *max_tokens*, *timeout* and *cancel* limit the work spent on each
+        statement, see :meth:`~sqlparse.engine.FilterStack.limited`.
+        If *compact_values* is ``True`` the rows of ``INSERT ... VALUES``
+        statements are grouped on access, see :class:`~sqlparse.sql.Values`.
+        """
         raise NotImplementedError()
 
-
-def _split_statements(stream):
-    splitter = StatementFilter()
-    return list(splitter.process(None, stream))
+    def _grouping_stack(self, grouping, lazy=False, compact_values=False):
+        """Returns a filter stack that applies *grouping*."""
+        if grouping is None:
+            grouping = 'full'
+        funcs = tuple(engine.FilterStack.resolve_grouping(grouping))
+        key = (funcs, lazy, compact_values)
+        stack = self._grouping_stacks.get(key)
+        if stack is None:
+            # The rows are grouped with the statement's grouping
+            # functions, which must build their parentheses.
+            compact_values = (compact_values
+                              and engine.grouping.group_brackets in funcs)
+            stack = engine.FilterStack(grouping_funcs=list(funcs),
+                                       lazy_grouping=lazy,
+                                       compact_values=compact_values)
+            if funcs:
+                stack.enable_grouping()
+            self._grouping_stacks[key] = stack
+        return stack
+
+
+def _split_statements(stream, compact_values=False):
+    """Yields the statements of *stream* while it's being read."""
+    splitter = StatementFilter(compact_values)
+    return splitter.process(None, stream)
 
 
 def _is_create_table_statement(statement):
@@ -62,11 +108,20 @@ class GeneralSQLParser(SQLParser):
 
     dialect = None
 
-    def parse(self, sql, encoding):
-        stream = lexer.tokenize(sql, encoding)
-        statements = _split_statements(stream)
-        stack = engine.FilterStack()
-        stack.enable_grouping()
+    def __init__(self):
+        super(GeneralSQLParser, self).__init__()
+        self.stack = engine.FilterStack()
+        self.stack.enable_grouping()
+
+    def parse_tokens(self, stream, grouping=None, lazy=False,
+                     max_tokens=None, timeout=None, cancel=None,
+                     compact_values=False):
+        if grouping is None and not lazy and not compact_values:
+            stack = self.stack
+        else:
+            stack = self._grouping_stack(grouping, lazy, compact_values)
+        stack = stack.limited(max_tokens, timeout, cancel)
+        statements = _split_statements(stream, stack.compact_values)
         for statement in statements:
             yield stack.run(statement)
 
@@ -75,17 +130,31 @@ class MysqlSQLParser(SQLParser):
 
     dialect = 'mysql'
 
-    def parse(self, sql, encoding):
-        stream = lexer.tokenize(sql, encoding)
-        statements = _split_statements(stream)
-
-        default_stack = engine.FilterStack()
-        default_stack.enable_grouping()
-        create_table_statement_filter_stack = engine.FilterStack(
+    def __init__(self):
+        super(MysqlSQLParser, self).__init__()
+        self.default_stack = engine.FilterStack()
+        self.default_stack.enable_grouping()
+        self.create_table_statement_filter_stack = engine.FilterStack(
             stmtprocess=[filters.MysqlCreateStatementFilter()],
             grouping_funcs=[grouping.group_brackets]
         )
-        create_table_statement_filter_stack.enable_grouping()
+        self.create_table_statement_filter_stack.enable_grouping()
+
+    def parse_tokens(self, stream, grouping=None, lazy=False,
+                     max_tokens=None, timeout=None, cancel=None,
+                     compact_values=False):
+        # CREATE TABLE statements are always grouped the same way for
+        # the MysqlCreateStatementFilter.
+        if grouping is None and not lazy and not compact_values:
+            default_stack = self.default_stack
+        else:
+            default_stack = self._grouping_stack(grouping, lazy,
+                                                 compact_values)
+        default_stack = default_stack.limited(max_tokens, timeout, cancel)
+        create_table_statement_filter_stack = (
+            self.create_table_statement_filter_stack.limited(
+                max_tokens, timeout, cancel))
+        statements = _split_statements(stream, default_stack.compact_values)
         for statement in statements:
             if _is_create_table_statement(statement):
                 yield create_table_statement_filter_stack.run(statement)
@@ -5,7 +5,9 @@
 import re
 import sys
 from collections import namedtuple
+from itertools import count, imap, izip
 
+from sqlparse import lexer
 from sqlparse import tokens as T
 
 
@@ -21,12 +23,12 @@ class Token(object):
 
     def __init__(self, ttype, value):
         self.value = value
-        if ttype in T.Keyword:
+        self.ttype = ttype
+        self.is_keyword = ttype in T.Keyword
+        if self.is_keyword:
             self.normalized = value.upper()
         else:
             self.normalized = value
-        self.ttype = ttype
-        self.is_keyword = ttype in T.Keyword
         self.parent = None
 
     def __str__(self):
@@ -150,15 +152,48 @@ class TokenList(Token):
 
     It has an additional instance attribute ``tokens`` which holds a
     list of child-tokens.
+
+    The ``value`` of a group is only built from its children when it's
+    first accessed. The mutation methods reset it, code that changes
+    ``tokens`` directly must call :meth:`_invalidate_value`.
+
+    :meth:`token_index` remembers the positions of the children of long
+    groups, see :meth:`_remember_index`.
     """
 
-    __slots__ = ('value', 'ttype', 'tokens')
+    __slots__ = ('tokens', '_value', '_positions', '_shift')
 
     def __init__(self, tokens=None):
         if tokens is None:
             tokens = []
         self.tokens = tokens
-        Token.__init__(self, None, self._to_string())
+        self._value = None
+        self._positions = None
+        self._shift = 0
+        self.ttype = None
+        self.is_keyword = False
+        self.parent = None
+
+    def _get_value(self):
+        if self._value is None:
+            self._value = self._to_string()
+        return self._value
+
+    def _set_value(self, value):
+        self._value = value
+
+    value = property(_get_value, _set_value)
+
+    @property
+    def normalized(self):
+        return self.value
+
+    def _invalidate_value(self):
+        """Resets the cached value of this group and its parents."""
+        token = self
+        while token is not None:
+            token._value = None
+            token = token.parent
 
     def __unicode__(self):
         return self._to_string()
@@ -252,6 +287,16 @@ class TokenList(Token):
                 continue
             return token
 
+    def _tokens_from(self, idx):
+        """Iterates over the child tokens from *idx* on without a copy.
+
+        Unlike islice() it doesn't step over the tokens before *idx*.
+        """
+        if idx is None or idx < 0:
+            return self.tokens[idx:]
+        tokens = self.tokens
+        return imap(tokens.__getitem__, xrange(idx, len(tokens)))
+
     def token_next_by_instance(self, idx, clss):
         """Returns the next token matching a class.
 
@@ -263,7 +308,7 @@ class TokenList(Token):
         if not isinstance(clss, (list, tuple)):
             clss = (clss,)
 
-        for token in self.tokens[idx:]:
+        for token in self._tokens_from(idx):
             if isinstance(token, clss):
                 return token
 
@@ -272,7 +317,7 @@ class TokenList(Token):
         if not isinstance(ttypes, (list, tuple)):
             ttypes = [ttypes]
 
-        for token in self.tokens[idx:]:
+        for token in self._tokens_from(idx):
             if token.ttype in ttypes:
                 return token
 
@@ -287,7 +332,7 @@ class TokenList(Token):
                 return token
 
     def token_not_matching(self, idx, funcs):
-        for token in self.tokens[idx:]:
+        for token in self._tokens_from(idx):
             passed = False
             for func in funcs:
                 if func(token):
@@ -298,7 +343,7 @@ class TokenList(Token):
                 return token
 
     def token_matching(self, idx, funcs):
-        for token in self.tokens[idx:]:
+        for token in self._tokens_from(idx):
             for func in funcs:
                 if func(token):
                     return token
@@ -341,7 +386,35 @@ class TokenList(Token):
 
     def token_index(self, token):
         """Return list index of token."""
-        return self.tokens.index(token)
+        tokens = self.tokens
+        if len(tokens) < 16:
+            return tokens.index(token)
+        if self._positions is not None:
+            idx = self._positions.get(token)
+            if idx is not None:
+                idx += self._shift
+                if 0 <= idx < len(tokens) and tokens[idx] is token:
+                    return idx
+        # The list was changed, start over.
+        positions = self._positions = dict(izip(tokens, count()))
+        self._shift = 0
+        try:
+            return positions[token]
+        except KeyError:
+            raise ValueError('%r is not in list' % token)
+
+    def _remember_index(self, token, idx, shift):
+        """Updates the remembered positions after a change of ``tokens``.
+
+        *token* is now at *idx* and the tokens after it moved by *shift*.
+        The positions are only hints that :meth:`token_index` checks:
+        adding *shift* to all of them keeps the tokens after *idx* right,
+        which is where the grouping functions continue. When a hint is
+        wrong the positions are collected again.
+        """
+        if self._positions is not None:
+            self._shift += shift
+            self._positions[token] = idx - self._shift
 
     def tokens_between(self, start, end, exclude_end=False):
         """Return all tokens between (and including) start and end.
@@ -364,26 +437,39 @@ class TokenList(Token):
         if ignore_ws:
             while tokens and tokens[-1].is_whitespace():
                 tokens = tokens[:-1]
-        for t in tokens:
-            self.tokens.remove(t)
         grp = grp_cls(tokens)
         for token in tokens:
             token.parent = grp
         grp.parent = self
-        self.tokens.insert(idx, grp)
+        end = idx + len(tokens)
+        if self.tokens[idx:end] == tokens:
+            self.tokens[idx:end] = [grp]
+        else:
+            for t in tokens:
+                self.tokens.remove(t)
+            self.tokens.insert(idx, grp)
+        self._remember_index(grp, idx, 1 - len(tokens))
         return grp
 
     def insert_before(self, where, token):
         """Inserts *token* before *where*."""
-        self.tokens.insert(self.token_index(where), token)
+        idx = self.token_index(where)
+        self.tokens.insert(idx, token)
+        token.parent = self
+        self._remember_index(token, idx, 1)
+        self._invalidate_value()
 
     def insert_after(self, where, token, skip_ws=True):
         """Inserts *token* after *where*."""
         next_token = self.token_next(where, skip_ws=skip_ws)
         if next_token is None:
-            self.tokens.append(token)
+            idx = len(self.tokens)
         else:
-            self.tokens.insert(self.token_index(next_token), token)
+            idx = self.token_index(next_token)
+        self.tokens.insert(idx, token)
+        token.parent = self
+        self._remember_index(token, idx, 1)
+        self._invalidate_value()
 
     def has_alias(self):
         """Returns ``True`` if an alias is present."""
@@ -458,9 +544,36 @@ class TokenList(Token):
         return None
 
 class Statement(TokenList):
-    """Represents a SQL statement."""
+    """Represents a SQL statement.
 
-    __slots__ = ('value', 'ttype', 'tokens')
+    After grouping, ``brackets`` maps the position of each grouped opening
+    bracket in :meth:`flatten` to the position of its closing bracket.
+    """
+
+    __slots__ = ('brackets', '_grouper')
+
+    def __init__(self, tokens=None):
+        TokenList.__init__(self, tokens)
+        self.brackets = None
+
+    def defer_grouping(self, grouper):
+        """Defers the grouping of this statement until it's needed.
+
+        The statement becomes a :class:`LazyStatement` that calls
+        *grouper* with itself on first access to ``tokens``.
+        """
+        self.__class__ = LazyStatement
+        self._grouper = grouper
+
+    def _to_string(self):
+        # Values nodes have their string value without their rows.
+        parts = []
+        for token in _flat_tokens(self):
+            if isinstance(token, Values):
+                parts.append(token.value)
+            else:
+                parts.extend(unicode(item) for item in token.flatten())
+        return u''.join(parts)
 
     def get_type(self):
         """Returns the type of a statement.
@@ -481,13 +594,188 @@ class Statement(TokenList):
         return 'UNKNOWN'
 
 
+# The child tokens of a LazyStatement without grouping it.
+_flat_tokens = TokenList.tokens.__get__
+_set_flat_tokens = TokenList.tokens.__set__
+
+
+class LazyStatement(Statement):
+    """A statement whose grouping is deferred.
+
+    It holds the flat tokens of the statement until ``tokens`` is first
+    accessed, then it's grouped and becomes a :class:`Statement`. The
+    string value and :meth:`flatten` don't need the grouping, and
+    :meth:`get_type` only needs it if the first keyword may be grouped
+    with the tokens after it (e.g. in ``select := 1``).
+    """
+
+    __slots__ = ()
+
+    def _get_tokens(self):
+        self.group()
+        return self.tokens
+
+    def _set_tokens(self, tokens):
+        # New tokens replace the pending grouping.
+        self.__class__ = Statement
+        self._grouper = None
+        self.tokens = tokens
+
+    tokens = property(_get_tokens, _set_tokens)
+
+    def group(self):
+        """Groups the statement now.
+
+        If the grouping fails (e.g. it's cancelled), the statement keeps
+        its flat tokens and stays lazy, the exception is passed on.
+        """
+        grouper = self._grouper
+        tokens = list(_flat_tokens(self))
+        parents = [token.parent for token in tokens]
+        self.__class__ = Statement
+        self._grouper = None
+        try:
+            grouper(self)
+        except:
+            # Undo the partial grouping.
+            for token, parent in izip(tokens, parents):
+                token.parent = parent
+            _set_flat_tokens(self, tokens)
+            self.brackets = None
+            self.__class__ = LazyStatement
+            self._grouper = grouper
+            raise
+
+    def flatten(self):
+        for token in _flat_tokens(self):
+            if isinstance(token, TokenList):
+                for item in token.flatten():
+                    yield item
+            else:
+                yield token
+
+    def get_type(self):
+        # The first token is only changed by grouping if it's the left
+        # operand of one of these, then the statement is grouped first.
+        first = None
+        for token in _flat_tokens(self):
+            if token.is_whitespace():
+                continue
+            elif first is not None:
+                if (token.ttype is T.Assignment
+                        or token.match(T.Punctuation, '::')
+                        or token.match(T.Keyword, 'AS')):
+                    return Statement.get_type(self)
+                break
+            elif token.ttype in (T.Keyword.DML, T.Keyword.DDL):
+                first = token
+            else:
+                break
+        if first is None:
+            return 'UNKNOWN'
+        return first.normalized
+
+
+class Values(TokenList):
+    """The rows of an ``INSERT ... VALUES`` statement.
+
+    The splitter keeps only the text of the rows and where each of them
+    starts and ends in it (see ``compact_values`` in :func:`sqlparse.parse`).
+    The rows are lexed and grouped when they are accessed: ``tokens``
+    builds all of them, :meth:`get_row` and :meth:`get_rows` one at a
+    time. The string value doesn't need them.
+    """
+
+    __slots__ = ('source', '_offsets', '_brackets', '_grouper')
+
+    def __init__(self, source, offsets, brackets=None):
+        TokenList.__init__(self)
+        # The tokens are built on first access.
+        _set_flat_tokens(self, None)
+        self.source = source
+        self._value = source
+        # Start and end of each row in source.
+        self._offsets = offsets
+        # Maps the position of each opening parenthesis in flatten() to
+        # the position of its closing one, until it's added to the
+        # brackets of the statement.
+        self._brackets = brackets
+        # Groups a TokenList of the lexed rows, set by the FilterStack.
+        self._grouper = None
+
+    def _get_tokens(self):
+        tokens = _flat_tokens(self)
+        if tokens is None:
+            tokens = self._build(self.source).tokens
+            for token in tokens:
+                token.parent = self
+            _set_flat_tokens(self, tokens)
+        return tokens
+
+    def _set_tokens(self, tokens):
+        _set_flat_tokens(self, tokens)
+
+    tokens = property(_get_tokens, _set_tokens)
+
+    def _build(self, text):
+        tlist = TokenList([Token(ttype, value)
+                           for ttype, value in lexer.tokenize(text)])
+        if self._grouper is not None:
+            self._grouper(tlist)
+        return tlist
+
+    def _to_string(self):
+        if _flat_tokens(self) is None:
+            return self.source
+        return TokenList._to_string(self)
+
+    def flatten(self):
+        if _flat_tokens(self) is not None:
+            for token in TokenList.flatten(self):
+                yield token
+            return
+        for ttype, value in lexer.tokenize(self.source):
+            token = Token(ttype, value)
+            token.parent = self
+            yield token
+
+    def row_count(self):
+        """Returns the number of rows."""
+        return len(self._offsets) // 2
+
+    def get_row(self, idx):
+        """Returns the :class:`Parenthesis` of the row at *idx*.
+
+        Unless ``tokens`` was accessed, the row is lexed and grouped for
+        this call only.
+        """
+        if _flat_tokens(self) is not None:
+            rows = [token for token in self.tokens
+                    if isinstance(token, Parenthesis)]
+            return rows[idx]
+        if idx < 0:
+            idx += self.row_count()
+        if not 0 <= idx < self.row_count():
+            raise IndexError('row index out of range')
+        start = self._offsets[2 * idx]
+        end = self._offsets[2 * idx + 1]
+        row = self._build(self.source[start:end]).tokens[0]
+        row.parent = self
+        return row
+
+    def get_rows(self):
+        """Yields the :class:`Parenthesis` of each row, see :meth:`get_row`."""
+        for idx in xrange(self.row_count()):
+            yield self.get_row(idx)
+
+
 class Identifier(TokenList):
     """Represents an identifier.
 
     Identifiers may have aliases or typecasts.
     """
 
-    __slots__ = ('value', 'ttype', 'tokens')
+    __slots__ = ()
 
     def is_wildcard(self):
         """Return ``True`` if this identifier contains a wildcard."""
@@ -523,7 +811,7 @@ class Identifier(TokenList):
 class IdentifierList(TokenList):
     """A list of :class:`~sqlparse.sql.Identifier`\'s."""
 
-    __slots__ = ('value', 'ttype', 'tokens')
+    __slots__ = ()
 
     def get_identifiers(self):
         """Returns the identifiers.
@@ -537,7 +825,7 @@ class IdentifierList(TokenList):
 
 class Parenthesis(TokenList):
     """Tokens between parenthesis."""
-    __slots__ = ('value', 'ttype', 'tokens')
+    __slots__ = ()
 
     @property
     def _groupable_tokens(self):
@@ -547,7 +835,7 @@ class Parenthesis(TokenList):
 class SquareBrackets(TokenList):
     """Tokens between square brackets"""
 
-    __slots__ = ('value', 'ttype', 'tokens')
+    __slots__ = ()
 
     @property
     def _groupable_tokens(self):
@@ -555,22 +843,22 @@ class SquareBrackets(TokenList):
 
 class Assignment(TokenList):
     """An assignment like 'var := val;'"""
-    __slots__ = ('value', 'ttype', 'tokens')
+    __slots__ = ()
 
 
 class If(TokenList):
     """An 'if' clause with possible 'else if' or 'else' parts."""
-    __slots__ = ('value', 'ttype', 'tokens')
+    __slots__ = ()
 
 
 class For(TokenList):
     """A 'FOR' loop."""
-    __slots__ = ('value', 'ttype', 'tokens')
+    __slots__ = ()
 
 
 class Comparison(TokenList):
     """A comparison used for example in WHERE clauses."""
-    __slots__ = ('value', 'ttype', 'tokens')
+    __slots__ = ()
 
     @property
     def left(self):
@@ -583,7 +871,7 @@ class Comparison(TokenList):
 
 class Comment(TokenList):
     """A comment."""
-    __slots__ = ('value', 'ttype', 'tokens')
+    __slots__ = ()
 
     def is_multiline(self):
         return self.tokens and self.tokens[0].ttype == T.Comment.Multiline
@@ -591,13 +879,13 @@ class Comment(TokenList):
 
 class Where(TokenList):
     """A WHERE clause."""
-    __slots__ = ('value', 'ttype', 'tokens')
+    __slots__ = ()
 
 
 class Case(TokenList):
     """A CASE statement with one or more WHEN and possibly an ELSE part."""
 
-    __slots__ = ('value', 'ttype', 'tokens')
+    __slots__ = ()
 
     def get_cases(self):
         """Returns a list of 2-tuples (condition, value).
@@ -647,7 +935,7 @@ class Case(TokenList):
 class Function(TokenList):
     """A function or procedure call."""
 
-    __slots__ = ('value', 'ttype', 'tokens')
+    __slots__ = ()
 
     def get_parameters(self):
         """Return a list of parameters."""
@@ -669,12 +957,12 @@ class TableName(Token):
 
 class ColumnsDefinition(TokenList):
 
-    __slots__ = ('value', 'ttype', 'tokens')
+    __slots__ = ()
 
 
 class ColumnDefinition(TokenList):
 
-    __slots__ = ('value', 'ttype', 'tokens')
+    __slots__ = ()
 
 
 class ColumnName(Token):
@@ -684,12 +972,12 @@ class ColumnName(Token):
 
 class ColumnAttributes(TokenList):
 
-    __slots__ = ('value', 'ttype', 'tokens')
+    __slots__ = ()
 
 
 class Attribute(TokenList):
 
-    __slots__ = ('value', 'ttype', 'tokens')
+    __slots__ = ()
 
 
 class ColumnType(Token):
@@ -699,15 +987,15 @@ class ColumnType(Token):
 
 class ColumnTypeLength(TokenList):
 
-    __slots__ = ('value', 'ttype', 'tokens')
+    __slots__ = ()
 
 
 class ColumnTypeValues(TokenList):
 
-    __slots__ = ('value', 'ttype', 'tokens')
+    __slots__ = ()
 
 
 class Begin(TokenList):
     """A BEGIN/END block."""
 
-    __slots__ = ('value', 'ttype', 'tokens')
+    __slots__ = ()
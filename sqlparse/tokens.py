@@ -10,9 +10,21 @@
 """Tokens"""
 
 
+# All token types, indexed by their id.
+_types = []
+
+
 class _TokenType(tuple):
     parent = None
 
+    def __init__(self, *args):
+        # tuple.__init__ doesn't do anything
+        self._id = len(_types)
+        _types.append(self)
+        # The token type and all its subtypes. It's updated whenever a
+        # subtype is created, so membership tests are a set lookup.
+        self._subtypes = set((self,))
+
     def split(self):
         buf = []
         node = self
@@ -23,7 +35,7 @@ class _TokenType(tuple):
         return buf
 
     def __contains__(self, val):
-        return val is not None and (self is val or val[:len(self)] == self)
+        return val in self._subtypes
 
     def __getattr__(self, val):
         if not val or not val[0].isupper():
@@ -31,15 +43,21 @@ class _TokenType(tuple):
         new = _TokenType(self + (val,))
         setattr(self, val, new)
         new.parent = self
+        node = self
+        while node is not None:
+            node._subtypes.add(new)
+            node = node.parent
         return new
 
-    def __hash__(self):
-        return hash(tuple(self))
-
     def __repr__(self):
         return 'Token' + (self and '.' or '') + '.'.join(self)
 
 
+def from_id(type_id):
+    """Returns the token type with the given id (``ttype._id``)."""
+    return _types[type_id]
+
+
 Token = _TokenType()
 
 # Special token types
@@ -49,6 +67,8 @@ Newline = Whitespace.Newline
 Error = Token.Error
 # Text that doesn't belong to this lexer (e.g. HTML in PHP)
 Other = Token.Other
+# The data of a COPY ... FROM stdin statement, up to the "\." line
+CopyData = Other.CopyData
 
 # Common token types for source code
 Keyword = Token.Keyword
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+# Tests sqlparse.extract.
+
+import decimal
+import io
+
+import pytest
+
+from sqlparse import extract
+from sqlparse import lexer
+from sqlparse.exceptions import SQLParseError
+
+DUMP = u"""SET NAMES utf8;
+CREATE TABLE `t` (`a` int, `b` text);
+INSERT INTO `db`.`t` (`a`, `b`) VALUES (1,'it\\'s\\n'),(-2.5,NULL);
+INSERT IGNORE INTO t VALUES (0x4142, TRUE, now(), - 3), ();
+INSERT INTO t SELECT 1;
+CREATE FUNCTION f() BEGIN INSERT INTO t VALUES (9); END;
+INSERT INTO "public"."u" VALUES ('a''b', E'a\\tb', X'41', 'x'::text)
+"""
+
+
+def test_insert_rows_mysql():
+    rows = list(extract.insert_rows(DUMP, dialect='mysql'))
+    assert rows == [
+        (u'db.t', (u'a', u'b'), (1, u"it's\n")),
+        (u'db.t', (u'a', u'b'), (decimal.Decimal('-2.5'), None)),
+        (u't', None, ('AB', True, u'now()', -3)),
+        (u't', None, ()),
+        (u'public.u', None, (u"a'b", u"E'a\\tb'", 'A', u"'x'::text")),
+    ]
+    assert type(rows[2][2][2]) is extract.Expression
+    assert type(rows[4][2][1]) is extract.Expression
+
+
+def test_insert_rows_ansi():
+    rows = list(extract.insert_rows(DUMP))
+    assert rows[0][2] == (1, u"it\\'s\\n")
+    assert rows[2][2][0] == 0x4142
+    assert rows[4][2] == (u"a'b", u'a\tb', 'A', u"'x'::text")
+    assert type(rows[4][2][3]) is extract.Expression
+
+
+def test_insert_rows_stream(tmpdir):
+    path = tmpdir.join('dump.sql')
+    path.write(DUMP.encode('utf-8'), 'wb')
+    expected = list(extract.insert_rows(DUMP))
+    with io.open(str(path)) as f:
+        assert list(extract.insert_rows(f)) == expected
+    tokens = lexer.tokenize_file(str(path))
+    assert list(extract.insert_rows(tokens)) == expected
+
+
+@pytest.mark.parametrize('sql', [
+    'INSERT INTO t VALUES (1, 2',
+    'INSERT INTO t (a VALUES (1)',
+    'INSERT INTO t DEFAULT VALUES',
+    'UPDATE t SET a = 1',
+])
+def test_insert_rows_skipped(sql):
+    assert list(extract.insert_rows(sql + '; INSERT INTO t2 VALUES (1)')) == [
+        (u't2', None, (1,))]
+
+
+@pytest.mark.parametrize('value,expected', [
+    ('- 1', -1),
+    ('- -1', 1),
+    ('+ -1.5', decimal.Decimal('-1.5')),
+    ('- -1.5', decimal.Decimal('1.5')),
+    ('+2', 2),
+])
+def test_insert_rows_signed(value, expected):
+    rows = list(extract.insert_rows('INSERT INTO t VALUES (%s)' % value))
+    assert rows == [(u't', None, (expected,))]
+
+
+def test_insert_rows_dialect():
+    with pytest.raises(SQLParseError):
+        extract.insert_rows('', dialect='oracle')
@@ -344,3 +344,47 @@ def test_having_produces_newline():
         'having sum(bar.value) > 100'
     ]
     assert formatted == '\n'.join(expected)
+
+
+@pytest.mark.parametrize('options', [
+    {'keyword_case': 'upper', 'strip_comments': True},
+    {'reindent': True},
+    {'output_format': 'python'},
+    {'right_margin': 20, 'reindent': True},
+])
+def test_format_many(options):
+    sqls = ['select a, b from foo; -- foo\nselect * from bar',
+            'select x from y where z = 1 and w is null',
+            'update foo set bar = 1']
+    expected = [sqlparse.format(sql, **options) for sql in sqls]
+    assert list(sqlparse.format_many(sqls, **options)) == expected
+
+
+def test_format_many_invalid_option():
+    with pytest.raises(SQLParseError):
+        list(sqlparse.format_many(['select 1'], reindent=2))
+
+
+def test_format_budget():
+    sql = 'select a, b from foo where x = 1; select c from bar'
+    formatted = sqlparse.format(sql, reindent=True, max_tokens=10)
+    # The first statement is passed through unformatted, but still
+    # separated from the next one.
+    assert formatted == ('select a, b from foo where x = 1; \n\n'
+                         'select c\nfrom bar')
+    formatted = sqlparse.format('select c from bar; ' + sql,
+                                reindent=True, max_tokens=10)
+    assert formatted == ('select c\nfrom bar;\n\n'
+                         'select a, b from foo where x = 1; \n\n'
+                         'select c\nfrom bar')
+    assert sqlparse.format(sql, reindent=True, timeout=60) == (
+        sqlparse.format(sql, reindent=True))
+    for options in ({'max_tokens': 0}, {'max_tokens': 'x'},
+                    {'timeout': -1}, {'cancel': 1}):
+        with pytest.raises(SQLParseError):
+            sqlparse.format(sql, **options)
+
+
+def test_format_cancel():
+    with pytest.raises(sqlparse.exceptions.SQLParseCancelled):
+        sqlparse.format('select 1', reindent=True, cancel=lambda: True)
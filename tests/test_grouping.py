@@ -1,12 +1,15 @@
 # -*- coding: utf-8 -*-
 
+import os
+import sys
+
 import pytest
 
 import sqlparse
 from sqlparse import sql
 from sqlparse import tokens as T
 
-from tests.utils import TestCaseBase
+from tests.utils import FILES_DIR, TestCaseBase, load_file
 
 
 class TestGrouping(TestCaseBase):
@@ -385,4 +388,143 @@ def test_aliased_function_without_as():
 def test_aliased_literal_without_as():
     p = sqlparse.parse('1 foo')[0].tokens
     assert len(p) == 1
-    assert p[0].get_alias() == 'foo'
\ No newline at end of file
+    assert p[0].get_alias() == 'foo'
+
+
+def test_token_index_after_changes():
+    tokens = [sql.Token(T.Name, 'x%d' % i) for i in range(40)]
+    tlist = sql.TokenList(list(tokens))
+
+    def check():
+        for token in tlist.tokens:
+            assert tlist.token_index(token) == tlist.tokens.index(token)
+
+    check()
+    grp = tlist.group_tokens(sql.Identifier, tokens[10:13])
+    assert tlist.token_index(grp) == 10
+    check()
+    tlist.insert_before(tokens[2], sql.Token(T.Whitespace, ' '))
+    tlist.insert_after(tokens[30], sql.Token(T.Whitespace, ' '))
+    check()
+    # changes of the list that bypass the methods
+    tlist.tokens.remove(tokens[5])
+    tlist.tokens.insert(0, tokens[5])
+    check()
+    with pytest.raises(ValueError):
+        tlist.token_index(tokens[11])
+
+
+def test_long_lists():
+    s = 'select * from t where id in (%s) and x::int = 1 and y = 2' % (
+        ', '.join(str(i) for i in range(500)))
+    p = sqlparse.parse(s)[0]
+    assert str(p) == s
+    where = p.tokens[-1]
+    assert isinstance(where, sql.Where)
+    ilist = where.tokens[6].tokens[1]
+    assert isinstance(ilist, sql.IdentifierList)
+    assert len(list(ilist.get_identifiers())) == 500
+    assert all(token.parent is ilist for token in ilist.tokens)
+    comparisons = [token for token in where.tokens
+                   if isinstance(token, sql.Comparison)]
+    assert [str(c) for c in comparisons] == ['x::int = 1', 'y = 2']
+    # groups of _group_left_right have parent links too
+    cast = comparisons[0].tokens[0]
+    assert isinstance(cast, sql.Identifier)
+    assert all(c.parent is where for c in comparisons)
+    assert cast.parent is comparisons[0]
+    for group in comparisons + [cast]:
+        assert all(token.parent is group for token in group.tokens)
+
+
+def test_brackets_table():
+    p = sqlparse.parse('select f(a[1], (b)) from t where x in (1, 2')[0]
+    flat = list(p.flatten())
+    spans = sorted(''.join(t.value for t in flat[i:j + 1])
+                   for i, j in p.brackets.items())
+    # the unclosed parenthesis isn't grouped
+    assert spans == ['(a[1], (b))', '(b)', '[1]']
+    for i, j in p.brackets.items():
+        assert flat[i].parent.tokens[0] is flat[i]
+        assert flat[j].parent.tokens[-1] is flat[j]
+
+
+def test_brackets_deeply_nested():
+    from sqlparse import lexer
+    from sqlparse.engine import grouping
+    from sqlparse.engine.filter import StatementFilter
+    depth = sys.getrecursionlimit() * 2
+    s = '(' * depth + 'x' + ')' * depth
+    stmt, = StatementFilter().process(None, lexer.tokenize(s))
+    grouping.group_brackets(stmt)
+    assert len(stmt.brackets) == depth
+    assert len(stmt.tokens) == 1
+    token = stmt.tokens[0]
+    for _ in range(depth - 1):
+        assert isinstance(token, sql.Parenthesis)
+        token = token.tokens[1]
+    assert token.tokens[1].value == 'x'
+
+
+def _tree(token):
+    children = None
+    if token.is_group():
+        children = [_tree(child) + (child.parent is token,)
+                    for child in token.tokens]
+    return (type(token).__name__, token.value, token.ttype, children,
+            getattr(token, 'brackets', None))
+
+
+def _group_all(s, fused, grouping_funcs=None):
+    from sqlparse import lexer
+    from sqlparse.engine import FilterStack
+    from sqlparse.engine.filter import StatementFilter
+    if grouping_funcs is None:
+        grouping_funcs = FilterStack.default_grouping_funcs
+    result = []
+    for stmt in StatementFilter().process(None, lexer.tokenize(s)):
+        if fused == 'flat':
+            sqlparse.grouping.group_flat(stmt, grouping_funcs)
+        else:
+            sqlparse.grouping.group(stmt, grouping_funcs, fused=fused)
+        result.append(_tree(stmt))
+    return result
+
+
+def _check_fused(s):
+    from sqlparse.engine import FilterStack, grouping
+
+    def check(funcs=None):
+        expected = _group_all(s, False, funcs)
+        assert _group_all(s, True, funcs) == expected
+        assert _group_all(s, 'flat', funcs) == expected
+
+    check()
+    funcs = [f for f in FilterStack.default_grouping_funcs
+             if f not in (grouping.group_where, grouping.group_comparison)]
+    check(funcs)
+    # unknown functions are applied between the fused ones
+    funcs.insert(5, lambda tlist: grouping.group_where(tlist))
+    check(funcs)
+
+
+@pytest.mark.parametrize('s', [
+    'select s.f(x::int), (a as b)::int, c.d e from t as u',
+    'select a::b::c, x as y -- foo\n, z from t'
+    ' where a = 1 and b in (select 1) order by x desc',
+    'select case when a then b end as c, f(x) y from t'
+    ' where x = case when 1 then 2 end',
+    'begin; if x := 1 then y = 2; end if; for i in 1..2 loop end loop; end;',
+    # a group that is extended and changed by a later function
+    'as x.y.z as := a for',
+])
+def test_fused_grouping(s):
+    _check_fused(s)
+
+
+@pytest.mark.parametrize('filename', sorted(os.listdir(FILES_DIR)))
+def test_fused_grouping_files(filename):
+    if 'cp1251' in filename:
+        _check_fused(load_file(filename, 'cp1251'))
+    else:
+        _check_fused(load_file(filename))
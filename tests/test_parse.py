@@ -2,9 +2,13 @@
 
 """Tests sqlparse function."""
 
+import subprocess
+import sys
+import time
+
 import pytest
 
-from tests.utils import TestCaseBase
+from tests.utils import TestCaseBase, PARENT_DIR
 
 import sqlparse
 import sqlparse.sql
@@ -293,3 +297,279 @@ def test_single_line_comments(sql):
     assert p.tokens[-1].ttype == T.Comment.Single
 
 
+def test_lazy_submodules():
+    script = ('import sys, sqlparse\n'
+              'print sorted(m for m in sys.modules\n'
+              '             if m.startswith("sqlparse.") and sys.modules[m])\n'
+              'print sqlparse.T.Keyword, sqlparse.sql.Statement.__name__\n'
+              'print sqlparse.StatementFilter.__name__\n')
+    proc = subprocess.Popen([sys.executable, '-c', script],
+                            cwd=PARENT_DIR, stdout=subprocess.PIPE)
+    output = proc.communicate()[0]
+    assert output.splitlines() == ["['sqlparse.exceptions']",
+                                   'Token.Keyword Statement',
+                                   'StatementFilter']
+
+
+def test_warmup(tmpdir, monkeypatch):
+    monkeypatch.setattr(sqlparse.lexer, 'cache_dir', None)
+    sqlparse.warmup(cache_dir=str(tmpdir))
+    assert sqlparse.lexer.cache_dir == str(tmpdir)
+    assert tmpdir.join('sqlparse.lexer.Lexer.tables').check()
+    assert sqlparse._parsers
+
+
+def test_group_value_is_lazy():
+    sql = 'select a::int from (select b from c) as t'
+    p = sqlparse.parse(sql)[0]
+    assert p._value is None
+    assert p.value == p.normalized == sql
+    assert p._value is not None
+    # groups that are extended while grouping include all their tokens
+    assert p.tokens[2].value == 'a::int'
+    sub = p.tokens[-1].tokens[0]
+    assert isinstance(sub, sqlparse.sql.Parenthesis)
+    assert sub.value == '(select b from c)'
+    sub.insert_after(sub.tokens[1], sqlparse.sql.Token(T.Whitespace, ' '))
+    assert sub.value == '(select  b from c)'
+    assert p.value == 'select a::int from (select  b from c) as t'
+
+
+def test_group_value_nested_change():
+    p = sqlparse.parse('select a as b, c::int from t where x = 1')[0]
+    assert p.value == 'select a as b, c::int from t where x = 1'
+    where = p.tokens[-1]
+    comparison = where.tokens[-1]
+    assert isinstance(comparison, sqlparse.sql.Comparison)
+    assert where.value == 'where x = 1'
+    comparison.insert_after(comparison.tokens[-1],
+                            sqlparse.sql.Token(T.Name, ' + y'))
+    assert comparison.value == 'x = 1 + y'
+    assert where.value == 'where x = 1 + y'
+    assert p.value == unicode(p) == (
+        'select a as b, c::int from t where x = 1 + y')
+    # the same for groups extended while grouping
+    ilist = p.tokens[2]
+    alias, cast = ilist.get_identifiers()
+    alias.insert_before(alias.tokens[0], sqlparse.sql.Token(T.Name, 't.'))
+    cast.insert_after(cast.tokens[-1], sqlparse.sql.Token(T.Name, '[]'))
+    assert p.value == unicode(p) == (
+        'select t.a as b, c::int[] from t where x = 1 + y')
+
+
+def test_grouping_presets():
+    from sqlparse.engine import FilterStack
+    sql = 'select f(a) as x, b from t where c = (select 1)'
+
+    def groups(grouping, dialect=None):
+        p = sqlparse.parse(sql, dialect=dialect, grouping=grouping)[0]
+        assert str(p) == sql
+        assert p.get_type() == 'SELECT'
+        return [type(t).__name__ for t in p.tokens if t.is_group()]
+
+    assert groups('none') == groups('none', 'mysql') == []
+    assert groups('brackets') == ['Parenthesis', 'Parenthesis']
+    assert groups('identifiers') == ['IdentifierList', 'Identifier',
+                                     'Identifier', 'Parenthesis']
+    assert groups('full') == groups(None) == ['IdentifierList',
+                                              'Identifier', 'Where']
+    assert groups([sqlparse.grouping.group_where]) == ['Parenthesis',
+                                                       'Where']
+    assert (FilterStack.resolve_grouping('full')
+            == FilterStack.default_grouping_funcs)
+    with pytest.raises(sqlparse.SQLParseError):
+        sqlparse.parse(sql, grouping='foo')
+
+
+def test_resolve_grouping():
+    from sqlparse.engine import FilterStack, grouping
+
+    def custom(tlist):
+        pass
+
+    funcs = FilterStack.resolve_grouping([
+        custom, grouping.group_identifier_list, grouping.align_comments])
+    assert funcs == [grouping.group_comments, grouping.group_brackets,
+                     grouping.group_functions, grouping.group_identifier,
+                     grouping.align_comments, grouping.group_identifier_list,
+                     custom]
+
+
+def test_lazy_grouping():
+    sql = ('-- x\nselect f(a) as x, b from t where c = (select 1);\n'
+           'insert into t values (1, 2)')
+    eager = sqlparse.parse(sql)
+    lazy = sqlparse.parse(sql, lazy=True)
+    assert [type(p) for p in lazy] == [sqlparse.sql.LazyStatement] * 2
+    assert [str(p) for p in lazy] == [str(p) for p in eager]
+    assert [p.get_type() for p in lazy] == ['UNKNOWN', 'INSERT']
+    assert [[t.value for t in p.flatten()] for p in lazy] == [
+        [t.value for t in p.flatten()] for p in eager]
+    assert [type(p) for p in lazy] == [sqlparse.sql.LazyStatement] * 2
+
+    def tree(token):
+        if token.is_group():
+            children = [tree(t) for t in token.tokens]
+            return type(token), children
+        return token.ttype, token.value
+
+    # The first access to the tokens groups the statement.
+    stmt = lazy[0]
+    assert isinstance(stmt.tokens[3], sqlparse.sql.IdentifierList)
+    assert type(stmt) is sqlparse.sql.Statement
+    assert tree(stmt) == tree(eager[0])
+    stmt = lazy[1]
+    assert stmt.token_next_by_instance(0, sqlparse.sql.Identifier)
+    assert tree(stmt) == tree(eager[1])
+    for dialect in (None, 'mysql'):
+        stmt, = sqlparse.parse('select a, b from t', dialect=dialect,
+                               grouping='identifiers', lazy=True)
+        assert isinstance(stmt.tokens[2], sqlparse.sql.IdentifierList)
+    # The first keyword is grouped with what follows.
+    for sql in ('create := b.c', 'select::int', 'drop as x'):
+        stmt, = sqlparse.parse(sql, lazy=True)
+        assert stmt.get_type() == sqlparse.parse(sql)[0].get_type()
+        assert stmt.get_type() == 'UNKNOWN'
+
+
+def test_parse_budget():
+    sql = 'select f(a), b from t where c in (1, 2); select a from b'
+    stmts = sqlparse.parse(sql, max_tokens=20)
+    assert [str(p) for p in stmts] == [str(p) for p in sqlparse.parse(sql)]
+    assert not any(t.is_group() for t in stmts[0].tokens)
+    assert isinstance(stmts[1].tokens[2], sqlparse.sql.Identifier)
+    # The grouping done before the timeout is undone.
+    from sqlparse.engine import grouping
+
+    def slow(tlist):
+        time.sleep(0.05)
+
+    for fused in (False, True):
+        stack = sqlparse.engine.FilterStack(
+            grouping_funcs=[grouping.group_brackets, slow,
+                            grouping.group_identifier],
+            fused_grouping=fused, timeout=0.01)
+        stack.enable_grouping()
+        stmt = sqlparse.parse(sql, grouping='none')[0]
+        stack.run(stmt)
+        assert not any(t.is_group() for t in stmt.tokens)
+        assert stmt.brackets is None
+        assert str(stmt) == str(stmts[0])
+    assert sqlparse.parse(sql, timeout=60)[0].tokens[2].is_group()
+    # Statement filters are skipped for statements over budget, also if
+    # the grouping is lazy.
+    processed = []
+
+    class Recorder(object):
+        def process(self, stack, stmt):
+            processed.append(str(stmt))
+
+    for max_tokens, timeout in ((20, None), (None, 0.01)):
+        stack = sqlparse.engine.FilterStack(
+            grouping_funcs=[grouping.group_brackets, slow,
+                            grouping.group_identifier],
+            lazy_grouping=True, max_tokens=max_tokens, timeout=timeout)
+        stack.stmtprocess.append(Recorder())
+        stack.enable_grouping()
+        del processed[:]
+        stmt = sqlparse.parse(sql, grouping='none')[0]
+        stack.run(stmt)
+        assert processed == []
+        assert not any(t.is_group() for t in stmt.tokens)
+
+
+def test_parse_cancel():
+    calls = []
+
+    def cancel():
+        calls.append(1)
+        return len(calls) > 1
+
+    sql = 'select 1; select 2'
+    with pytest.raises(sqlparse.exceptions.SQLParseCancelled):
+        sqlparse.parse(sql, cancel=cancel)
+    assert len(calls) == 2
+    with pytest.raises(sqlparse.exceptions.SQLParseCancelled):
+        list(sqlparse.lexer.tokenize('select 1 ' * 1000,
+                                     cancel=lambda: True))
+    assert sqlparse.parse(sql, cancel=lambda: False)[1].get_type() == (
+        'SELECT')
+
+
+def test_lazy_grouping_cancel():
+    sql = 'select f(a), b from t where c = (1)'
+    budget = [None]  # number of checks until it's cancelled
+
+    def cancel():
+        if budget[0] is None:
+            return False
+        budget[0] -= 1
+        return budget[0] < 0
+
+    stmt = sqlparse.parse(sql, lazy=True, cancel=cancel)[0]
+    flat = list(stmt.flatten())
+    budget[0] = 3
+    for _ in range(2):
+        with pytest.raises(sqlparse.exceptions.SQLParseCancelled):
+            stmt.tokens
+        # The partial grouping is undone, the statement stays lazy.
+        assert isinstance(stmt, sqlparse.sql.LazyStatement)
+        assert list(stmt.flatten()) == flat
+    budget[0] = None
+    expected = sqlparse.parse(sql)[0]
+    assert ([type(t).__name__ for t in stmt.tokens]
+            == [type(t).__name__ for t in expected.tokens])
+    assert type(stmt) is sqlparse.sql.Statement
+    assert stmt.brackets == expected.brackets
+
+
+def test_compact_values():
+    sql = ("insert into `db`.`t` (a, b) values (1, 'x'), (f(2), (3)) ;"
+           "insert into t values (1) -- x\n;"
+           "insert into t values (1), [2];"
+           "insert into t select 1")
+    eager = sqlparse.parse(sql)
+    compact = sqlparse.parse(sql, compact_values=True)
+    assert [str(p) for p in compact] == [str(p) for p in eager]
+    assert [p.brackets for p in compact] == [p.brackets for p in eager]
+    assert [[t.value for t in p.flatten()] for p in compact] == [
+        [t.value for t in p.flatten()] for p in eager]
+    stmt = compact[0]
+    values = stmt.tokens[-3]
+    assert isinstance(values, sqlparse.sql.Values)
+    assert values.source == "(1, 'x'), (f(2), (3))"
+    assert values.row_count() == 2
+    row = values.get_row(1)
+    assert isinstance(row, sqlparse.sql.Parenthesis)
+    assert str(row) == '(f(2), (3))'
+    assert row.parent is values
+    assert [str(r) for r in values.get_rows()] == ["(1, 'x')", '(f(2), (3))']
+    with pytest.raises(IndexError):
+        values.get_row(2)
+
+    def tree(token):
+        if token.is_group():
+            children = []
+            for t in token.tokens:
+                if isinstance(t, sqlparse.sql.Values):
+                    children.extend(tree(v) for v in t.tokens)
+                else:
+                    children.append(tree(t))
+            return type(token), children
+        return token.ttype, token.value
+
+    # Accessing the tokens groups all rows.
+    assert tree(stmt) == tree(eager[0])
+    assert values.get_row(-1).parent is values
+    # The others are grouped as usual.
+    for stmt in compact[1:]:
+        assert not any(isinstance(t, sqlparse.sql.Values)
+                       for t in stmt.tokens)
+    stmt, = sqlparse.parse('insert into t values (1)', lazy=True,
+                           compact_values=True)
+    assert type(stmt) is sqlparse.sql.LazyStatement
+    assert isinstance(stmt.tokens[-1], sqlparse.sql.Values)
+    # The rows are grouped like the statement, which isn't grouped here.
+    stmt, = sqlparse.parse('insert into t values (1)', grouping='none',
+                           compact_values=True)
+    assert not isinstance(stmt.tokens[-1], sqlparse.sql.Values)
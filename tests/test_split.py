@@ -2,11 +2,20 @@
 
 # Tests splitting functions.
 
+import os
 import unittest
 
-from tests.utils import load_file, TestCaseBase
+import pytest
+
+from tests.utils import FILES_DIR, load_file, TestCaseBase
 
 import sqlparse
+from sqlparse import lexer
+from sqlparse import parallel
+from sqlparse import tokens as T
+from sqlparse.engine.filter import StatementFilter
+from sqlparse.engine import splitter
+from sqlparse.engine.splitter import StatementSplitter
 
 
 class SQLSplitTest(TestCaseBase):
@@ -142,3 +151,290 @@ def test_split_simple():
     assert len(stmts) == 2
     assert stmts[0] == 'select * from foo;'
     assert stmts[1] == 'select * from bar;'
+
+
+def test_parsestream_is_lazy(monkeypatch):
+    monkeypatch.setattr(lexer.Lexer, 'bufsize', 1024)
+
+    class Stream(object):
+        reads = 0
+
+        def read(self, size=-1):
+            self.reads += 1
+            if self.reads > 50:
+                return ''
+            return 'select * from foo;\n' * 100
+
+    for dialect in (None, 'mysql'):
+        stream = Stream()
+        stmts = sqlparse.parsestream(stream, dialect=dialect)
+        assert unicode(next(stmts)) == u'select * from foo;'
+        assert stream.reads <= 2
+        # the last statement is the trailing newline
+        assert len(list(stmts)) == 5000
+
+
+def test_split_parsefile():
+    path = os.path.join(FILES_DIR, 'function_psql2.sql')
+    stmts = list(sqlparse.parsefile(path))
+    expected = sqlparse.parse(load_file('function_psql2.sql'))
+    assert [unicode(stmt) for stmt in stmts] == [unicode(stmt)
+                                                 for stmt in expected]
+
+
+def test_split_many():
+    sqls = ['select * from foo; select * from bar;',
+            # unterminated dollar quoting mustn't leak into the next string
+            'select $$foo',
+            'select 1; select 2']
+    result = sqlparse.split_many(sqls)
+    assert not isinstance(result, list)
+    assert list(result) == [sqlparse.split(sql) for sql in sqls]
+
+
+def test_parse_many():
+    sqls = [load_file('function_psql2.sql'), 'select 1; select 2', '']
+    result = list(sqlparse.parse_many(sqls))
+    assert len(result) == 3
+    for stmts, sql in zip(result, sqls):
+        assert isinstance(stmts, tuple)
+        assert [unicode(stmt) for stmt in stmts] == [
+            unicode(stmt) for stmt in sqlparse.parse(sql)]
+
+
+def test_parse_many_mysql():
+    sqls = ['create table foo (id int not null)', 'select 1']
+    result = list(sqlparse.parse_many(sqls, dialect='mysql'))
+    expected = [sqlparse.parse(sql, dialect='mysql') for sql in sqls]
+
+    def describe(stmts):
+        return [(type(token).__name__, unicode(token))
+                for token in stmts[0].tokens]
+    assert [describe(stmts) for stmts in result] == [
+        describe(stmts) for stmts in expected]
+
+
+def _split_tokens(sql):
+    # The way split() worked before there was a StatementSplitter.
+    stream = StatementFilter().process(None, lexer.tokenize(sql))
+    return [unicode(stmt).strip() for stmt in stream]
+
+
+@pytest.mark.parametrize('filename', [
+    name for name in os.listdir(FILES_DIR) if name != 'test_cp1251.sql'])
+def test_splitter_matches_statementfilter(filename):
+    sql = load_file(filename)
+    assert StatementSplitter().split(sql) == _split_tokens(sql)
+
+
+@pytest.mark.parametrize('sql', [
+    u'',
+    u'  ',
+    u'select 1;\n',
+    u'select 1; -- foo\nselect 2; /* bar */ select 3',
+    u'select 1 /* ; /* ; */; select 2',
+    u'select 1 /* ; /*/ ; */; select 2',
+    u'select \'a;b\', "c;d", `e;f`, [g;h]; select 2',
+    u'select \'unterminated; select 2',
+    u'create function f() returns int as $$ select 1; $$; select 2',
+    u'create function f() as $body$ begin if x then end if; end; $body$;'
+    u'select 2',
+    u'declare x int; begin select 1; end; select 2',
+    u'create table t (ending int, format int, ifnull int); select 2',
+    u'select case when a then b end; select 2',
+    u'select x.end; select 2;',
+    u'select \xe4; İf; K; select 2',
+])
+def test_splitter_edge_cases(sql):
+    assert StatementSplitter().split(sql) == _split_tokens(sql)
+
+
+def test_splitter_spans():
+    sql = u'select 1;  select 2; -- foo\nselect 3'
+    spans = list(StatementSplitter().spans(sql))
+    assert spans == [(0, 11), (11, 28), (28, 36)]
+    assert [sql[start:end] for start, end in spans] == [
+        u'select 1;  ', u'select 2; -- foo\n', u'select 3']
+
+
+def test_split_copy_data(tmpdir):
+    copy = (u'COPY public.t (a, b) FROM stdin;\n'
+            u'1\tfoo; select\n2\tbegin\n\\.\n')
+    sql = u'SET x = 1;\n' + copy + u'\nSELECT 1;'
+    assert sqlparse.split(sql) == [u'SET x = 1;', copy.strip(), u'SELECT 1;']
+    assert _split_tokens(sql) == sqlparse.split(sql)
+    stmts = sqlparse.parse(sql)
+    assert len(stmts) == 3
+    assert stmts[1].token_next_by_type(0, T.CopyData).value == \
+        copy[copy.index(u'\n'):-1]
+    path = tmpdir.join('dump.sql')
+    path.write(sql.encode('utf-8'), 'wb')
+    mapped = lexer.MappedFile(str(path))
+    try:
+        spans = list(StatementSplitter(lexer_cls=lexer.BytesLexer).spans(
+            mapped.buffer))
+    finally:
+        mapped.close()
+    assert [sql[start:end].strip() for start, end in spans] == \
+        sqlparse.split(sql)
+
+
+def test_split_copy_data_consecutive():
+    first = u'COPY a FROM stdin;\n1;\n\\.'
+    second = u'/* b */\nCOPY b FROM stdin;\nbegin;\n\\.'
+    sql = u'%s\n\n-- data of b\n%s' % (first, second)
+    assert sqlparse.split(sql) == [first, u'-- data of b\n' + second]
+    assert _split_tokens(sql) == sqlparse.split(sql)
+
+
+@pytest.mark.parametrize('sql, count', [
+    (u'DROP TABLE stdin;\nCREATE TABLE x (a int);\nselect 1;', 3),
+    (u'select * from stdin;\nselect 1;', 2),
+    (u'copy t from stdin; select 1;\nselect 2;', 3),
+    (u'copy t to stdout;\nselect 1 from stdin;\nselect 2;', 3),
+])
+def test_split_stdin_identifier(sql, count):
+    stmts = sqlparse.split(sql)
+    assert len(stmts) == count
+    assert _split_tokens(sql) == stmts
+    spans = StatementSplitter(lexer_cls=lexer.BytesLexer).spans(
+        sql.encode('utf-8'))
+    assert len(list(spans)) == count
+
+
+def test_split_offsets():
+    sql = u'select 1;\n\n  -- foo\nselect 2;  \nselect\n3'
+    offsets = sqlparse.split_offsets(sql)
+    assert offsets == [(0, 9, 1), (13, 29, 3), (32, 40, 5)]
+    assert [sql[start:end] for start, end, _ in offsets] == sqlparse.split(sql)
+
+
+@pytest.mark.parametrize('filename,charset,encoding', [
+    ('begintag.sql', 'utf-8', None),
+    ('dashcomment.sql', 'utf-8', 'guess'),
+    ('test_cp1251.sql', 'cp1251', 'cp1251'),
+])
+def test_write_index(filename, charset, encoding, tmpdir):
+    path = str(tmpdir.join(filename))
+    sql = load_file(filename, charset)
+    with open(path, 'wb') as f:
+        f.write(sql.encode(charset))
+    splitter.write_index(path, encoding=encoding).close()
+    assert os.path.exists(path + splitter.INDEX_SUFFIX)
+    with splitter.StatementIndex(path) as index:
+        assert len(index) == len(sqlparse.split(sql))
+        assert [index.statement(i) for i in range(len(index))] == \
+            sqlparse.split(sql)
+        assert [line for _, _, line in index] == [
+            line for _, _, line in sqlparse.split_offsets(sql)]
+        assert index[-1] == index[len(index) - 1]
+        with pytest.raises(IndexError):
+            index[len(index)]
+
+
+def test_statement_index_find(tmpdir):
+    path = str(tmpdir.join('dump.sql'))
+    with open(path, 'wb') as f:
+        f.write(''.join('insert into t values (%d);\n' % i
+                        for i in range(100)))
+    with splitter.write_index(path) as index:
+        starts = [start for start, _, _ in index]
+        assert index.find(0) == 0
+        assert index.find(starts[10]) == 10
+        assert index.find(starts[10] + 1) == 11
+        assert index.find(os.path.getsize(path) + 1) == len(index)
+        assert index.statement(42) == u'insert into t values (42);'
+
+
+def test_statement_index_out_of_date(tmpdir):
+    path = tmpdir.join('dump.sql')
+    path.write('select 1; select 2;')
+    splitter.write_index(str(path)).close()
+    path.write('select 1;')
+    with pytest.raises(ValueError):
+        splitter.StatementIndex(str(path))
+    tmpdir.join('dump.sql.sqlidx').write('foo')
+    with pytest.raises(ValueError):
+        splitter.StatementIndex(str(path))
+
+
+def _tree(token):
+    children = None
+    if token.is_group():
+        children = [_tree(child) + (child.parent is token,)
+                    for child in token.tokens]
+    return (type(token).__name__, token.value, token.ttype,
+            token.normalized, token.is_keyword, children,
+            getattr(token, 'brackets', None))
+
+
+@pytest.mark.parametrize('workers, batch_size', [(1, 1), (2, 1), (2, 4096)])
+@pytest.mark.parametrize('filename, dialect', [
+    ('function_psql.sql', None),
+    ('begintag_2.sql', None),
+    ('function.sql', 'mysql'),
+])
+def test_parallel_parsestream(filename, dialect, workers, batch_size):
+    path = os.path.join(FILES_DIR, filename)
+    stream = parallel.parsestream(path, workers=workers, dialect=dialect,
+                                  batch_size=batch_size)
+    expected = sqlparse.parse(load_file(filename), dialect=dialect)
+    stmts = list(stream)
+    assert [_tree(stmt) for stmt in stmts] == [_tree(stmt)
+                                               for stmt in expected]
+    for stmt in stmts:
+        assert stmt.token_index(stmt.tokens[-1]) == len(stmt.tokens) - 1
+
+
+def _all_nodes(token):
+    yield token
+    if token.is_group():
+        for child in token.tokens:
+            for node in _all_nodes(child):
+                yield node
+
+
+def test_parallel_round_trip():
+    stmts = []
+    for filename in sorted(os.listdir(FILES_DIR)):
+        if 'cp1251' in filename:
+            stmts.extend(sqlparse.parse(load_file(filename, 'cp1251')))
+        else:
+            stmts.extend(sqlparse.parse(load_file(filename)))
+    stmts.extend(sqlparse.parse(
+        u"create table t (`id` int(11) not null default 0 comment 'x',"
+        u" e enum('a', 'b'), primary key (`id`)) engine=InnoDB;"
+        u" create table u like t;", dialect='mysql'))
+    sql = (u"insert into t values (1, 'a'), (2, f(x));"
+           u" select a[1] from t where b = 2 -- c\n;")
+    stmts.extend(sqlparse.parse(sql, compact_values=True))
+    stmts.extend(sqlparse.parse(
+        u'create procedure p() begin if a then b; end if;'
+        u' for i in c loop d; end loop; end;'))
+    stmts.append(sqlparse.sql.Statement([sqlparse.sql.TokenList(
+        [sqlparse.sql.Token(T.Name, u'x')])]))
+    lazy = sqlparse.parse(sql, lazy=True)
+    classes = set(type(stmt) for stmt in lazy)
+    stmts.extend(lazy)
+    # Lazy statements are grouped when they are dumped.
+    dumped = [parallel._dump_tree(stmt) for stmt in stmts]
+    classes.update(type(node) for stmt in stmts for node in _all_nodes(stmt))
+    assert classes == set(parallel._classes)
+    for stmt, data in zip(stmts, dumped):
+        loaded = parallel._load_tree(data)
+        assert _tree(loaded) == _tree(stmt)
+        assert unicode(loaded) == unicode(stmt)
+        for node in _all_nodes(loaded):
+            assert type(node) is not sqlparse.sql.LazyStatement
+            if isinstance(node, sqlparse.sql.Values):
+                assert list(node.get_rows())[1].value == u'(2, f(x))'
+
+
+def test_parallel_parsestream_close(tmpdir):
+    path = tmpdir.join('dump.sql')
+    path.write(''.join('insert into t values (%d);\n' % i
+                       for i in range(1000)))
+    stream = parallel.parsestream(str(path), workers=2, batch_size=64,
+                                  max_pending=2)
+    assert unicode(next(stream)) == u'insert into t values (0);'
+    stream.close()
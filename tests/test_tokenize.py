@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 
+import os
 import sys
 import types
 import unittest
@@ -10,6 +11,7 @@ import sqlparse
 from sqlparse import lexer
 from sqlparse import sql
 from sqlparse.tokens import *
+from tests.utils import FILES_DIR, load_file
 
 
 class TestTokenize(unittest.TestCase):
@@ -81,6 +83,27 @@ class TestTokenize(unittest.TestCase):
         tokens = list(lex.get_tokens(s))
         self.assertEqual(tokens[0][1], " " * 5)
 
+    def test_unicode_in_place(self):
+        lex = lexer.Lexer()
+        lex.encoding = 'cp1251'
+        s = u'select \u0444\u044b\u0432'
+        tokens = list(lex.get_tokens_unprocessed(s))
+        self.assertEqual(tokens[-1], (7, Name, u'\u0444\u044b\u0432'))
+        # The encoding is only used for byte strings.
+        self.assertEqual(lex.encoding, 'cp1251')
+        tokens = list(lex.get_tokens(s.encode('cp1251')))
+        self.assertEqual(tokens[-1], (Name, u'\u0444\u044b\u0432'))
+
+    def test_strip_unicode(self):
+        lex = lexer.Lexer()
+        lex.stripnl = True
+        tokens = list(lex.get_tokens(u'\nselect\t1\n'))
+        self.assertEqual(u''.join(v for t, v in tokens), u'select\t1')
+        lex.stripall = True
+        lex.tabsize = 2
+        tokens = list(lex.get_tokens(u' select\t1 '))
+        self.assertEqual(u''.join(v for t, v in tokens), u'select  1')
+
 
 class TestToken(unittest.TestCase):
 
@@ -162,6 +185,82 @@ class TestStream(unittest.TestCase):
         self.assertEqual(len(tokens), 2)
         self.assertEqual(tokens[1][0], Error)
 
+    def test_chunked(self):
+        from cStringIO import StringIO
+
+        sql = load_file('huge_select.sql').encode('utf-8')
+        expected = list(lexer.Lexer().get_tokens_unprocessed(StringIO(sql)))
+        lex = lexer.Lexer()
+        lex.bufsize = 7
+        tokens = list(lex.get_tokens_unprocessed(StringIO(sql)))
+        self.assertEqual(tokens, expected)
+
+    def test_token_spanning_chunks(self):
+        from cStringIO import StringIO
+
+        value = "'%s'" % ('x' * 5000)
+        stream = StringIO("select %s from foo /* %s */" % (value, value))
+        lex = lexer.Lexer()
+        lex.bufsize = 16
+        lex.lookahead = 32
+        tokens = list(lex.get_tokens(stream))
+        self.assertEqual(tokens[2], (String.Single, value))
+        self.assertEqual(len(tokens), 11)
+        self.assertEqual(tokens[-2], (Comment.Multiline, ' %s ' % value))
+
+    def test_bounded_read(self):
+        from cStringIO import StringIO
+
+        for char in (u'\u201c', u'\u20ac', u'{'):
+            sql = u'select %s 1;\n' % char + u'select 2;\n' * 200000
+            stream = StringIO(sql.encode('utf-8'))
+            lex = lexer.Lexer()
+            tokens = lex.get_tokens(stream)
+            for _ in range(8):
+                next(tokens)
+            self.assertEqual(stream.tell(), lex.bufsize)
+        # Strings that aren't closed in the current text are read ahead.
+        value = u"'%s'" % (u'x' * 5000)
+        stream = StringIO((u'select \u201c %s;' % value).encode('utf-8'))
+        lex = lexer.Lexer()
+        lex.bufsize = lex.lookahead = 16
+        tokens = list(lex.get_tokens(stream))
+        self.assertEqual(tokens[2], (Error, u'\u201c'))
+        self.assertEqual(tokens[4], (String.Single, value))
+
+    def test_multiword_keyword_spanning_chunks(self):
+        from cStringIO import StringIO
+
+        stream = StringIO("select * from a left outer join b")
+        lex = lexer.Lexer()
+        lex.bufsize = 1
+        tokens = list(lex.get_tokens(stream))
+        self.assertEqual(tokens[-3], (Keyword, 'left outer join'))
+
+    def test_decode_chunked(self):
+        from cStringIO import StringIO
+
+        sql = u'\ufeffselect \'\xe4\u20ac\''.encode('utf-8')
+        lex = lexer.Lexer()
+        lex.bufsize = 1
+        lex.encoding = 'guess'
+        tokens = list(lex.get_tokens(StringIO(sql)))
+        self.assertEqual(tokens[0], (Keyword.DML, u'select'))
+        self.assertEqual(tokens[-1], (String.Single, u"'\xe4\u20ac'"))
+        # Fall back to latin1 if the input isn't valid utf-8.
+        sql = u"select '\xe4'".encode('latin1')
+        tokens = list(lex.get_tokens(StringIO(sql)))
+        self.assertEqual(tokens[-1], (String.Single, u"'\xe4'"))
+
+    def test_tab_expansion_chunked(self):
+        from cStringIO import StringIO
+
+        lex = lexer.Lexer()
+        lex.tabsize = 4
+        lex.bufsize = 1
+        tokens = list(lex.get_tokens(StringIO("a\tb\n\tc")))
+        self.assertEqual(u''.join(v for t, v in tokens), u'a   b\n    c')
+
 
 @pytest.mark.parametrize('expr', ['JOIN', 'LEFT JOIN', 'LEFT OUTER JOIN',
                                   'FULL OUTER JOIN', 'NATURAL JOIN',
@@ -188,3 +287,299 @@ def test_parse_endifloop():
     p = sqlparse.parse('END  LOOP')[0]
     assert len(p.tokens) == 1
     assert p.tokens[0].ttype is Keyword
+
+
+@pytest.mark.parametrize('pattern,expected', [
+    (r'::', set(':')),
+    (r'[*]', set('*')),
+    (r'CASE\b', set('Cc')),
+    (r'(--|#).*?$', set('-#')),
+    (r'[-]?[0-9]+', set('-0123456789')),
+    (r'(?<![\w\])])(\[[^\]]+\])', set('[')),
+    (r'[^/\*]+', set(chr(i) for i in range(128)) - set('/*')),
+])
+def test_first_chars(pattern, expected):
+    flags = lexer.Lexer.flags
+    assert lexer.first_chars(pattern, flags) == expected
+
+
+@pytest.mark.parametrize('pattern', [r'a?', r'(a|b*)'])
+def test_first_chars_any(pattern):
+    assert lexer.first_chars(pattern, lexer.Lexer.flags) is None
+
+
+@pytest.mark.parametrize('pattern,chars', [
+    (r"'(''|\\\\|\\'|[^'])*'", u"'"),
+    (r'(""|".*?[^\\]")', u'"'),
+    (r'(--|#).*?(\r\n|\r|\n)', u'-#'),
+    (r'[^\W\d_]\w*(?=[.(])', u'a\xe4'),
+])
+def test_incomplete_start(pattern, chars):
+    start = lexer.incomplete_start(pattern, lexer.Lexer.flags)
+    assert [c for c in u"'\"-#a\xe4\u201c1 " if start(c)] == list(chars)
+
+
+@pytest.mark.parametrize('pattern', [r'\s+', r'[^\W\d]\w*', r'NOT NULL\b',
+                                     r'[+/@#%^&|`?^-]+'])
+def test_incomplete_start_none(pattern):
+    assert lexer.incomplete_start(pattern, lexer.Lexer.flags) is None
+
+
+@pytest.mark.parametrize('filename', ['huge_select.sql', 'function_psql.sql',
+                                      'function_psql2.sql',
+                                      'dashcomment.sql', 'begintag.sql'])
+def test_dispatch_matches_full_scan(filename, monkeypatch):
+    sql = load_file(filename)
+    expected = list(lexer.tokenize(sql))
+    # Without dispatch tables every rule is tried at each position.
+    monkeypatch.setattr(lexer.Lexer, '_dispatch',
+                        dict((state, {}) for state in lexer.Lexer._dispatch))
+    assert list(lexer.tokenize(sql)) == expected
+
+
+@pytest.mark.parametrize('filename,encoding', [
+    ('huge_select.sql', None),
+    ('function_psql2.sql', None),
+    ('dashcomment.sql', 'guess'),
+    ('test_cp1251.sql', 'cp1251'),
+])
+def test_tokenize_file(filename, encoding):
+    path = os.path.join(FILES_DIR, filename)
+    expected = list(lexer.tokenize(open(path, 'rb'), encoding))
+    assert list(lexer.tokenize_file(path, encoding)) == expected
+
+
+def test_mapped_file_spans(tmpdir):
+    path = tmpdir.join('foo.sql')
+    path.write(u'\ufeffselect na\xefve from foo'.encode('utf-8'), 'wb')
+    mapped = lexer.MappedFile(str(path), 'guess')
+    spans = list(mapped.spans())
+    assert spans[0] == (Keyword.DML, 3, 9)
+    assert spans[2] == (Name, 10, 16)
+    assert mapped.value(*spans[2][1:]) == u'na\xefve'
+    assert list(mapped)[2] == (Name, u'na\xefve')
+    mapped.close()
+
+
+@pytest.mark.parametrize('encoding', ['utf-8', 'guess', 'cp1251'])
+def test_mapped_file_non_ascii(encoding, tmpdir, monkeypatch):
+    # Small chunks that end within characters and tokens.
+    monkeypatch.setattr(lexer.Lexer, 'bufsize', 3)
+    sql = (u'select \u201cx\u201d, a\u20acb, @\xe4, \xa0 1 '
+           u"from t where \u0444 = '\xe4\u20ac';")
+    if encoding == 'cp1251':
+        sql = sql.encode('cp1251', 'replace').decode('cp1251')
+    path = tmpdir.join('foo.sql')
+    codec = encoding
+    if encoding == 'guess':
+        codec = 'utf-8'
+    path.write(sql.encode(codec), 'wb')
+    mapped = lexer.MappedFile(str(path), encoding)
+    assert list(mapped) == list(lexer.tokenize(sql))
+    data = sql.encode(codec)
+    assert [data[start:end].decode(codec)
+            for _, start, end in mapped.spans()] == [
+        value for _, value in lexer.tokenize(sql)]
+    mapped.close()
+
+
+def test_mapped_file_empty(tmpdir):
+    path = tmpdir.join('empty.sql')
+    path.write('')
+    assert list(lexer.tokenize_file(str(path))) == []
+
+
+def test_mapped_file_requires_ascii_encoding(tmpdir):
+    path = tmpdir.join('foo.sql')
+    path.write('select 1')
+    with pytest.raises(ValueError):
+        lexer.MappedFile(str(path), 'utf-16')
+
+
+@pytest.mark.parametrize('data, rest', [
+    (u'\n1\tfoo;bar\n2\tbegin\n\\.', u'\nSELECT 1;'),
+    (u'\n\\.', u''),
+    (u'\r\n1\t\\.x\r\n\\.', u'\r\nSELECT 1;'),
+    (u'\n1\tno end;\n', u''),
+])
+def test_copy_data(data, rest):
+    from cStringIO import StringIO
+
+    sql = u'COPY t (a, b) FROM stdin;' + data + rest
+    tokens = list(lexer.tokenize(sql))
+    assert (CopyData, data) in tokens
+    lex = lexer.Lexer()
+    lex.bufsize = 4
+    assert list(lex.get_tokens(StringIO(sql.encode('utf-8')))) == tokens
+
+
+@pytest.mark.parametrize('sql', [
+    u"COPY t FROM '/tmp/t';\n1\t2\n\\.\n",
+    u'DROP TABLE stdin;\nCREATE TABLE x (a int);\nselect 1;',
+    u'select * from stdin;\nselect 1;',
+    u'select 1; copy t to stdout; select 2 from stdin;\nselect 3;',
+])
+def test_copy_data_requires_copy_from_stdin(sql):
+    tokens = list(lexer.tokenize(sql))
+    assert CopyData not in [ttype for ttype, _ in tokens]
+
+
+@pytest.mark.parametrize('pattern,expected', [
+    (r'\s+', r'\s+'),
+    (r'[$:?]\w+', r'[$:?][\w\x80-\xff]+'),
+    (r'[^\W\d]\w*', r'(?:[^\W\d]|[\x80-\xff])[\w\x80-\xff]*'),
+    (r'(?<![\w\])])(\[[^\]]+\])', r'(?<![\w\x80-\xff\])])(\[[^\]]+\])'),
+])
+def test_bytes_pattern(pattern, expected):
+    assert lexer._bytes_pattern(pattern) == expected
+
+
+def test_tokentype_subtypes():
+    assert Keyword.DML in Keyword
+    assert Keyword in Keyword
+    assert Keyword not in Keyword.DML
+    assert None not in Keyword
+    # subtypes created after their parent was used
+    assert Keyword.Foo.Bar in Keyword
+    assert Keyword.Foo.Bar in Token
+    assert Keyword.Foo.Bar not in Name
+
+
+def test_tokentype_hash():
+    assert hash(Keyword.DML) == hash(('Keyword', 'DML'))
+    assert {('Keyword', 'DML'): 1}[Keyword.DML] == 1
+    assert len(set(t._id for t in (Token, Keyword, Keyword.DML, Name))) == 4
+
+
+class TestKeywordCache(unittest.TestCase):
+
+    def test_classify(self):
+        cache = lexer.KeywordCache()
+        self.assertEqual(cache.lookup('select'), Keyword.DML)
+        self.assertEqual(cache.lookup('Order'), Keyword)
+        self.assertEqual(cache.lookup('foo'), Name)
+        self.assertEqual(cache.lookup('select'), Keyword.DML)
+        self.assertEqual((cache.hits, cache.misses), (1, 3))
+
+    def test_bounded(self):
+        cache = lexer.KeywordCache(maxsize=10)
+        for i in range(25):
+            cache.lookup('name%d' % i)
+        self.assertTrue(len(cache) <= 10)
+        self.assertEqual(cache.misses, 25)
+        cache.clear()
+        self.assertEqual((len(cache), cache.hits, cache.misses), (0, 0, 0))
+
+    def test_shared(self):
+        lexer.keyword_cache.clear()
+        list(lexer.tokenize('select foo from bar'))
+        list(lexer.tokenize('select foo from baz'))
+        self.assertEqual(lexer.keyword_cache.misses, 5)
+        self.assertEqual(lexer.keyword_cache.hits, 3)
+
+    def test_independent_calls(self):
+        # A word classified in one call doesn't change other rules later.
+        list(lexer.tokenize('select self'))
+        tokens = list(lexer.tokenize('self.foo'))
+        self.assertEqual(tokens[0], (Name, 'self'))
+
+
+class TestTableCache(object):
+
+    def make_lexer(self, rules=None):
+        attrs = {}
+        if rules is not None:
+            attrs['tokens'] = {'root': rules}
+        return lexer.LexerMeta('CachedLexer', (lexer.Lexer,), attrs)
+
+    def test_roundtrip(self, tmpdir, monkeypatch):
+        monkeypatch.setattr(lexer, 'cache_dir', str(tmpdir))
+        sql = load_file('function_psql2.sql')
+        expected = list(self.make_lexer()().get_tokens(sql))
+        assert tmpdir.join('tests.test_tokenize.CachedLexer.tables').check()
+
+        def fail(*args):
+            raise AssertionError('not cached')
+        monkeypatch.setattr(lexer, '_compile_code', fail)
+        monkeypatch.setattr(lexer, 'first_chars', fail)
+        assert list(self.make_lexer()().get_tokens(sql)) == expected
+
+    def test_invalidated_by_rules(self, tmpdir, monkeypatch):
+        monkeypatch.setattr(lexer, 'cache_dir', str(tmpdir))
+        self.make_lexer()()
+        rules = [(r'\w+', Name), (r'\s+', Whitespace)]
+        cls = self.make_lexer(rules)
+        assert cls.rules_hash() != self.make_lexer().rules_hash()
+        assert list(cls().get_tokens('a b')) == [
+            (Name, u'a'), (Whitespace, u' '), (Name, u'b')]
+        # The cache was replaced.
+        assert len(self.make_lexer(rules)._read_cache(
+            cls._cache_path(), cls.rules_hash())[0]) == 2
+
+    def test_broken_cache(self, tmpdir, monkeypatch):
+        monkeypatch.setattr(lexer, 'cache_dir', str(tmpdir))
+        tmpdir.join('tests.test_tokenize.CachedLexer.tables').write('foo')
+        tokens = list(self.make_lexer()().get_tokens('select 1'))
+        assert tokens[0] == (Keyword.DML, u'select')
+
+    def test_without_code(self, tmpdir, monkeypatch):
+        monkeypatch.setattr(lexer, 'cache_dir', str(tmpdir))
+        sql = load_file('function_psql2.sql')
+        expected = list(self.make_lexer()().get_tokens(sql))
+        tmpdir.join('tests.test_tokenize.CachedLexer.tables').remove()
+        # Regexes are compiled by re.compile() on other interpreters.
+        monkeypatch.setattr(lexer, '_CACHE_CODE', False)
+        cls = self.make_lexer()
+        assert list(cls().get_tokens(sql)) == expected
+        assert cls._code == {}
+        cached = cls._read_cache(cls._cache_path(), cls.rules_hash())
+        assert cached[0] == {} and cached[1]
+        assert list(self.make_lexer()().get_tokens(sql)) == expected
+
+    def test_invalid_code(self):
+        cls = self.make_lexer()
+        key = (r'\s+', cls.flags)
+        cls._code[key] = (cls.flags, [1, 2, 3], 0, {}, [None])
+        assert cls._compile_rule(*key).match(u'  ').end() == 2
+        assert key not in cls._code
+
+    def test_disabled(self, tmpdir, monkeypatch):
+        monkeypatch.setattr(lexer, 'cache_dir', None)
+        self.make_lexer()()
+        self.make_lexer().save_tables()
+        assert tmpdir.listdir() == []
+
+
+class TestColumnar(unittest.TestCase):
+
+    def test_tokenize_columnar(self):
+        sql = load_file('function_psql2.sql')
+        columns = lexer.tokenize_columnar(sql)
+        self.assertEqual(list(columns), list(lexer.tokenize(sql)))
+        self.assertEqual(columns.types.typecode, 'H')
+        self.assertEqual(columns.starts.typecode, 'I')
+        self.assertEqual(columns.starts[1:], columns.ends[:-1])
+        self.assertEqual(columns[0], (Keyword.DDL, u'CREATE OR REPLACE'))
+        self.assertEqual(columns.ttype(1), Whitespace)
+        self.assertTrue(columns.source is sql)
+
+    def test_bytes_and_streams(self):
+        from cStringIO import StringIO
+        sql = u'select \'\xe4\' from foo'
+        columns = lexer.tokenize_columnar(sql.encode('latin1'), 'latin1')
+        self.assertEqual(columns.source, sql)
+        self.assertEqual(list(columns.spans())[2], (String.Single, 7, 10))
+        columns = lexer.tokenize_columnar(StringIO(sql.encode('utf-8')))
+        self.assertEqual(list(columns), list(lexer.tokenize(sql)))
+
+    def test_mapped_file(self):
+        path = os.path.join(FILES_DIR, 'test_cp1251.sql')
+        with lexer.MappedFile(path, 'cp1251') as mapped:
+            columns = mapped.columns()
+            self.assertEqual(list(columns), list(mapped))
+            self.assertTrue(columns.source is mapped.buffer)
+
+
+def test_tokentype_from_id():
+    for ttype in (Token, Keyword.DML, Name.Placeholder):
+        assert from_id(ttype._id) is ttype